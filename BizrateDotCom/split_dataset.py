@@ -1,7 +1,6 @@
 import enum
 import re
 import operator
-import functools
 import time
 import os
 import multiprocessing
@@ -10,6 +9,8 @@ import numpy as np
 import scipy.stats as stats
 from pymongo import MongoClient
 from common import config
+from preprocessing.curated_attributes import masked_ratings, row_statistic, value_range
+from preprocessing.split import assign_bins, write_parquet_partitions, write_partitions
 
 log = config.get_logger(__name__)
 
@@ -67,6 +68,7 @@ class DatasetSplitter(object):
         self.skewnessIntervals = kwargs['skewnessIntervals']
         self.kurtosisIntervals = kwargs['kurtosisIntervals']
         self.rangeIntervals = kwargs['rangeIntervals']
+        self.outputFormat = kwargs.get('outputFormat', 'csv')
         self.isIntervalOK = self._checkIntervals()
         if not self.isIntervalOK:
             DatasetSplitter.log.error('Error: given intervals are invalid.')
@@ -93,10 +95,10 @@ class DatasetSplitter(object):
             DatasetSplitter.log.error('Error: failed to read dataframe.')
 
     def splitByAllIntervals(self):
-        self._splitByIntervals(self.varianceIntervals, 'variance')
-        self._splitByIntervals(self.skewnessIntervals, 'skewness')
-        self._splitByIntervals(self.kurtosisIntervals, 'kurtosis')
-        self._splitByIntervals(self.rangeIntervals, 'range')
+        self._splitByAllIntervals({'variance': self.varianceIntervals,
+                                   'skewness': self.skewnessIntervals,
+                                   'kurtosis': self.kurtosisIntervals,
+                                   'range': self.rangeIntervals})
 
     def _checkIntervals(self) -> bool:
         result = True
@@ -120,31 +122,55 @@ class DatasetSplitter(object):
         return result
 
     def _splitByIntervals(self, splitIntervals: list, splitBy: str):
-        splitValues = self.df[splitBy]
-        splitResults = []  # element is of type (data, lb, up)
-        for interval in splitIntervals:
-            lb = interval.lowerBound
-            ub = interval.upperBound
-            if interval.type == IntervalType.CC:  # interval is a number
-                splitResults.append((self.df[splitValues == lb], lb, ub))
-            elif interval.type == IntervalType.OC:
-                splitResults.append((self.df[(float(lb) < splitValues) & (splitValues <= ub)], lb, ub))
-            elif interval.type == IntervalType.CO:
-                splitResults.append((self.df[(lb <= splitValues) & (splitValues < float(ub))], lb, ub))
-            elif interval.type == IntervalType.OO:
-                splitResults.append((self.df[(float(lb) < splitValues) & (splitValues < float(ub))], lb, ub))
-            else:
-                DatasetSplitter.log.error('Error: unknown interval type. Accepted is {} but given {}.'.format(
-                    [x.name for x in IntervalType], interval.type))
-        nRows = functools.reduce(lambda x, y: x + y, [result[0].shape[0] for result in splitResults])
-        assert nRows == self.df.shape[0], \
-            'Error: nRows in splits [{}] is inconsistent with nRows in dataset [{}].'.format(nRows, self.df.shape[0])
-        for result in splitResults:
-            splitFilename = '{storeName}_split_{splitBy}_{lb}_{ub}.csv'\
-                .format(storeName=self.storeName, splitBy=splitBy, lb=result[1], ub=result[2])
-            DatasetSplitter.log.info('Writing split result to {}, with {} reviews.'
-                                     .format(splitFilename, result[0].shape[0]))
-            result[0].to_csv(self.datasetPath + splitFilename, index=False)
+        self._splitByAllIntervals({splitBy: splitIntervals})
+
+    @staticmethod
+    def _intervalBounds(interval: Interval) -> tuple:
+        lbClosed = interval.type in (IntervalType.CC, IntervalType.CO)
+        ubClosed = interval.type in (IntervalType.CC, IntervalType.OC)
+        return float(interval.lowerBound), float(interval.upperBound), lbClosed, ubClosed
+
+    def _splitByAllIntervals(self, intervalsBy: dict):
+        """
+        Assign every review to its interval of every split field at once, then write all splits in one pass over
+        the dataframe. Splits are written as CSV files, or as one Parquet dataset partitioned by interval of every
+        split field if outputFormat is 'parquet'.
+        """
+
+        bins = np.empty((self.df.shape[0], len(intervalsBy)), dtype=np.int64)
+        splitNames = {}
+        for dim, (splitBy, splitIntervals) in enumerate(intervalsBy.items()):
+            intervals = []
+            for interval in splitIntervals:
+                if isinstance(interval.type, IntervalType):
+                    intervals.append(interval)
+                else:
+                    DatasetSplitter.log.error('Error: unknown interval type. Accepted is {} but given {}.'.format(
+                        [x.name for x in IntervalType], interval.type))
+            bins[:, dim] = assign_bins(self.df[splitBy].to_numpy(), [self._intervalBounds(x) for x in intervals])
+            nRows = int(np.count_nonzero(bins[:, dim] >= 0))
+            assert nRows == self.df.shape[0], \
+                'Error: nRows in splits [{}] is inconsistent with nRows in dataset [{}].'.format(
+                    nRows, self.df.shape[0])
+            splitNames[splitBy] = ['{}_{}'.format(x.lowerBound, x.upperBound) for x in intervals]
+
+        if self.outputFormat == 'parquet':
+            path = '{}{}_split.parquet'.format(self.datasetPath, self.storeName)
+            partitions = {splitBy + 'Interval': np.array(names, dtype=object)[bins[:, dim]]
+                          for dim, (splitBy, names) in enumerate(splitNames.items())}
+            DatasetSplitter.log.info('Writing split results to {}.'.format(path))
+            write_parquet_partitions(self.df, partitions, path, include_index=False)
+            return
+
+        outputs = {}
+        for dim, (splitBy, names) in enumerate(splitNames.items()):
+            for i, name in enumerate(names):
+                splitFilename = '{storeName}_split_{splitBy}_{name}.csv'\
+                    .format(storeName=self.storeName, splitBy=splitBy, name=name)
+                DatasetSplitter.log.info('Writing split result to {}, with {} reviews.'
+                                         .format(splitFilename, np.count_nonzero(bins[:, dim] == i)))
+                outputs[(dim, i)] = [(self.datasetPath + splitFilename, self.df.columns.tolist())]
+        write_partitions(self.df, bins, outputs, include_index=False)
 
 
 def splitDataFileHelper(filePath, filename, storeName):
@@ -286,20 +312,12 @@ if __name__ == '__main__':
         log.info('Finished building dataframe. Shape of dataframe is {}.\n'.format(df.shape))
 
         log.info('Start computing variance, skewness, kurtosis and range for each review.')
-        variance, skewness, kurtosis, range = [], [], [], []
-        for index, row in df.iterrows():
-            scores = [row[prepurchaseScoreNames[0]], row[prepurchaseScoreNames[1]], row[prepurchaseScoreNames[2]],
-                      row[prepurchaseScoreNames[3]], row[prepurchaseScoreNames[4]], row[prepurchaseScoreNames[5]],
-                      row[prepurchaseScoreNames[6]], row[prepurchaseScoreNames[7]], row[prepurchaseScoreNames[8]]]
-            scores = [x for x in scores if x != -1]
-            variance.append(np.var(scores))
-            skewness.append(stats.skew(np.array(scores)))
-            kurtosis.append(stats.kurtosis(scores))
-            range.append(max(scores) - min(scores))
-        df['variance'] = variance
-        df['skewness'] = skewness
-        df['kurtosis'] = kurtosis
-        df['range'] = range
+        # missing prepurchase scores are -1 and are masked out of every statistic
+        scores = masked_ratings(df, prepurchaseScoreNames, missing=-1)
+        df['variance'] = row_statistic(scores, np.var)
+        df['skewness'] = row_statistic(scores, stats.skew)
+        df['kurtosis'] = row_statistic(scores, stats.kurtosis)
+        df['range'] = row_statistic(scores, value_range)
         log.info('Curated fields variance, skewness, kurtosis and range are derived. '
                  'New shape of dataframe is {}.\n'.format(df.shape))
 
@@ -0,0 +1,333 @@
+import time
+import heapq
+import pickle
+import logging
+from typing import Optional
+from urllib.parse import urlparse
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler, Scheduler
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_fingerprint, request_from_dict
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore(object):
+    """
+    Store shared by the crawler processes of a distributed crawl: priority queues of serialized requests, sets of
+    fingerprints, flags and per-domain politeness slots. Stores are created by from_settings(settings) and are
+    selected by setting DISTRIBUTED_STORE.
+    """
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def push(self, key: str, priority: int, data: bytes):
+        """
+        Push data to queue. Data of higher priority is popped first, and first pushed first within a priority.
+        """
+
+        raise NotImplementedError
+
+    def pop(self, key: str) -> Optional[bytes]:
+        """
+        Pop data of highest priority from queue. None if queue is empty.
+        """
+
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def add(self, key: str, member: str) -> bool:
+        """
+        Add member to set.
+        :return: whether member was not in set.
+        """
+
+        raise NotImplementedError
+
+    def claim(self, key: str) -> bool:
+        """
+        Set flag.
+        :return: whether flag was not set, i.e. the caller is the first one to claim it.
+        """
+
+        raise NotImplementedError
+
+    def reserve(self, key: str, interval: float) -> float:
+        """
+        Reserve a slot that is free at most once per interval, e.g. a request to a domain.
+        :return: 0 if slot is reserved, otherwise # of seconds until the slot is free.
+        """
+
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStore(SharedStore):
+    """
+    Store in memory of this process. It shares nothing with other processes, and is meant for trying the distributed
+    mode with a single process.
+    """
+
+    def __init__(self):
+        self.queues = {}  # {key: heap of (-priority, sequence, data)}
+        self.sets = {}
+        self.flags = set()
+        self.slots = {}  # {key: timestamp when slot is free}
+        self.sequence = 0
+
+    def push(self, key: str, priority: int, data: bytes):
+        self.sequence += 1
+        heapq.heappush(self.queues.setdefault(key, []), (-priority, self.sequence, data))
+
+    def pop(self, key: str) -> Optional[bytes]:
+        queue = self.queues.get(key, None)
+        if not queue:
+            return None
+        return heapq.heappop(queue)[2]
+
+    def size(self, key: str) -> int:
+        return len(self.queues.get(key, []))
+
+    def add(self, key: str, member: str) -> bool:
+        members = self.sets.setdefault(key, set())
+        if member in members:
+            return False
+        members.add(member)
+        return True
+
+    def claim(self, key: str) -> bool:
+        if key in self.flags:
+            return False
+        self.flags.add(key)
+        return True
+
+    def reserve(self, key: str, interval: float) -> float:
+        now = time.time()
+        free = self.slots.get(key, 0.0)
+        if now < free:
+            return free - now
+        self.slots[key] = now + interval
+        return 0.0
+
+
+class RedisStore(SharedStore):
+    """
+    Store in Redis at REDIS_URL, e.g. the one of dev/docker/redis. Queues are sorted sets scored by priority and
+    sequence, sets are Redis sets, and flags and politeness slots are keys set only if they do not exist, the latter
+    expiring after interval.
+    """
+
+    SEQUENCE_BITS = 32  # sequences within a priority, scores stay exact in double precision
+
+    def __init__(self, url: str):
+        import redis  # only needed in distributed mode
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get('REDIS_URL', 'redis://localhost:6379/0'))
+
+    def push(self, key: str, priority: int, data: bytes):
+        sequence = self.client.incr(key + ':sequence') % (1 << self.SEQUENCE_BITS)
+        score = -priority * (1 << self.SEQUENCE_BITS) + sequence
+        # data is prefixed with sequence, so the same request can be queued twice when it is not filtered
+        self.client.zadd(key, {b'%d:' % sequence + data: score})
+
+    def pop(self, key: str) -> Optional[bytes]:
+        popped = self.client.zpopmin(key)
+        if len(popped) == 0:
+            return None
+        return popped[0][0].split(b':', 1)[1]
+
+    def size(self, key: str) -> int:
+        return self.client.zcard(key)
+
+    def add(self, key: str, member: str) -> bool:
+        return self.client.sadd(key, member) == 1
+
+    def claim(self, key: str) -> bool:
+        return bool(self.client.set(key, 1, nx=True))
+
+    def reserve(self, key: str, interval: float) -> float:
+        if self.client.set(key, 1, nx=True, px=max(1, int(interval * 1000))):
+            return 0.0
+        ttl = self.client.pttl(key)
+        return ttl / 1000.0 if ttl > 0 else 0.001  # slot expired meanwhile, try again right away
+
+    def close(self):
+        self.client.close()
+
+
+def _store_from_settings(settings) -> SharedStore:
+    return load_object(settings.get('DISTRIBUTED_STORE', 'consumerReviewsScraper.distributed.RedisStore')) \
+        .from_settings(settings)
+
+
+def _key_prefix(settings, spider) -> str:
+    return settings.get('DISTRIBUTED_KEY_PREFIX', None) or spider.name
+
+
+class DistributedScheduler(BaseScheduler):
+    """
+    Scheduler of a distributed crawl, enabled by setting DISTRIBUTED, e.g. `scrapy crawl <spider> -s DISTRIBUTED=1`.
+    Otherwise the default scheduler of Scrapy is used. Crawler processes on one or more machines share a queue of
+    requests and a set of fingerprints in a SharedStore, under keys "<DISTRIBUTED_KEY_PREFIX>:requests" and
+    "<DISTRIBUTED_KEY_PREFIX>:fingerprints" (prefix is spider name by default).
+
+    Requests with meta `local` set stay in this process, e.g. pages whose callbacks need state of the process that
+    planned them. They are handed out before shared requests. Requests of a process that stops are lost, and a crawl
+    is started over by deleting the keys of its prefix.
+
+    A process does not close while the shared queue has requests, nor within DISTRIBUTED_IDLE_TIMEOUT seconds of its
+    last request, as other processes may still push requests.
+
+    Enable it in spider settings:
+        'SCHEDULER': 'consumerReviewsScraper.distributed.DistributedScheduler',
+        'SPIDER_MIDDLEWARES': {'consumerReviewsScraper.distributed.DistributedSeedMiddleware': 5},
+        'DOWNLOADER_MIDDLEWARES': {'consumerReviewsScraper.distributed.SharedPolitenessMiddleware': 450},
+    """
+
+    def __init__(self, crawler, store: SharedStore):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.store = store
+        self.idle_timeout = crawler.settings.getfloat('DISTRIBUTED_IDLE_TIMEOUT', 30)
+        self.local = []  # heap of (-priority, sequence, request)
+        self.sequence = 0
+        self.last_active = time.time()
+        self.spider = None
+        self.queue_key = None
+        self.fingerprint_key = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('DISTRIBUTED'):
+            return Scheduler.from_crawler(crawler)
+        scheduler = cls(crawler, _store_from_settings(crawler.settings))
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        prefix = _key_prefix(self.crawler.settings, spider)
+        self.queue_key = prefix + ':requests'
+        self.fingerprint_key = prefix + ':fingerprints'
+        logger.info('Joined distributed crawl {}: {} requests in shared queue'
+                    .format(prefix, self.store.size(self.queue_key)))
+
+    def close(self, reason):
+        if len(self.local) > 0:
+            logger.warning('{} local requests are dropped'.format(len(self.local)))
+        self.store.close()
+
+    def has_pending_requests(self) -> bool:
+        return len(self.local) > 0 or self.store.size(self.queue_key) > 0
+
+    def enqueue_request(self, request) -> bool:
+        self.last_active = time.time()
+        if request.meta.get('local', False):
+            self.sequence += 1
+            heapq.heappush(self.local, (-request.priority, self.sequence, request))
+            self.stats.inc_value('scheduler/enqueued/local', spider=self.spider)
+            self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+            return True
+
+        if not request.dont_filter and not self.store.add(self.fingerprint_key, request_fingerprint(request)):
+            self.stats.inc_value('distributed/filtered', spider=self.spider)
+            return False
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        self.store.push(self.queue_key, request.priority, data)
+        self.stats.inc_value('scheduler/enqueued/shared', spider=self.spider)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        return True
+
+    def next_request(self):
+        if len(self.local) > 0:
+            self.last_active = time.time()
+            self.stats.inc_value('scheduler/dequeued/local', spider=self.spider)
+            self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+            return heapq.heappop(self.local)[2]
+
+        data = self.store.pop(self.queue_key)
+        if data is None:
+            return None
+        self.last_active = time.time()
+        self.stats.inc_value('scheduler/dequeued/shared', spider=self.spider)
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return request_from_dict(pickle.loads(data), spider=self.spider)
+
+    def spider_idle(self, spider):
+        if time.time() - self.last_active < self.idle_timeout:
+            raise DontCloseSpider
+
+
+class DistributedSeedMiddleware(object):
+    """
+    Spider middleware letting only the first process of a distributed crawl push start requests, so seeds such as
+    the hotels of a task file are crawled once. Other processes take requests from the shared queue. The flag is key
+    "<DISTRIBUTED_KEY_PREFIX>:seeded".
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.store = _store_from_settings(settings)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('DISTRIBUTED'):
+            raise NotConfigured
+        mw = cls(crawler.settings)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def process_start_requests(self, start_requests, spider):
+        if not self.store.claim(_key_prefix(self.settings, spider) + ':seeded'):
+            logger.info('Crawl is seeded by another process, start requests are skipped')
+            return
+        for r in start_requests:
+            yield r
+
+    def spider_closed(self, spider):
+        self.store.close()
+
+
+class SharedPolitenessMiddleware(object):
+    """
+    Downloader middleware spacing requests to a domain by at least DISTRIBUTED_DOMAIN_DELAY seconds across all
+    processes of a distributed crawl. A request waits until the slot of its domain is free. As this bounds the
+    total rate to a domain, DOWNLOAD_DELAY of each process can be 0.
+    """
+
+    def __init__(self, crawler, delay: float):
+        self.stats = crawler.stats
+        self.delay = delay
+        self.store = _store_from_settings(crawler.settings)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        delay = crawler.settings.getfloat('DISTRIBUTED_DOMAIN_DELAY', 0)
+        if not crawler.settings.getbool('DISTRIBUTED') or delay <= 0:
+            raise NotConfigured
+        mw = cls(crawler, delay)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def process_request(self, request, spider):
+        wait = self.store.reserve('politeness:' + urlparse(request.url).netloc, self.delay)
+        if wait <= 0:
+            return None
+        self.stats.inc_value('distributed/politeness/delayed', spider=spider)
+        return deferLater(reactor, wait, self.process_request, request, spider)
+
+    def spider_closed(self, spider):
+        self.store.close()
@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+from collections import OrderedDict
+from typing import Optional
+
+
+class EntityCache(object):
+    """
+    Recently fetched entities, e.g. user profiles, as {(kind, key): fetched timestamp}. Lookups hit an in-process LRU
+    first and a SQLite file next, so entities fetched in earlier runs are known without asking the database of items.
+    An entity is fresh for `ttl` seconds after it was fetched, and is fetched again once it is stale.
+    """
+
+    def __init__(self, path: str, ttl: float, capacity=100000):
+        """
+        :param path: path of SQLite file.
+        :param ttl: # of seconds an entity stays fresh after it was fetched.
+        :param capacity: max # of entities in LRU.
+        """
+
+        dir_path = os.path.dirname(path)
+        if len(dir_path) > 0:
+            os.makedirs(dir_path, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.capacity = capacity
+        self.lru = OrderedDict()  # {(kind, key): fetched or claimed timestamp}
+        self.conn = sqlite3.connect(path, isolation_level=None)  # autocommit
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entity ('
+                          'kind TEXT NOT NULL, '
+                          'key TEXT NOT NULL, '
+                          'fetched REAL NOT NULL, '
+                          'PRIMARY KEY (kind, key))')
+
+    def claim(self, kind: str, key) -> bool:
+        """
+        Whether entity should be fetched, i.e. it is neither fresh nor claimed in this run. A claimed entity is not
+        claimed again in this run until it is stale, even if it was not fetched.
+        """
+
+        now = time.time()
+        fetched = self._get(kind, str(key))
+        if fetched is not None and now - fetched < self.ttl:
+            return False
+        self._put(kind, str(key), now)
+        return True
+
+    def fetched(self, kind: str, key):
+        """
+        Record entity fetched now.
+        """
+
+        now = time.time()
+        self._put(kind, str(key), now)
+        self.conn.execute('INSERT OR REPLACE INTO entity (kind, key, fetched) VALUES (?, ?, ?)', (kind, str(key), now))
+
+    def close(self):
+        self.conn.close()
+
+    def _get(self, kind: str, key: str) -> Optional[float]:
+        fetched = self.lru.get((kind, key), None)
+        if fetched is not None:
+            self.lru.move_to_end((kind, key))
+            return fetched
+        row = self.conn.execute('SELECT fetched FROM entity WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        if row is None:
+            return None
+        self._put(kind, key, row[0])
+        return row[0]
+
+    def _put(self, kind: str, key: str, fetched: float):
+        self.lru[(kind, key)] = fetched
+        self.lru.move_to_end((kind, key))
+        if len(self.lru) > self.capacity:
+            self.lru.popitem(last=False)
+
+
+class EntityCacheMixin(object):
+    """
+    Entity cache of spiders, in "<ENTITY_CACHE_DIR>/<spider name>.sqlite". Entities are fresh for ENTITY_CACHE_TTL
+    seconds (7 days by default), and at most ENTITY_CACHE_SIZE of them are kept in memory.
+    """
+
+    _entity_cache = None
+
+    @property
+    def entity_cache(self) -> EntityCache:
+        if self._entity_cache is None:
+            path = os.sep.join([self.settings.get('ENTITY_CACHE_DIR', 'entity_cache'), '{}.sqlite'.format(self.name)])
+            self._entity_cache = EntityCache(path, ttl=self.settings.getfloat('ENTITY_CACHE_TTL', 3600 * 24 * 7),
+                                             capacity=self.settings.getint('ENTITY_CACHE_SIZE', 100000))
+        return self._entity_cache
+
+    def should_fetch(self, kind: str, key) -> bool:
+        """
+        Whether to request entity, i.e. it is stale. Requests of fresh entities are counted in crawl stats as
+        "entity_cache/<kind>/suppressed".
+        """
+
+        if self.entity_cache.claim(kind, key):
+            return True
+        self.crawler.stats.inc_value('entity_cache/{}/suppressed'.format(kind), spider=self)
+        return False
+
+    def closed(self, reason):
+        if self._entity_cache is not None:
+            self._entity_cache.close()
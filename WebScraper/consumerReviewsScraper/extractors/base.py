@@ -0,0 +1,166 @@
+import re
+from datetime import datetime
+from lxml import etree
+from typing import Callable, Dict, Iterator, List, Optional
+
+_compiled = {}  # {expression: etree.XPath}, shared by all extractors
+
+
+def compile_xpath(expression: str) -> etree.XPath:
+    """
+    Compiled XPath of expression, compiled once per process. Evaluating it on an lxml element returns strings,
+    numbers, booleans or a list of elements and plain strings.
+    """
+
+    xpath = _compiled.get(expression, None)
+    if xpath is None:
+        xpath = _compiled[expression] = etree.XPath(expression, smart_strings=False)
+    return xpath
+
+
+def first(xpath: etree.XPath, node, default=None):
+    """
+    First result of a compiled XPath on node, default if there is none.
+    """
+
+    values = xpath(node)
+    return values[0] if len(values) > 0 else default
+
+
+def node_of(obj):
+    """
+    lxml element of a response, a Scrapy selector or an element itself.
+    """
+
+    if hasattr(obj, 'selector'):
+        obj = obj.selector
+    return getattr(obj, 'root', obj)
+
+
+class Field(object):
+    """
+    A field evaluated on a block of a page by a compiled XPath, and converted to its type.
+    """
+
+    def __init__(self, expression: str, convert: Callable = None, many=False, default=None):
+        """
+        :param expression: XPath relative to block.
+        :param convert: converter of value. It is not called for missing values.
+        :param many: whether value is the list of all results, otherwise the first result.
+        :param default: value of a missing field.
+        """
+
+        self.expression = expression
+        self.xpath = compile_xpath(expression)
+        self.convert = convert
+        self.many = many
+        self.default = default
+
+    def extract(self, node):
+        value = self.xpath(node)
+        if isinstance(value, list) and not self.many:
+            value = value[0] if len(value) > 0 else None
+        if value is None:
+            return self.default
+        value = self.convert(value) if self.convert is not None else value
+        return value if value is not None else self.default
+
+
+class Extractor(object):
+    """
+    Declarative extraction of a site: blocks of a page, e.g. reviews, and a map of field to Field evaluated per block.
+    All XPaths are compiled when the extractor is created.
+    """
+
+    def __init__(self, fields: Dict[str, Field], block: str = None):
+        """
+        :param fields: {field name: Field}.
+        :param block: XPath of blocks from the page root. None if fields are evaluated on the page itself.
+        """
+
+        self.fields = fields
+        self.block = compile_xpath(block) if block is not None else None
+
+    def blocks(self, obj) -> List:
+        """
+        Blocks of a page, as lxml elements.
+        """
+
+        return self.block(node_of(obj))
+
+    def extract(self, obj) -> dict:
+        """
+        Fields of one block, or of a page if extractor has no blocks.
+        """
+
+        node = node_of(obj)
+        return {name: field.extract(node) for name, field in self.fields.items()}
+
+    def extract_all(self, obj) -> Iterator[dict]:
+        """
+        Fields of every block of a page.
+        """
+
+        for node in self.blocks(obj):
+            yield {name: field.extract(node) for name, field in self.fields.items()}
+
+
+# converters
+
+def strip(value: str) -> str:
+    return value.strip()
+
+
+def to_int(value: str) -> Optional[int]:
+    value = value.strip().replace(',', '')
+    return int(value) if len(value) > 0 else None
+
+
+def to_float(value: str) -> Optional[float]:
+    value = value.strip().replace(',', '')
+    return float(value) if len(value) > 0 else None
+
+
+def joined(separator='') -> Callable[[List[str]], str]:
+    """
+    Converter joining all text results and stripping the joined text.
+    """
+
+    return lambda values: separator.join(values).strip()
+
+
+def matched(pattern: str, convert: Callable = None) -> Callable:
+    """
+    Converter to the first group of the first match of pattern, in a text or in any of a list of texts. None if
+    nothing matches.
+    """
+
+    regex = re.compile(pattern)
+
+    def convert_match(value):
+        for text in (value if isinstance(value, list) else [value]):
+            m = regex.search(text)
+            if m is not None:
+                return convert(m.group(1)) if convert is not None else m.group(1)
+        return None
+
+    return convert_match
+
+
+def to_datetime(format: str) -> Callable[[str], datetime]:
+    return lambda value: datetime.strptime(value.strip(), format)
+
+
+def chain(*converters: Callable) -> Callable:
+    """
+    Converter applying converters in order. It stops at the first None.
+    """
+
+    def convert_chain(value):
+        for convert in converters:
+            if value is None:
+                return None
+            value = convert(value)
+        return value
+
+    return convert_chain
@@ -0,0 +1,11 @@
+from .base import Extractor, Field, strip, to_int
+
+REPLY = Extractor(block="//ul[@class='reply-list']/li", fields={
+    'id': Field('@data-replyid', convert=to_int),
+    'author_id': Field("div[@class='item-r']/div[@class='l1 user-info']/a/@data-uid", convert=to_int),
+    # e.g. '2019-04-12 12:23:45' or '今天 12:23:45'
+    'reply_time': Field("div[@class='item-r']/div[@class='l1 user-info']/span[@class='reply-time']/text()",
+                        default=''),
+    'content': Field("div[@class='item-r']/div[@class='l2']/div/text()", convert=strip),
+    'num_likes': Field("div[@class='item-r']/div[@class='l3']/a[2]/text()", convert=to_int),
+})
@@ -0,0 +1,14 @@
+from .base import Extractor, Field, chain, joined, matched, to_datetime, to_int
+
+REVIEW = Extractor(block="//div[contains(@class, 'kuchikomi--')]/div[@class='box']", fields={
+    'attitude': Field("div[@class='subject']/div[@class='label']/text()"),
+    'review_id': Field("div[@class='comment']/div[1]/a[1]/@href",
+                       convert=matched(r'/company/\d+/kuchikomi/(\d+).*', int)),
+    'category_id': Field("div[@class='comment']/div[1]/@class", convert=matched(r'title title--(\d+).*', int)),
+    'content': Field("div[@class='comment']/text()", convert=joined(), many=True),
+    'status': Field("div[@class='comment']/div[@class='status']/a/text()"),
+    # publish date is missing from some reviews
+    'publish_date': Field("div[@class='comment']/div[@class='status']/text()", many=True, default='',
+                          convert=chain(joined(), matched(r'口コミ投稿日：(.*).*'), to_datetime('%Y年%m月%d日'))),
+    'num_helpful': Field("div[@class='comment']/span/span/span/text()", convert=to_int),
+})
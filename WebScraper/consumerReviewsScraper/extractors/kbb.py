@@ -0,0 +1,35 @@
+from typing import List
+from .base import Extractor, Field, compile_xpath, matched, strip, to_int
+
+NOT_RATED = 'Not Rated'
+RATINGS = ['overall', 'value', 'reliability', 'quality', 'performance', 'styling', 'comfort']
+
+
+def _ratings(values: List[str]) -> List[int]:
+    # e.g. '4/5' or 'Not Rated'
+    return [0 if v.strip() == NOT_RATED else int(v.strip().split('/')[0]) for v in values]
+
+
+PAGE = Extractor({
+    'ymm': Field("//h1/span[@class='vehicle-ymm']/text()"),
+    'next_page': Field("//div[@class='pages']/a[@class='pagerLink pager-next']/@href"),
+})
+
+# a review section has divs of header, recommendation (optional), content and footer
+REVIEW = Extractor(block="//div[@class='review-section']", fields={
+    'num_divs': Field('count(div)', convert=int),
+    'title': Field('div[1]/h2/text()'),
+    'author': Field("div[1]/p[@class='with-sub']/span/text()"),
+    'date': Field('div[1]/meta/@content'),
+    'mileage': Field("div[1]/p[@class='duration']/strong/text()",
+                     convert=matched(r'.*approximate mileage is ([\d,]+)', to_int), default=-1),
+    'ratings': Field("div[1]/div[@class='score-card']/dl/dd/span/text()", convert=_ratings, many=True),
+    'recommend_paragraphs': Field('div[2][count(../div) = 4]/p', many=True),
+    'content': Field("div[last() - 1]/p[@class='review-text']/text()", convert=strip),
+    'helpful': Field("div[last() - 1]/p[@class='helpful-count']/strong/text()", convert=lambda v: [int(x) for x in v],
+                     many=True),
+})
+
+# evaluated on a paragraph of recommendation
+TEXT = compile_xpath('text()')
+LABEL = compile_xpath('span/strong/text()')
@@ -0,0 +1,21 @@
+from datetime import datetime
+from .base import Extractor, Field, chain, joined, matched, strip, to_datetime, to_int
+
+THREAD = Extractor(block="//dl[@class='list_dl']", fields={
+    'url': Field("dt/p[@class='thenomal']/a[@class='titlink']/@href"),
+    'num_replies': Field("dd[@class='cli_dd']/span[1]/text()", convert=to_int),
+    'num_views': Field("dd[@class='cli_dd']/span[2]/text()", convert=to_int),
+})
+
+POST = Extractor(block="//div[@class='main item']", fields={
+    'user_url': Field("descendant::div[@class='userside']/div[@class='user_info']/p[@class='name']/a/@href"),
+    'coin': Field("descendant::div[@class='userside']/descendant::li[@class='akb']/em/text()", convert=strip),
+    'register_date': Field("descendant::div[@class='userside']/descendant::p[@class='ursr_info']/span/text()",
+                           convert=chain(to_datetime('%Y-%m-%d'), datetime.date)),
+    'pid': Field('a/@name', convert=matched(r'pid(\d+)', int)),
+    # publish time in Beijing time
+    'publish': Field("descendant::div[@class='mainboxTop']/p/text()", many=True,
+                     convert=matched(r'.*发表于\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\s*', to_datetime('%Y-%m-%d %H:%M'))),
+    'content': Field("descendant::div[@class='t_msgfont1']/descendant::*/text()", convert=joined(' '), many=True),
+    'is_flag': Field("boolean(descendant::span[@class='t_title1'])"),
+})
@@ -0,0 +1,200 @@
+import os
+import pickle
+import logging
+import sqlite3
+from typing import Optional, Tuple
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.http import Request
+from scrapy.utils.request import request_fingerprint, request_from_dict
+
+PENDING = 0
+IN_FLIGHT = 1
+DONE = 2
+
+# signal sent by FrontierMiddleware when all output of a request's callback has been handed to engine
+frontier_request_done = object()
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteFrontier(object):
+    """
+    Requests of a crawl in a SQLite file, as (fingerprint, priority, state, serialized request).
+    Every change is committed right away, so the file survives an interrupted crawl. Requests in flight when the
+    crawl stopped are pending again when the file is reopened.
+    """
+
+    def __init__(self, path: str):
+        dir_path = os.path.dirname(path)
+        if len(dir_path) > 0:
+            os.makedirs(dir_path, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)  # autocommit
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS frontier ('
+                          'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                          'fingerprint TEXT NOT NULL, '
+                          'priority INTEGER NOT NULL, '
+                          'state INTEGER NOT NULL, '
+                          'request BLOB)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx__frontier__fingerprint ON frontier (fingerprint)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx__frontier__state_priority '
+                          'ON frontier (state, priority DESC, id)')
+
+        self.recovered = self.conn.execute('UPDATE frontier SET state = ? WHERE state = ?',
+                                           (PENDING, IN_FLIGHT)).rowcount
+        self.pending = self.count(PENDING)
+
+    def count(self, state: int) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM frontier WHERE state = ?', (state,)).fetchone()[0]
+
+    def seen(self, fingerprint: str) -> bool:
+        """
+        Whether a request of fingerprint was ever pushed, pending or not.
+        """
+
+        return self.conn.execute('SELECT 1 FROM frontier WHERE fingerprint = ? LIMIT 1',
+                                 (fingerprint,)).fetchone() is not None
+
+    def fingerprint(self, frontier_id: int) -> Optional[str]:
+        row = self.conn.execute('SELECT fingerprint FROM frontier WHERE id = ?', (frontier_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def push(self, fingerprint: str, priority: int, data: bytes) -> int:
+        cursor = self.conn.execute('INSERT INTO frontier (fingerprint, priority, state, request) VALUES (?, ?, ?, ?)',
+                                   (fingerprint, priority, PENDING, data))
+        self.pending += 1
+        return cursor.lastrowid
+
+    def requeue(self, frontier_id: int, priority: int, data: bytes):
+        """
+        Make a popped request pending again as another request of the same fingerprint, e.g. its retry.
+        """
+
+        self.conn.execute('UPDATE frontier SET priority = ?, state = ?, request = ? WHERE id = ?',
+                          (priority, PENDING, data, frontier_id))
+        self.pending += 1
+
+    def pop(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Mark the pending request of highest priority, first pushed first, as in flight.
+        :return: tuple of (ID, serialized request). None if no request is pending.
+        """
+
+        row = self.conn.execute('SELECT id, request FROM frontier WHERE state = ? ORDER BY priority DESC, id LIMIT 1',
+                                (PENDING,)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute('UPDATE frontier SET state = ? WHERE id = ?', (IN_FLIGHT, row[0]))
+        self.pending -= 1
+        return row[0], row[1]
+
+    def done(self, frontier_id: int):
+        # serialized request is not needed any more, fingerprint is kept for de-duplication
+        self.conn.execute('UPDATE frontier SET state = ?, request = NULL WHERE id = ?', (DONE, frontier_id))
+
+    def close(self):
+        self.conn.close()
+
+
+class FrontierScheduler(BaseScheduler):
+    """
+    Scheduler keeping pending requests in a SqliteFrontier file instead of memory, so a restarted crawl resumes where
+    it stopped. Requests are de-duplicated by fingerprint against all requests of the file, so pages done in earlier
+    runs are not requested again. A request is done when FrontierMiddleware has seen all output of its callback;
+    requests that failed or were in flight when the crawl stopped are requested again in the next run. A retry of a
+    request keeps its frontier row, and a redirect marks it done once the redirected request is in frontier.
+
+    Enable it in spider settings:
+        'SCHEDULER': 'consumerReviewsScraper.frontier.FrontierScheduler',
+        'SPIDER_MIDDLEWARES': {'consumerReviewsScraper.frontier.FrontierMiddleware': 10},
+    The file is "<FRONTIER_DIR>/<spider name>.sqlite". Delete it to start the crawl over.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.frontier_dir = crawler.settings.get('FRONTIER_DIR', 'frontier')
+        self.frontier = None
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = cls(crawler)
+        crawler.signals.connect(scheduler.request_done, signal=frontier_request_done)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.frontier = SqliteFrontier(os.sep.join([self.frontier_dir, '{}.sqlite'.format(spider.name)]))
+        logger.info('Opened frontier {}: {} pending requests, {} of them were in flight when last crawl stopped'
+                    .format(self.frontier.path, self.frontier.pending, self.frontier.recovered))
+
+    def close(self, reason):
+        logger.info('Closed frontier {}: {} pending requests'.format(self.frontier.path, self.frontier.pending))
+        self.frontier.close()
+
+    def has_pending_requests(self) -> bool:
+        return self.frontier.pending > 0
+
+    def enqueue_request(self, request) -> bool:
+        fingerprint = request_fingerprint(request)
+        # a request with frontier ID is a retry or redirect of a popped request, FrontierMiddleware drops the ID from
+        # requests of callbacks
+        frontier_id = request.meta.get('frontier_id', None)
+        retried = frontier_id is not None and self.frontier.fingerprint(frontier_id) == fingerprint
+        if not request.dont_filter and not retried and self.frontier.seen(fingerprint):
+            if frontier_id is not None:
+                self.frontier.done(frontier_id)  # redirected to a page that is already in frontier
+            self.stats.inc_value('frontier/filtered', spider=self.spider)
+            return False
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        if retried:
+            self.frontier.requeue(frontier_id, request.priority, data)
+            self.stats.inc_value('frontier/requeued', spider=self.spider)
+        else:
+            self.frontier.push(fingerprint, request.priority, data)
+            if frontier_id is not None:
+                self.frontier.done(frontier_id)  # redirected, the redirected request takes over
+        self.stats.inc_value('scheduler/enqueued/disk', spider=self.spider)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        return True
+
+    def next_request(self):
+        popped = self.frontier.pop()
+        if popped is None:
+            return None
+        frontier_id, data = popped
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta['frontier_id'] = frontier_id
+        self.stats.inc_value('scheduler/dequeued/disk', spider=self.spider)
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return request
+
+    def request_done(self, frontier_id: int):
+        self.frontier.done(frontier_id)
+
+
+class FrontierMiddleware(object):
+    """
+    Spider middleware marking a request done in frontier once all requests and items returned by its callback have
+    been handed to engine, i.e. follow-up requests are already in frontier. Follow-up requests do not carry the
+    frontier ID of the response, even if their meta is copied from it.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_spider_output(self, response, result, spider):
+        frontier_id = response.meta.get('frontier_id', None)
+        for r in result:
+            if isinstance(r, Request):
+                r.meta.pop('frontier_id', None)
+            yield r
+        if frontier_id is not None:
+            self.crawler.signals.send_catch_log(frontier_request_done, frontier_id=frontier_id)
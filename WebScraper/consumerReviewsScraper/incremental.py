@@ -0,0 +1,215 @@
+import logging
+from datetime import date, datetime
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+from typing import Callable, List, Optional, Tuple
+from WebScraper.consumerReviewsScraper.models.crawl_watermark import CrawlWatermark
+from WebScraper.consumerReviewsScraper.models.main import db_connect, create_crawl_watermark_table
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None  # unknown format, review is compared by ID only
+
+
+class WatermarkStore(object):
+    """
+    Crawl watermarks of one spider, i.e. newest publish datetime and review ID crawled per entity.
+
+    A review is known if it is the newest review of watermark or was published before it. If review IDs increase
+    with publishing, a review is also known if its ID is not greater than the newest review ID.
+    Reviews seen during a crawl advance the watermark of an entity only when commit() is called after pagination of
+    the entity stopped, so an interrupted crawl never skips older pages in the next run.
+
+    Spiders that observe reviews in requests chained from listing pages, e.g. review detail pages, register every
+    such request with expect() and settle it with settle(), and call stop() instead of commit() when pagination
+    stopped. Watermark is committed once all expected requests are settled, and is not advanced if any of them
+    failed.
+    """
+
+    def __init__(self, spider: str, session, ordered_ids=False,
+                 fallback: Callable[[object, str], Optional[Tuple[datetime, str]]] = None):
+        """
+        :param spider: spider name.
+        :param session: Sqlalchemy session.
+        :param ordered_ids: whether review IDs are integers increasing with publishing.
+        :param fallback: function of (session, entity) returning newest review already stored as (publish datetime,
+            review ID), used for entities without watermark. None if there is no such function.
+        """
+
+        self.spider = spider
+        self.session = session
+        self.ordered_ids = ordered_ids
+        self.fallback = fallback
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.marks = {
+            row.entity: (row.newest_publish_datetime, row.newest_review_id)
+            for row in session.query(CrawlWatermark).filter(CrawlWatermark.spider == spider)
+        }
+        self.newest = {}  # {entity: [publish datetime, review ID]} of newest review seen in this crawl
+        self.pending = {}  # {entity: # of expected requests not settled yet}
+        self.failed = set()  # entities with a failed expected request
+        self.stopped = set()  # entities whose pagination stopped while requests are pending
+
+    def get(self, entity: str) -> Tuple[Optional[datetime], Optional[str]]:
+        """
+        Watermark of entity as (newest publish datetime, newest review ID). Both are None if entity is never crawled.
+        """
+
+        if entity not in self.marks:
+            mark = self.fallback(self.session, entity) if self.fallback is not None else None
+            if mark is not None:
+                mark = (_as_datetime(mark[0]), str(mark[1]) if mark[1] is not None else None)
+            self.marks[entity] = mark if mark is not None else (None, None)
+        return self.marks[entity]
+
+    def is_known(self, entity: str, review_id=None, publish_datetime=None) -> bool:
+        newest_datetime, newest_id = self.get(entity)
+        if review_id is not None and newest_id is not None:
+            if str(review_id) == newest_id:
+                return True
+            if self.ordered_ids and int(review_id) <= int(newest_id):
+                return True
+        if publish_datetime is not None and newest_datetime is not None:
+            return _as_datetime(publish_datetime) < newest_datetime
+        return False
+
+    def all_known(self, entity: str, reviews: List[Tuple[object, object]]) -> bool:
+        """
+        Whether a page of (review ID, publish datetime) has reviews and all of them are known, i.e. pagination of
+        entity can stop.
+        """
+
+        return len(reviews) > 0 and all(self.is_known(entity, review_id, dt) for review_id, dt in reviews)
+
+    def observe(self, entity: str, review_id=None, publish_datetime=None):
+        """
+        Record a review seen in this crawl.
+        """
+
+        newest = self.newest.setdefault(entity, [None, None])
+        publish_datetime = _as_datetime(publish_datetime)
+        if publish_datetime is not None:
+            if newest[0] is None or publish_datetime > newest[0]:
+                newest[0] = publish_datetime
+                newest[1] = str(review_id) if review_id is not None else None
+        elif review_id is not None and self.ordered_ids:
+            if newest[1] is None or int(review_id) > int(newest[1]):
+                newest[1] = str(review_id)
+
+    def expect(self, entity: str):
+        """
+        Register a request of entity whose review is observed when it is settled.
+        """
+
+        self.pending[entity] = self.pending.get(entity, 0) + 1
+
+    def settle(self, entity: str, failed=False):
+        """
+        Settle an expected request of entity after its review is observed, or after it failed.
+        """
+
+        if failed:
+            self.failed.add(entity)
+        self.pending[entity] -= 1
+        if self.pending[entity] == 0:
+            del self.pending[entity]
+            if entity in self.stopped:
+                self.stopped.remove(entity)
+                self._commit_settled(entity)
+
+    def stop(self, entity: str):
+        """
+        Pagination of entity stopped. Watermark is committed now, or once expected requests of entity are settled.
+        Watermarks of entities with requests still pending when crawl ends are not committed.
+        """
+
+        if self.pending.get(entity, 0) > 0:
+            self.stopped.add(entity)
+        else:
+            self._commit_settled(entity)
+
+    def _commit_settled(self, entity: str):
+        if entity in self.failed:
+            self.failed.remove(entity)
+            self.newest.pop(entity, None)
+            self.logger.warning('Watermark of {} {} is not advanced as some of its reviews failed'
+                                .format(self.spider, entity))
+            return
+        self.commit(entity)
+
+    def commit(self, entity: str):
+        """
+        Advance watermark of entity with reviews seen in this crawl and save it.
+        """
+
+        newest_datetime, newest_id = self.get(entity)
+        seen_datetime, seen_id = self.newest.pop(entity, (None, None))
+        if seen_datetime is not None and (newest_datetime is None or seen_datetime > newest_datetime):
+            newest_datetime, newest_id = seen_datetime, seen_id
+        elif seen_datetime is None and seen_id is not None and self.ordered_ids:
+            if newest_id is None or int(seen_id) > int(newest_id):
+                newest_id = seen_id
+        self.marks[entity] = (newest_datetime, newest_id)
+
+        try:
+            row = self.session.query(CrawlWatermark) \
+                              .filter(CrawlWatermark.spider == self.spider, CrawlWatermark.entity == entity) \
+                              .one_or_none()
+            if row is None:
+                row = CrawlWatermark(spider=self.spider, entity=entity)
+                self.session.add(row)
+            row.newest_publish_datetime = newest_datetime
+            row.newest_review_id = newest_id
+            row.last_crawl_datetime = datetime.utcnow()
+            self.session.commit()
+        except SQLAlchemyError as err:
+            self.session.rollback()
+            self.logger.warning('Failed to save watermark of {} {}'.format(self.spider, entity))
+            self.logger.error(str(err))
+
+
+class IncrementalCrawlMixin(object):
+    """
+    Incremental crawl mode of review spiders, enabled by spider argument `-a incremental=true`. Spiders stop
+    paginating an entity as soon as a page has only known reviews, and commit its watermark then.
+    """
+
+    incremental = False
+    ordered_review_ids = False  # whether review IDs are integers increasing with publishing
+    _watermarks = None
+
+    @property
+    def watermarks(self) -> Optional[WatermarkStore]:
+        """
+        Watermark store of spider, None if not in incremental mode.
+        """
+
+        if str(self.incremental).lower() not in ('true', '1', 'yes'):
+            return None
+        if self._watermarks is None:
+            engine = db_connect()
+            create_crawl_watermark_table(engine)
+            self._watermarks = WatermarkStore(self.name, sessionmaker(bind=engine)(),
+                                              ordered_ids=self.ordered_review_ids,
+                                              fallback=self.stored_newest_review)
+            self.logger.info('Incremental crawl. {} watermarks are loaded.'.format(len(self._watermarks.marks)))
+        return self._watermarks
+
+    def stored_newest_review(self, session, entity: str) -> Optional[Tuple[datetime, str]]:
+        """
+        Newest review of entity already stored, as (publish datetime, review ID), for entities without watermark.
+        None if spider does not store reviews in database.
+        """
+
+        return None
+
+    def closed(self, reason):
+        if self._watermarks is not None:
+            self._watermarks.session.close()
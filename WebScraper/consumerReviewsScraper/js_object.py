@@ -0,0 +1,163 @@
+import re
+from typing import Any
+
+
+class JSObjectError(ValueError):
+    """
+    Raised when text is not a JavaScript object literal that parse_js_object() understands.
+    """
+
+    def __init__(self, message: str, pos: int):
+        super().__init__('{} at position {}'.format(message, pos))
+        self.pos = pos
+
+
+# one token after optional whitespace and comments. Groups are 1 string, 2 number, 3 identifier and 4 punctuation.
+_TOKEN = re.compile(r'''
+    (?:\s+|//[^\n]*|/\*.*?\*/)*
+    (?:
+        ("[^"\\]*(?:\\.[^"\\]*)*"|'[^'\\]*(?:\\.[^'\\]*)*')
+        |(-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+        |([A-Za-z_$][\w$]*)
+        |(\|\||[{}\[\],:()])
+    )''', re.VERBOSE | re.DOTALL)
+_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)', re.DOTALL)
+_SURROGATE_PAIR = re.compile('[\ud800-\udbff][\udc00-\udfff]')
+_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v', '0': '\0', '\n': ''}
+_LITERALS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+
+
+def parse_js_object(text: str, start: int = None) -> Any:
+    """
+    Parse a JavaScript object literal in a single pass, e.g. page data assigned in an inline script. Besides JSON,
+    it accepts unquoted keys, single-quoted strings, trailing commas, comments, numbers with leading zeros,
+    undefined, `a || b` and calls of one argument such as encodeURIComponent(...), which evaluate to the argument.
+    :param text: text containing object literal, e.g. the whole script.
+    :param start: position of the opening brace. The first brace in text if None. Text after the closing brace is
+        ignored.
+    :return: parsed object as dicts, lists, strings, numbers, booleans and None.
+    """
+
+    if start is None:
+        start = text.find('{')
+        if start == -1:
+            raise JSObjectError('No object literal found', 0)
+
+    scan = _TOKEN.scanner(text, start).match
+    try:
+        m = scan()
+        if m.group(4) != '{':
+            raise JSObjectError('Expected "{"', m.start(m.lastindex))
+        value, _ = _parse_object(scan)
+    except AttributeError:
+        # scan() returned None, i.e. text ended or has a character that starts no token
+        raise JSObjectError('Unexpected end of text or character', _scan_end(text, start)) from None
+    return value
+
+
+def _scan_end(text: str, start: int) -> int:
+    end = start
+    for m in iter(_TOKEN.scanner(text, start).match, None):
+        end = m.end()
+    return end
+
+
+def _parse_value(scan, m):
+    value, m = _parse_primary(scan, m)
+    while m is not None and m.group(4) == '||':
+        other, m = _parse_primary(scan, scan())
+        value = value or other
+    return value, m
+
+
+def _parse_primary(scan, m):
+    kind = m.lastindex
+    token = m.group(kind)
+    if kind == 1:
+        return _decode_string(token), scan()
+    if kind == 2:
+        if '.' in token or 'e' in token or 'E' in token:
+            return float(token), scan()
+        return int(token), scan()
+    if kind == 4:
+        if token == '{':
+            return _parse_object(scan)
+        if token == '[':
+            return _parse_array(scan)
+        raise JSObjectError('Unexpected "{}"'.format(token), m.start(kind))
+
+    if token in _LITERALS:
+        return _LITERALS[token], scan()
+    after = scan()
+    if after is not None and after.group(4) == '(':
+        # call of one argument, e.g. encodeURIComponent('...'), evaluates to the argument
+        value, after = _parse_value(scan, scan())
+        if after.group(4) != ')':
+            raise JSObjectError('Expected ")"', after.start(after.lastindex))
+        return value, scan()
+    raise JSObjectError('Unknown identifier "{}"'.format(token), m.start(kind))
+
+
+def _parse_object(scan):
+    obj = {}
+    m = scan()
+    while True:
+        kind = m.lastindex
+        token = m.group(kind)
+        if kind == 4:
+            if token == '}':
+                return obj, scan()
+            raise JSObjectError('Expected key', m.start(kind))
+        key = _decode_string(token) if kind == 1 else token
+
+        m = scan()
+        if m.group(4) != ':':
+            raise JSObjectError('Expected ":"', m.start(m.lastindex))
+        obj[key], m = _parse_value(scan, scan())
+
+        token = m.group(4)
+        if token == ',':
+            m = scan()
+        elif token != '}':
+            raise JSObjectError('Expected "," or "}"', m.start(m.lastindex))
+
+
+def _parse_array(scan):
+    array = []
+    m = scan()
+    while True:
+        if m.group(4) == ']':
+            return array, scan()
+        value, m = _parse_value(scan, m)
+        array.append(value)
+
+        token = m.group(4)
+        if token == ',':
+            m = scan()
+        elif token != ']':
+            raise JSObjectError('Expected "," or "]"', m.start(m.lastindex))
+
+
+def _decode_string(token: str) -> str:
+    body = token[1:-1]
+    if '\\' not in body:
+        return body
+    value = _ESCAPE.sub(_decode_escape, body)
+    if '\\u' in body:
+        # characters beyond BMP are escaped as surrogate pairs, e.g. "\ud83d\ude00", which make one character as
+        # in json.loads. Lone surrogates are kept.
+        value = _SURROGATE_PAIR.sub(_combine_surrogates, value)
+    return value
+
+
+def _decode_escape(m) -> str:
+    # unknown escapes such as \a evaluate to the escaped character, as in JavaScript
+    escaped = m.group(1)
+    if len(escaped) > 1:
+        return chr(int(escaped[1:], 16))
+    return _ESCAPES.get(escaped, escaped)
+
+
+def _combine_surrogates(m) -> str:
+    high, low = m.group(0)
+    return chr(0x10000 + ((ord(high) - 0xd800) << 10) + (ord(low) - 0xdc00))
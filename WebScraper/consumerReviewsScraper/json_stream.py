@@ -0,0 +1,148 @@
+import re
+from typing import Any, Iterator, Sequence, Tuple, Union
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+# C scanner of decoder decodes one value at an index and returns where it ends, so values are decoded one at a time
+# straight from the document, and values that are skipped are never kept.
+_scan = json.JSONDecoder().scan_once
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+Path = Sequence[Union[str, int]]
+
+
+class JSONPathError(LookupError):
+    """
+    Raised when a JSON document has no value of the expected type at a path.
+    """
+
+    def __init__(self, path: Path, expected: str):
+        super().__init__('No {} at path {}'.format(expected, '.'.join(str(p) for p in path)))
+        self.path = path
+
+
+def get_value(text: Union[str, bytes], path: Path, default=None) -> Any:
+    """
+    Decode only the value at path of a JSON document.
+    :param text: JSON document, e.g. text of a response.
+    :param path: object keys and array indices from the root to the value.
+    :param default: value returned if path is missing or the value is null.
+    """
+
+    text = _as_text(text)
+    pos = _locate(text, path)
+    if pos is None:
+        return default
+    value = _decode(text, pos)[0]
+    return value if value is not None else default
+
+
+def iter_array(text: Union[str, bytes], path: Path) -> Iterator[Any]:
+    """
+    Iterate over the array at path of a JSON document, decoding one element at a time, so items can be yielded
+    before the rest of the array is decoded and the array is never held as a whole.
+    :raise JSONPathError: if there is no array at path. It is raised by this call, not by the iteration.
+    """
+
+    text = _as_text(text)
+    pos = _locate(text, path)
+    if pos is None or text[pos] != '[':
+        raise JSONPathError(path, 'array')
+    return (value for value, _ in _elements(text, pos))
+
+
+def iter_object(text: Union[str, bytes], path: Path) -> Iterator[Tuple[str, Any]]:
+    """
+    Iterate over (key, value) of the object at path of a JSON document, decoding one value at a time.
+    :raise JSONPathError: if there is no object at path. It is raised by this call, not by the iteration.
+    """
+
+    text = _as_text(text)
+    pos = _locate(text, path)
+    if pos is None or text[pos] != '{':
+        raise JSONPathError(path, 'object')
+    return ((key, value) for key, value, _ in _members(text, pos))
+
+
+def _as_text(text) -> str:
+    return text.decode('utf-8') if isinstance(text, bytes) else text
+
+
+def _decode(text: str, pos: int):
+    try:
+        return _scan(text, pos)
+    except StopIteration as err:
+        raise ValueError('Expected value at position {}'.format(err.value)) from None
+
+
+def _first(text: str, pos: int, close: str):
+    # position of the first element or key of array or object starting at pos, None if it is empty
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    return None if text[pos:pos + 1] == close else pos
+
+
+def _next(text: str, end: int, close: str):
+    # position of the next element or key after a value ending at end, None if array or object closes
+    pos = _WHITESPACE.match(text, end).end()
+    c = text[pos:pos + 1]
+    if c == close:
+        return None
+    if c != ',':
+        raise ValueError('Expected "," or "{}" at position {}'.format(close, pos))
+    return _WHITESPACE.match(text, pos + 1).end()
+
+
+def _key(text: str, pos: int):
+    # key at pos and position of its value
+    key, end = _decode(text, pos)
+    if not isinstance(key, str):
+        raise ValueError('Expected key at position {}'.format(pos))
+    pos = _WHITESPACE.match(text, end).end()
+    if text[pos:pos + 1] != ':':
+        raise ValueError('Expected ":" at position {}'.format(pos))
+    return key, _WHITESPACE.match(text, pos + 1).end()
+
+
+def _elements(text: str, pos: int):
+    pos = _first(text, pos, ']')
+    while pos is not None:
+        value, end = _decode(text, pos)
+        yield value, end
+        pos = _next(text, end, ']')
+
+
+def _members(text: str, pos: int):
+    pos = _first(text, pos, '}')
+    while pos is not None:
+        key, pos = _key(text, pos)
+        value, end = _decode(text, pos)
+        yield key, value, end
+        pos = _next(text, end, '}')
+
+
+def _locate(text: str, path: Path):
+    # start position of value at path, None if path is missing. Values before it are decoded and dropped one by one.
+    pos = _WHITESPACE.match(text).end()
+    for step in path:
+        c = text[pos:pos + 1]
+        if isinstance(step, int) and c == '[':
+            pos = _first(text, pos, ']')
+            for _ in range(step):
+                if pos is None:
+                    break
+                pos = _next(text, _decode(text, pos)[1], ']')
+        elif isinstance(step, str) and c == '{':
+            pos = _first(text, pos, '}')
+            while pos is not None:
+                key, pos = _key(text, pos)
+                if key == step:
+                    break
+                pos = _next(text, _decode(text, pos)[1], '}')
+        else:
+            return None
+        if pos is None:
+            return None
+    return pos
@@ -0,0 +1,31 @@
+from sqlalchemy import Index, Column
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import BigInteger, String, DateTime
+
+
+# base class for all database tables
+DeclarativeBase = declarative_base()
+
+
+class CrawlWatermark(DeclarativeBase):
+    """
+    Newest review crawled of an entity (store, hotel, vehicle, ...) by a spider. Incremental crawls stop paginating
+    an entity once they reach it. This is persistent among jobs.
+    """
+
+    __tablename__ = 'crawl_watermark'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    spider = Column(String(255), nullable=False)
+    entity = Column(String(512), nullable=False)
+    newest_publish_datetime = Column(DateTime)
+    newest_review_id = Column(String(255))
+    last_crawl_datetime = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('uidx__crawl_watermark__spider_entity', 'spider', 'entity', unique=True),
+    )
+
+    def __repr__(self):
+        return '<CrawlWatermark(spider={}, entity={}, newest_publish_datetime={}, newest_review_id={})>'.format(
+            self.spider, self.entity, self.newest_publish_datetime, self.newest_review_id)
@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from WebScraper.consumerReviewsScraper.models.bizrate import BizrateStore, BizrateReview
+from WebScraper.consumerReviewsScraper.models.crawl_watermark import CrawlWatermark
 from WebScraper.consumerReviewsScraper.models.expedia import ExpediaHotel, ExpediaReview
 from WebScraper.consumerReviewsScraper.models.steam import SteamUserProfile
 from WebScraper.consumerReviewsScraper.models.university import University, UniversityRanking
@@ -73,3 +74,11 @@ def create_url_status_table(engine):
     """
 
     URLStatus.metadata.create_all(engine)
+
+
+def create_crawl_watermark_table(engine):
+    """
+    Create CrawlWatermark table.
+    """
+
+    CrawlWatermark.metadata.create_all(engine)
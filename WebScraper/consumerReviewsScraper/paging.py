@@ -0,0 +1,268 @@
+import os
+import re
+import simplejson
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class QueryTemplate(object):
+    """
+    Request payload serialized once. Values at the given paths are left as slots, so rendering the body of a page is
+    string concatenation of a few values instead of serializing the whole (multi-KB) query again.
+    """
+
+    def __init__(self, payload: dict, slots: Dict[str, tuple]):
+        """
+        :param payload: request payload. It is not modified.
+        :param slots: {slot name: path of keys and list indices of the value in payload}.
+        """
+
+        payload = simplejson.loads(simplejson.dumps(payload))  # deep copy
+        markers = {}
+        for i, (name, path) in enumerate(slots.items()):
+            marker = '__slot_{}__'.format(i)
+            parent = payload
+            for key in path[:-1]:
+                parent = parent[key]
+            parent[path[-1]] = marker
+            markers[simplejson.dumps(marker)] = name
+
+        body = simplejson.dumps(payload)
+        self.parts, self.names = [], []
+        pos = 0
+        for m in re.finditer('|'.join(re.escape(marker) for marker in markers), body):
+            self.parts.append(body[pos:m.start()])
+            self.names.append(markers[m.group()])
+            pos = m.end()
+        self.parts.append(body[pos:])
+
+    def render(self, **values) -> str:
+        """
+        Body of a request, same as serializing payload with slots set to values.
+        """
+
+        body = [self.parts[0]]
+        for name, part in zip(self.names, self.parts[1:]):
+            body.append(simplejson.dumps(values[name]))
+            body.append(part)
+        return ''.join(body)
+
+
+class PageSizeController(object):
+    """
+    Page size tuned from observed latency and error rate. It grows additively while pages come back fast and
+    complete, and shrinks multiplicatively when pages are slow, truncated or rejected.
+    """
+
+    def __init__(self, initial=500, min_size=50, max_size=1000, step=50, target_latency=5.0, max_error_rate=0.1,
+                 smoothing=0.3):
+        """
+        :param initial: initial page size.
+        :param min_size: minimum page size.
+        :param max_size: maximum page size.
+        :param step: # of items page size grows by after a fast and complete page.
+        :param target_latency: page size shrinks when smoothed latency in seconds is above it.
+        :param max_error_rate: page size does not grow when smoothed error rate is above it.
+        :param smoothing: weight of the latest observation in exponential moving averages.
+        """
+
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.step = step
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.smoothing = smoothing
+        self.latency = None
+        self.error_rate = 0.0
+
+    def observe(self, latency: float = None, ok: bool = True) -> int:
+        """
+        Update page size with a finished page.
+        :param latency: download latency of page in seconds. None if unknown.
+        :param ok: whether page came back complete.
+        :return: new page size.
+        """
+
+        s = self.smoothing
+        if latency is not None:
+            self.latency = latency if self.latency is None else (1 - s) * self.latency + s * latency
+        self.error_rate = (1 - s) * self.error_rate + s * (0.0 if ok else 1.0)
+
+        if not ok:
+            self.size = max(self.min_size, self.size // 2)
+        elif self.latency is not None and self.latency > self.target_latency:
+            self.size = max(self.min_size, int(self.size * 0.8))
+        elif self.error_rate <= self.max_error_rate:
+            self.size = min(self.max_size, self.size + self.step)
+        return self.size
+
+
+class PagePlanner(object):
+    """
+    Plans pages of many properties, e.g. reviews of hotels, fetched from one host. At most `budget` pages are in
+    flight at a time, handed out round-robin over properties, and sized by a PageSizeController.
+
+    Per property, the start index below which all pages are finished is committed to a JSON state file. A restarted
+    crawl resumes every property from its committed start index, so pages finished above it may be fetched twice.
+    A property is dropped from state file once all its pages are finished, so the next crawl starts it over.
+    """
+
+    def __init__(self, state_path: str, budget=4, controller: PageSizeController = None, max_attempts=3):
+        """
+        :param state_path: path of state file.
+        :param budget: max # of pages in flight.
+        :param controller: page size controller. A default one is used if None.
+        :param max_attempts: # of times a range is fetched before it is given up until the next run.
+        """
+
+        self.state_path = state_path
+        self.budget = budget
+        self.controller = controller if controller is not None else PageSizeController()
+        self.max_attempts = max_attempts
+        self.committed = self._read_state()
+        self.totals = {}  # {key: # of items}
+        self.cursors = {}  # {key: start index of the first item never handed out}
+        self.retries = {}  # {key: deque of (start, end) ranges to fetch again}
+        self.finished = {}  # {key: {start: end}} of finished ranges above committed start index
+        self.attempts = {}  # {(key, start): # of failed attempts}
+        self.completed = set()  # keys whose pages are all finished
+        self.order = deque()  # keys that may have pages to hand out
+        self.in_flight = 0
+
+    def add(self, key: str, total: int) -> int:
+        """
+        Add a property to plan pages of.
+        :param key: property key.
+        :param total: # of items of property.
+        :return: start index that property resumes from.
+        """
+
+        start = self.committed.get(key, 0)
+        self.totals[key] = total
+        self.cursors[key] = start
+        self.retries[key] = deque()
+        self.finished[key] = {}
+        if start < total:
+            self.order.append(key)
+        else:
+            self._complete(key)
+        return start
+
+    def next_pages(self) -> List[Tuple[str, int, int]]:
+        """
+        Hand out pages within the concurrency budget.
+        :return: list of (key, start index, page size).
+        """
+
+        pages = []
+        while self.in_flight < self.budget and len(self.order) > 0:
+            key = self.order.popleft()
+            page = self._take(key)
+            if page is None:
+                continue  # key is added back if a range of it is fetched again
+            pages.append(page)
+            self.in_flight += 1
+            self.order.append(key)
+        return pages
+
+    def finish(self, key: str, start: int, size: int, received: int, latency: float = None) -> bool:
+        """
+        Record a page that came back with `received` items. A page with fewer items than requested is truncated and
+        the rest of it is fetched again. An empty page means the property has no items from start on.
+        :return: whether this page completed the property.
+        """
+
+        self.in_flight -= 1
+        if received == 0:
+            self.totals[key] = min(self.totals[key], start)
+            self._finish_range(key, start, start + size)
+        else:
+            received = min(received, size)
+            self._finish_range(key, start, start + received)
+            if received < size:
+                self._retry(key, start + received, start + size)
+        self.controller.observe(latency, ok=received == 0 or received == size)
+        return self._advance(key)
+
+    def stop(self, key: str, end: int) -> bool:
+        """
+        Hand out no pages of property from end on, e.g. when an incremental crawl reached items crawled before.
+        :return: whether this completed the property.
+        """
+
+        self.totals[key] = min(self.totals[key], end)
+        return self._advance(key)
+
+    def fail(self, key: str, start: int, size: int, latency: float = None):
+        """
+        Record a rejected or failed page. It is fetched again, by pages of the shrunk size.
+        """
+
+        self.in_flight -= 1
+        self.controller.observe(latency, ok=False)
+        self._retry(key, start, start + size)
+
+    def _take(self, key: str):
+        retries = self.retries[key]
+        while len(retries) > 0:
+            start, end = retries.popleft()
+            end = min(end, self.totals[key])
+            if start >= end:
+                continue
+            size = min(end - start, self.controller.size)
+            if start + size < end:
+                retries.appendleft((start + size, end))
+            return key, start, size
+
+        start = self.cursors[key]
+        if start >= self.totals[key]:
+            return None
+        size = min(self.controller.size, self.totals[key] - start)
+        self.cursors[key] = start + size
+        return key, start, size
+
+    def _retry(self, key: str, start: int, end: int):
+        attempts = self.attempts.get((key, start), 0) + 1
+        if attempts >= self.max_attempts:
+            return  # committed start index stays below range, so it is fetched again in the next run
+        self.attempts[(key, start)] = attempts
+        self.retries[key].append((start, end))
+        if key not in self.order:
+            self.order.append(key)
+
+    def _finish_range(self, key: str, start: int, end: int):
+        self.finished[key][start] = end
+
+    def _advance(self, key: str) -> bool:
+        # commit finished ranges contiguous to committed start index
+        if key in self.completed:
+            return False
+        finished = self.finished[key]
+        committed = old = self.committed.get(key, 0)
+        while committed in finished:
+            committed = finished.pop(committed)
+        if committed >= self.totals[key]:
+            self._complete(key)
+            return True
+        if committed != old:
+            self.committed[key] = committed
+            self._write_state()
+        return False
+
+    def _complete(self, key: str):
+        self.completed.add(key)
+        if self.committed.pop(key, None) is not None:
+            self._write_state()
+
+    def _read_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as fp:
+            return simplejson.load(fp)
+
+    def _write_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            simplejson.dump(self.committed, fp)
+        os.replace(tmp_path, self.state_path)  # state file is never half-written
@@ -6,14 +6,19 @@ from typing import Optional
 from scrapy.spiders import Spider
 from scrapy.http import Request
 from scrapy.utils.request import request_fingerprint
+from sqlalchemy import func
 from urllib.parse import unquote
+from WebScraper.consumerReviewsScraper.incremental import IncrementalCrawlMixin
 from WebScraper.consumerReviewsScraper.items.bizrate import BizrateStoreItem, BizrateReviewItem
+from WebScraper.consumerReviewsScraper.js_object import JSObjectError, parse_js_object
+from WebScraper.consumerReviewsScraper.models.bizrate import BizrateReview
 
 
-class BizrateReviewSpider(Spider):
+class BizrateReviewSpider(IncrementalCrawlMixin, Spider):
     name = 'bizrate_spider'
     page_size = 20
     total_reviews = -1  # determined at the first review parsing
+    ordered_review_ids = True  # review pages list only review IDs, which increase with publishing
 
     custom_settings = {
         'LOG_FILE': '{}.log'.format(name),
@@ -27,17 +32,30 @@ class BizrateReviewSpider(Spider):
         'CRAWLER_PAUSE_SECONDS': 60,
         'RETRY_HTTP_CODES': [429, 504],
 
+        # Pages whose page data cannot be parsed are saved here
+        'QUARANTINE_DIR': 'quarantine',
+
         'DOWNLOADER_MIDDLEWARES': {
             'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
             'consumerReviewsScraper.middlewares.RandomUserAgentMiddleware': 400,
 
             'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
             'consumerReviewsScraper.middlewares.TooManyRequestsRetryMiddleware': 543,
+            'consumerReviewsScraper.distributed.SharedPolitenessMiddleware': 450,
         },
 
         'SPIDER_MIDDLEWARES': {
+            'consumerReviewsScraper.distributed.DistributedSeedMiddleware': 5,
             'consumerReviewsScraper.middlewares.UpdateURLStatusMiddleware': 10,
         },
+
+        # Distributed crawl, enabled by `-s DISTRIBUTED=1`. Processes share requests and fingerprints in Redis, and
+        # space requests to bizrate.com by DISTRIBUTED_DOMAIN_DELAY seconds altogether.
+        'SCHEDULER': 'consumerReviewsScraper.distributed.DistributedScheduler',
+        'DISTRIBUTED': False,
+        'DISTRIBUTED_STORE': 'consumerReviewsScraper.distributed.RedisStore',
+        'REDIS_URL': 'redis://localhost:6379/0',
+        'DISTRIBUTED_DOMAIN_DELAY': 0.5,
     }
 
     def start_requests(self):
@@ -60,6 +78,8 @@ class BizrateReviewSpider(Spider):
     def parse_store(self, response):
         self.logger.info('Parsing store ' + response.url)
         page_data = self._parse_page_data(response)
+        if page_data is None:
+            return
 
         merchant = page_data['merchant']
         award = page_data['award']
@@ -102,30 +122,45 @@ class BizrateReviewSpider(Spider):
 
     def parse_reviews(self, response):
         page_data = self._parse_page_data(response)
+        if page_data is None:
+            return
         reviews = page_data.get('reviews', [])
         pager = page_data['pager']
         self.logger.info('Parsing reviews ==={}==='.format(pager['pagerCount']))
+        match = re.match(r'(http.*/(\d+))', response.url)
+        store_url = match[1]
+        store_id = match[2]
 
-        for r in reviews:
-            review_id = r.get('reviewId', None)
-            if review_id is not None:
-                match = re.match(r'(http.*/\d+)', response.url)
-                store_url = match[1]
-                url = store_url + '/' + str(review_id)
-                req = Request(url=url, callback=self.parse_review_details)
-                req.meta['fp'] = request_fingerprint(req)
-                yield req
+        watermarks = self.watermarks
+        review_ids = [r['reviewId'] for r in reviews if r.get('reviewId', None) is not None]
+        all_known = watermarks is not None and watermarks.all_known(store_id, [(x, None) for x in review_ids])
+        for review_id in review_ids:
+            if watermarks is not None and watermarks.is_known(store_id, review_id=review_id):
+                continue
+            url = store_url + '/' + str(review_id)
+            req = Request(url=url, callback=self.parse_review_details, errback=self.review_details_failed,
+                          meta={'store_id': store_id})
+            if watermarks is not None:
+                # review is observed when its details are parsed, which stay in this process with the watermark
+                watermarks.expect(store_id)
+                req.meta['watermark'] = True
+                req.meta['local'] = True
+            req.meta['fp'] = request_fingerprint(req)
+            yield req
 
         next_page_url = pager.get('nextPage', None)
-        if next_page_url is not None and len(next_page_url) > 0:
-            match = re.match(r'(http.*/\d+)', response.url)
-            store_url = match[1]
+        if all_known:
+            self.logger.info('Reached known reviews of store {}'.format(store_id))
+        if not all_known and next_page_url is not None and len(next_page_url) > 0:
             match = re.match(r'.*/(index--\d+).*', next_page_url)
             next_page_str = match[1]
             url = store_url + '/' + next_page_str
-            req = Request(url=url, callback=self.parse_reviews)
+            # pages of a store stay in the process that started it, which keeps its watermark in a distributed crawl
+            req = Request(url=url, callback=self.parse_reviews, meta={'local': True})
             req.meta['fp'] = request_fingerprint(req)
             yield req
+        elif watermarks is not None:
+            watermarks.stop(store_id)  # pagination of store stopped, committed once details are parsed
 
     def parse_review_details(self, response):
         self.logger.info('Parsing review details: ' + response.url)
@@ -133,6 +168,10 @@ class BizrateReviewSpider(Spider):
         store_id = match[1]
         review_id = match[2]
         page_data = self._parse_page_data(response)
+        if page_data is None:
+            if response.meta.get('watermark', False):
+                self.watermarks.settle(store_id, failed=True)
+            return
         rating = page_data['rating']
         review = page_data['review']
 
@@ -188,40 +227,48 @@ class BizrateReviewSpider(Spider):
             after_returns_process=self._str2int(rating.get('ffReturnProcess', None))
         )
 
+        if response.meta.get('watermark', False):
+            self.watermarks.observe(store_id, review_id=review_id)
+            self.watermarks.settle(store_id)
         yield r
 
-    def _parse_page_data(self, response) -> dict:
+    def review_details_failed(self, failure):
+        request = failure.request
+        self.logger.warn('Failed to get review details {}. {}'.format(request.url, repr(failure.value)))
+        if request.meta.get('watermark', False):
+            self.watermarks.settle(request.meta['store_id'], failed=True)
+
+    def stored_newest_review(self, session, entity: str):
+        newest_id = session.query(func.max(BizrateReview.review_id)) \
+                           .filter(BizrateReview.store_id == int(entity)) \
+                           .scalar()
+        return (None, newest_id) if newest_id is not None else None
+
+    def _parse_page_data(self, response) -> Optional[dict]:
         """
-        A shortcut way to parse page data. Assuming page has a struct in response having all fields we need.
+        Parse page data, the object literal in the inline script of page. Pages that cannot be parsed are saved to
+        QUARANTINE_DIR and None is returned.
         """
 
-        page_data = response.xpath("body/script").get()
-        start = page_data.find('{')
-        end = page_data.rfind('}')
-        page_data = page_data[start:end + 1]
-        page_data = page_data.replace('\n', '') \
-                             .replace('\'', '"') \
-                             .replace(' || ""', '') \
-                             .replace('encodeURIComponent(', '') \
-                             .replace('),', ',') \
-                             .replace(')', '') \
-                             .strip()
-        page_data = re.sub(r'awardYear:\s+(0000),', r'awardYear: 0,', page_data)  # 0000 is not a valid year in JSON
-        page_data = re.sub(r'(\w+):\s+"', r'"\1": "', page_data)  # replace [name : "Online Shopper"] to ["name" : "Online Shopper"]
-        page_data = re.sub(r'(\w+):\s+(\d+|true|false|{|\[)', r'"\1": \2', page_data)
-        page_data = re.sub(r'([\w\d]+)\\([\w\d]+)', r'\1 \2', page_data)
-        page_data = re.sub(r',\s+}', r'}', page_data)
-        page_data = re.sub(r',\s+]', r']', page_data)
-        page_data = re.sub(r': ""(\w+)"', r': "\1', page_data)  # replace [: ""Beginner"] to [: "Beginner]
-        page_data = re.sub(r'n\\+a', r'n/a', page_data, flags=re.IGNORECASE)  # replace [n\\a] to [n/a]
+        script = response.xpath("body/script").get()
         try:
-            page_data = json.loads(page_data)
-        except:
-            with open('C:/Users/lkhoho/OneDrive/Desktop/pageerror.txt', 'w+') as fp:
-                fp.write(page_data)
-                fp.write('--------\n')
+            return parse_js_object(script or '')
+        except JSObjectError as e:
+            path = self._quarantine(response, script, e)
+            self.logger.warning('Cannot parse page data of {}: {}. Page is saved to {}'.format(response.url, e, path))
+            return None
 
-        return page_data
+    def _quarantine(self, response, script: Optional[str], error: Exception) -> str:
+        quarantine_dir = self.settings.get('QUARANTINE_DIR', 'quarantine')
+        os.makedirs(quarantine_dir, exist_ok=True)
+        fp = response.meta.get('fp') or request_fingerprint(response.request)
+        path = os.sep.join([quarantine_dir, '{}__{}.txt'.format(self.name, fp)])
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('URL: {}\n'.format(response.url))
+            f.write('Error: {}\n'.format(error))
+            f.write('--------\n')
+            f.write(script if script is not None else response.text)
+        return path
 
     def _str2int(self, val: str) -> Optional[int]:
         if val is None or len(val) == 0 or val.lower() == 'na' or val.lower() == 'n/a':
@@ -1,11 +1,12 @@
 import re
 import pytz
-import json
 from datetime import datetime, date, timedelta
 from fake_useragent import UserAgent
-from scrapy.http import Request
+from scrapy.http import FormRequest, Request
 from scrapy.spiders import CrawlSpider
+from ..extractors import dianping
 from ..items.dianping import *
+from ..json_stream import get_value, iter_array, iter_object
 
 
 class DianpingCommunitySpider(CrawlSpider):
@@ -111,6 +112,24 @@ class DianpingCommunitySpider(CrawlSpider):
             'rotating_proxies.middlewares.BanDetectionMiddleware': 620,
         },
 
+        # pending requests are kept on disk, so an interrupted crawl resumes where it stopped
+        'SCHEDULER': 'consumerReviewsScraper.frontier.FrontierScheduler',
+        'SPIDER_MIDDLEWARES': {
+            'consumerReviewsScraper.frontier.FrontierMiddleware': 10,
+            'consumerReviewsScraper.yield_priority.YieldPriorityMiddleware': 50,
+        },
+        'FRONTIER_DIR': 'frontier',
+
+        # requests of callbacks yielding more reviews per second go first, member profiles last
+        'YIELD_ITEM_WEIGHTS': {
+            'DPReview': 1.0,
+            'DPTopic': 0.5,
+            'DPBonus': 0.2,
+            'DPCommunity': 0.1,
+            'DPMember': 0.1,
+            'DPBadge': 0.1,
+        },
+
         'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S.%f',
         'START_CITY': '北京',
         'CITY_IDS': {'上海': 1, '北京': 2, '成都': 8, '重庆': 9}
@@ -314,106 +333,94 @@ class DianpingCommunitySpider(CrawlSpider):
             topic['edit_datetime'] = utc_dt.strftime(self.settings.get('DATETIME_FORMAT'))
         else:
             topic['edit_datetime'] = None
-        ops_url = 'http://s.dianping.com/ajax/json/group/note/oploglist?noteId=' + str(topic['id'])
-        res = requests.get(ops_url, headers={
-            'User-Agent': self.user_agent.random,
-            'Host': 's.dianping.com',
-            'Origin': 'http://s.dianping.com',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': 'http://s.dianping.com/topic/%d?utm_source=forum_pc_tribe' % topic['id']})
-        res = json.loads(res.text)
-        code = res['code']
+        # elite oplog and score list are fetched by chained requests, concurrently with the rest of the crawl.
+        # topic is yielded once oplog arrives, bonuses once score list arrives.
+        yield Request(url='http://s.dianping.com/ajax/json/group/note/oploglist?noteId=' + str(topic['id']),
+                      headers=self._ajax_headers(topic['id']),
+                      callback=self.parse_topic_oplog,
+                      errback=self.topic_oplog_failed,
+                      meta={'topic': topic})
+        yield Request(url='http://s.dianping.com/ajax/json/group/note/scorelist?noteId=' + str(topic['id']),
+                      headers=self._ajax_headers(topic['id']),
+                      callback=self.parse_topic_scores,
+                      meta={'topic_id': topic['id']})
+
+        # pagination for reviews
+        page_list = [1]
+        max_page = max(page_list + [int(page_str) for page_str in
+                                    response.xpath("//ul[@class='page-list']/li[@class='item']/a/text()").extract()])
+        for i in range(1, max_page + 1):
+            pos = response.url.find('?')
+            if pos != -1:
+                url = response.url[:pos] + '?pageno=%d' % i
+            else:
+                url = response.url + '?pageno=%d' % i
+            yield Request(url=url, callback=self.parse_review)
+
+    def parse_topic_oplog(self, response):
+        topic = response.meta['topic']
+        topic['mark_elite_by'] = None
+        topic['mark_elite_datetime'] = None
+        # only the latest operation is decoded
+        code = get_value(response.text, ('code',))
         if code == 200:
-            ops = res['msg']['data']
-            op = ops[0] if len(ops) > 0 else None
-            m = re.match(r'.*/member/(?P<admin_id>\d+).*于(?P<mark_dt>[\d\s\-:]+)设为精华帖', op)
-            topic['mark_elite_by'] = m.group('admin_id')
-            topic['mark_elite_datetime'] = self._convert_timezone(
-                datetime.strptime(m.group('mark_dt').strip(), '%Y-%m-%d %H:%M:%S'))
+            op = get_value(response.text, ('msg', 'data', 0))
+            m = re.match(r'.*/member/(?P<admin_id>\d+).*于(?P<mark_dt>[\d\s\-:]+)设为精华帖', op) \
+                if op is not None else None
+            if m is not None:
+                topic['mark_elite_by'] = m.group('admin_id')
+                topic['mark_elite_datetime'] = self._convert_timezone(
+                    datetime.strptime(m.group('mark_dt').strip(), '%Y-%m-%d %H:%M:%S'))
         else:
             self.logger.warn('获取帖子{}精华请求失败！返回code是{}'.format(topic['id'], code))
-            topic['mark_elite_by'] = None
-            topic['mark_elite_datetime'] = None
         topic['scraped_datetime'] = datetime.utcnow().strftime(self.settings.get('DATETIME_FORMAT'))
         yield topic
 
-        bonus = DPBonus()  # 帖子加分
-        scores_url = 'http://s.dianping.com/ajax/json/group/note/scorelist?noteId=' + str(topic['id'])
-        res = requests.get(scores_url, headers={
-            'User-Agent': self.user_agent.random,
-            'Host': 's.dianping.com',
-            'Origin': 'http://s.dianping.com',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': 'http://s.dianping.com/topic/%d?utm_source=forum_pc_tribe' % topic['id']})
-        res = json.loads(res.text)
-        code = res['code']
+    def topic_oplog_failed(self, failure):
+        # topic is still saved, without elite info
+        topic = failure.request.meta['topic']
+        self.logger.warn('获取帖子{}精华请求失败！{}'.format(topic['id'], repr(failure.value)))
+        topic['mark_elite_by'] = None
+        topic['mark_elite_datetime'] = None
+        topic['scraped_datetime'] = datetime.utcnow().strftime(self.settings.get('DATETIME_FORMAT'))
+        yield topic
+
+    def parse_topic_scores(self, response):
+        topic_id = response.meta['topic_id']
+        code = get_value(response.text, ('code',))
         if code == 200:
             member_id_pattern = re.compile(r'/member/(\d+)')
-            for score in res['msg']['data']:
-                bonus['topic_id'] = topic['id']
+            for score in iter_array(response.text, ('msg', 'data')):
+                bonus = DPBonus()  # 帖子加分
+                bonus['topic_id'] = topic_id
                 bonus['member_id'] = re.findall(member_id_pattern, score['userlink'])[0]
                 bonus['points'] = int(score['score'])
                 bonus['reason'] = score['comment'].strip() if score['comment'] is not None else None
                 bonus['scraped_datetime'] = datetime.utcnow().strftime(self.settings.get('DATETIME_FORMAT'))
                 yield bonus
         else:
-            self.logger.warn('获取帖子{}加分请求失败！返回code是{}'.format(topic['id'], code))
-
-        # pagination for reviews
-        page_list = [1]
-        max_page = max(page_list + [int(page_str) for page_str in
-                                    response.xpath("//ul[@class='page-list']/li[@class='item']/a/text()").extract()])
-        for i in range(1, max_page + 1):
-            pos = response.url.find('?')
-            if pos != -1:
-                url = response.url[:pos] + '?pageno=%d' % i
-            else:
-                url = response.url + '?pageno=%d' % i
-            yield Request(url=url, callback=self.parse_review)
+            self.logger.warn('获取帖子{}加分请求失败！返回code是{}'.format(topic_id, code))
 
     def parse_review(self, response):
         self.logger.info('解析评论页 ' + response.url)
         id_pattern = re.compile(r'http://s.dianping.com/topic/(\d+).*')
         topic_id = int(re.findall(id_pattern, response.url)[0])
 
-        # parse review replies
-        review_reply_url = 'http://s.dianping.com/ajax/lolNote'
-        payload = {'followNoteIds': response.xpath("//ul[@class='reply-list']/li/@data-replyid").extract()}
-        res = requests.post(review_reply_url, data=payload, headers={
-            'User-Agent': self.user_agent.random,
-            'Host': 's.dianping.com',
-            'Origin': 'http://s.dianping.com',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': 'http://s.dianping.com/topic/%d?utm_source=forum_pc_tribe' % topic_id})
-        res = json.loads(res.text)
-        code = res['code']
-        if code == 200:
-            for review_id, replies in res['data'].items():
-                for reply in replies:
-                    review = DPReview()
-                    review['publish_datetime'] = self\
-                        ._convert_timezone(datetime.strptime(reply['addTimeStr'].strip(), '%Y-%m-%d %H:%M'))\
-                        .strftime(self.settings.get('DATETIME_FORMAT'))
-                    review['reply_to'] = int(review_id.strip())
-                    review['topic_id'] = topic_id
-                    review['num_likes'] = None
-                    review['id'] = reply['lolNoteId']
-                    review['author_id'] = reply['userId']
-                    review['content'] = reply['noteBody'].strip()
-                    review['scraped_datetime'] = datetime.utcnow().strftime(self.settings.get('DATETIME_FORMAT'))
-                    yield review
-        else:
-            self.logger.warn('获取帖子{}回复请求失败！返回code是{}'.format(topic_id, code))
+        # review replies are fetched by a chained request
+        reply_ids = response.xpath("//ul[@class='reply-list']/li/@data-replyid").extract()
+        if len(reply_ids) > 0:
+            yield FormRequest(url='http://s.dianping.com/ajax/lolNote',
+                              formdata={'followNoteIds': reply_ids},
+                              headers=self._ajax_headers(topic_id),
+                              callback=self.parse_review_replies,
+                              meta={'topic_id': topic_id})
 
         # parse reviews
-        replies = response.xpath("//ul[@class='reply-list']/li")
-        for reply in replies:
+        for fields in dianping.REPLY.extract_all(response):
             review = DPReview()
             review['topic_id'] = topic_id
-            review_id = reply.xpath("@data-replyid").extract_first()
-            review['id'] = int(review_id.strip()) if review_id is not None else None
-            author_id = reply.xpath("div[@class='item-r']/div[@class='l1 user-info']/a/@data-uid").extract_first()
-            review['author_id'] = int(author_id.strip()) if author_id is not None else None
+            review['id'] = fields['id']
+            review['author_id'] = fields['author_id']
             yield Request(url=self.member_url_prefix + str(review['author_id']),
                           cookies={'_lxsdk_cuid': '16a0e631ecec8-0f8406114d973-36697e04-140000-16a0e631ecec8',
                                    '_lxsdk': '16a0e631ecec8-0f8406114d973-36697e04-140000-16a0e631ecec8',
@@ -422,9 +429,7 @@ class DianpingCommunitySpider(CrawlSpider):
                                    '_lx_utm': 'utm_source%3Dforum_pc_tribe',
                                    '_lxsdk_s': '16a2c53249a-f3f-a9c-479%7C%7C29'},
                           callback=self.parse_member)
-            reply_time = reply\
-                .xpath("div[@class='item-r']/div[@class='l1 user-info']/span[@class='reply-time']/text()")\
-                .extract_first()
+            reply_time = fields['reply_time']
             m = re.match(r'.*?(\d+-\d+-\d+\s*\d+:\d+:\d+)|.*?([今昨前天]+).*(\d+:\d+:\d+)', reply_time)
             if m is not None:
                 reply_time = m.group(0)
@@ -449,14 +454,44 @@ class DianpingCommunitySpider(CrawlSpider):
                     review['publish_datetime'] = None
             else:
                 review['publish_datetime'] = None
-            content = reply.xpath("div[@class='item-r']/div[@class='l2']/div/text()").extract_first()
-            review['content'] = content.strip() if content is not None else None
-            num_likes = reply.xpath("div[@class='item-r']/div[@class='l3']/a[2]/text()").extract_first()
-            review['num_likes'] = int(num_likes) if num_likes is not None else None
+            review['content'] = fields['content']
+            review['num_likes'] = fields['num_likes']
             review['reply_to'] = None
             review['scraped_datetime'] = datetime.utcnow().strftime(self.settings.get('DATETIME_FORMAT'))
             yield review
 
+    def parse_review_replies(self, response):
+        topic_id = response.meta['topic_id']
+        code = get_value(response.text, ('code',))
+        if code == 200:
+            # replies are decoded per review as they are yielded
+            for review_id, replies in iter_object(response.text, ('data',)):
+                for reply in replies:
+                    review = DPReview()
+                    review['publish_datetime'] = self\
+                        ._convert_timezone(datetime.strptime(reply['addTimeStr'].strip(), '%Y-%m-%d %H:%M'))\
+                        .strftime(self.settings.get('DATETIME_FORMAT'))
+                    review['reply_to'] = int(review_id.strip())
+                    review['topic_id'] = topic_id
+                    review['num_likes'] = None
+                    review['id'] = reply['lolNoteId']
+                    review['author_id'] = reply['userId']
+                    review['content'] = reply['noteBody'].strip()
+                    review['scraped_datetime'] = datetime.utcnow().strftime(self.settings.get('DATETIME_FORMAT'))
+                    yield review
+        else:
+            self.logger.warn('获取帖子{}回复请求失败！返回code是{}'.format(topic_id, code))
+
+    @staticmethod
+    def _ajax_headers(topic_id: int) -> dict:
+        # User-Agent is set by RandomUserAgentMiddleware
+        return {
+            'Host': 's.dianping.com',
+            'Origin': 'http://s.dianping.com',
+            'X-Requested-With': 'XMLHttpRequest',
+            'Referer': 'http://s.dianping.com/topic/%d?utm_source=forum_pc_tribe' % topic_id
+        }
+
     def _convert_timezone(self, naive_dt: datetime, from_tz=pytz.timezone('Asia/Shanghai'), to_tz=pytz.utc) -> datetime:
         from_dt = from_tz.localize(naive_dt)
         return from_dt.astimezone(to_tz)
@@ -1,13 +1,19 @@
+import socket
 import simplejson
 import yaml
 from datetime import datetime
+from scrapy import signals
 from scrapy.spiders import Spider
 from scrapy.http import Request
 from scrapy.utils.request import request_fingerprint
+from WebScraper.consumerReviewsScraper.incremental import IncrementalCrawlMixin
 from WebScraper.consumerReviewsScraper.items.expedia import ExpediaHotelItem, ExpediaReviewItem
+from WebScraper.consumerReviewsScraper.json_stream import JSONPathError, iter_array
+from WebScraper.consumerReviewsScraper.models.expedia import ExpediaReview
+from WebScraper.consumerReviewsScraper.paging import PagePlanner, PageSizeController, QueryTemplate
 
 
-class ExpediaReviewSpider(Spider):
+class ExpediaReviewSpider(IncrementalCrawlMixin, Spider):
     name = 'expedia_hotel_reviews_spider'
 
     custom_settings = {
@@ -21,21 +27,38 @@ class ExpediaReviewSpider(Spider):
         'CRAWLER_PAUSE_SECONDS': 60,
         'RETRY_HTTP_CODES': [429],
 
+        # Review pages
+        'REVIEW_PAGES_IN_FLIGHT': 4,
+        'REVIEW_PAGE_MIN_SIZE': 50,
+        'REVIEW_PAGE_MAX_SIZE': 1000,
+        'REVIEW_PAGE_TARGET_LATENCY': 5.0,
+
         'DOWNLOADER_MIDDLEWARES': {
             'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
             'consumerReviewsScraper.middlewares.RandomUserAgentMiddleware': 400,
 
             'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
             'consumerReviewsScraper.middlewares.TooManyRequestsRetryMiddleware': 543,
+            'consumerReviewsScraper.distributed.SharedPolitenessMiddleware': 450,
 
             # 'rotating_proxies.middlewares.RotatingProxyMiddleware': 610,
             # 'rotating_proxies.middlewares.BanDetectionMiddleware': 620,
         },
 
         'SPIDER_MIDDLEWARES': {
+            'consumerReviewsScraper.distributed.DistributedSeedMiddleware': 5,
             # 'consumerReviewsScraper.middlewares.UpdateURLStatusMiddleware': 10,
         },
 
+        # Distributed crawl, enabled by `-s DISTRIBUTED=1`. Hotels are shared by processes through Redis, review
+        # pages of a hotel stay in the process that planned them. Every process keeps its own state file, named by
+        # DISTRIBUTED_WORKER_ID (host name by default), so give processes on one host their own IDs.
+        'SCHEDULER': 'consumerReviewsScraper.distributed.DistributedScheduler',
+        'DISTRIBUTED': False,
+        'DISTRIBUTED_STORE': 'consumerReviewsScraper.distributed.RedisStore',
+        'REDIS_URL': 'redis://localhost:6379/0',
+        'DISTRIBUTED_DOMAIN_DELAY': 0.5,
+
         'FEEDS': {
             '/Users/keliu/Developer/ConsumerReviews/reviews.csv': {
                 'format': 'csv',
@@ -51,7 +74,8 @@ class ExpediaReviewSpider(Spider):
         }
     }
 
-    NUM_REVIEWS_PER_REQUEST = 500
+    NUM_REVIEWS_PER_REQUEST = 500  # initial page size, tuned by observed latency and errors
+    GRAPHQL_URL = 'https://www.expedia.com/graphql'
     XPATH_REVIEW_COUNT = "//meta[@itemprop='reviewCount']/@content"
     XPATH_HOTEL_DESCRIPTION = "//div[@itemprop='description']/descendant::text()"
     XPATH_HOTEL_NEARBY = "//h4[contains(text(), \"What's nearby\")]/following-sibling::div//li/text()"
@@ -422,13 +446,49 @@ class ExpediaReviewSpider(Spider):
         }
         '''
 
-    def __init__(self, task_file, *args, **kwargs):
+    def __init__(self, task_file, state_file=None, *args, **kwargs):
         super(ExpediaReviewSpider, self).__init__(*args, **kwargs)
         with open(task_file) as stream:
             self.task_conf = yaml.safe_load(stream)
         self.hotels = self.task_conf['Hotels']
         self.logger.info(f'Scraping hotels from file {task_file}. {len(self.hotels)} hotels to scrape.')
 
+        # committed start index of every hotel, which an interrupted crawl resumes from
+        self.state_file = state_file
+        self.planner = None
+        self.hotel_pages = {}  # {hotel key: (hotel ID, hotel name, review count, referer)}
+
+        # query is serialized once, only hotel ID, start index and page size are rendered per page
+        self.review_query = QueryTemplate(self.__review_payload(), {
+            'property_id': ('variables', 'propertyId'),
+            'start_index': ('variables', 'searchCriteria', 'secondary', 'counts', 0, 'value'),
+            'size': ('variables', 'searchCriteria', 'secondary', 'counts', 1, 'value')
+        })
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(ExpediaReviewSpider, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        return spider
+
+    def spider_opened(self, spider):
+        # planner is created when spider opens, as processes of a distributed crawl that do not seed it never run
+        # start_requests
+        if self.state_file is None:
+            if self.settings.getbool('DISTRIBUTED'):
+                worker_id = self.settings.get('DISTRIBUTED_WORKER_ID', None) or socket.gethostname()
+                self.state_file = f'{self.name}__state.{worker_id}.json'
+            else:
+                self.state_file = f'{self.name}__state.json'
+        self.planner = PagePlanner(
+            self.state_file,
+            budget=self.settings.getint('REVIEW_PAGES_IN_FLIGHT', 4),
+            controller=PageSizeController(initial=self.NUM_REVIEWS_PER_REQUEST,
+                                          min_size=self.settings.getint('REVIEW_PAGE_MIN_SIZE', 50),
+                                          max_size=self.settings.getint('REVIEW_PAGE_MAX_SIZE', 1000),
+                                          target_latency=self.settings.getfloat('REVIEW_PAGE_TARGET_LATENCY', 5.0)))
+        self.logger.info(f'Review pages are planned with state file {self.state_file}')
+
     def start_requests(self):
         for hotel in self.hotels:
             hotel_id = hotel['Id']
@@ -487,9 +547,123 @@ class ExpediaReviewSpider(Spider):
             introduction=hotel_description,
             created_datetime=datetime.utcnow())
 
-        graphql_payload = {
+        hotel_key = str(hotel_id)
+        start_index = self.planner.add(hotel_key, review_count)
+        if start_index > 0:
+            self.logger.info(f'Resuming hotel={hotel_name} from startIndex={start_index}')
+        self.hotel_pages[hotel_key] = (hotel_id, hotel_name, review_count, response.url)
+        yield from self.__next_review_pages()
+
+    def parse_graphql(self, response):
+        hotel_name = response.meta['hotel_name']
+        hotel_id = response.meta['hotel_id']
+        review_count = response.meta['review_count']
+        hotel_key = response.meta['hotel_key']
+        start_index = response.meta['start_index']
+        page_size = response.meta['page_size']
+        latency = response.meta.get('download_latency')
+        self.logger.info(f'''Parsing GraphQL response. Hotel={hotel_name}, Hotel_ID={hotel_id}, 
+                         ReviewCount={review_count}, StartIndex={start_index}, Size={page_size}''')
+
+        # reviews are decoded and yielded one by one, the page is never decoded as a whole
+        try:
+            reviews = iter_array(response.text, ('data', 'propertyInfo', 'reviewInfo', 'reviews'))
+        except JSONPathError:
+            self.logger.warn('Cannot get review data from GraphQL response. Response is %s' % response.text)
+            self.planner.fail(hotel_key, start_index, page_size, latency)
+            yield from self.__next_review_pages()
+            return
+
+        watermarks = self.watermarks
+        num_reviews = 0
+        all_known = True
+        # planner must hear back from every page it handed out, or its in-flight budget is used up
+        try:
+            for review in reviews:
+                num_reviews += 1
+                publish_datetime = datetime.strptime(review['submissionTime']['longDateFormat'].strip(), '%b %d, %Y')
+                if watermarks is not None:
+                    if watermarks.is_known(hotel_key, review['id'], publish_datetime):
+                        continue
+                    all_known = False
+                    watermarks.observe(hotel_key, review['id'], publish_datetime)
+
+                yield ExpediaReviewItem(
+                    review_id=review['id'],
+                    author=review['reviewAuthorAttribution']['text'],
+                    publish_datetime=publish_datetime,
+                    content=review['text'],
+                    created_datetime=datetime.utcnow(),
+                    overall_rating=review['reviewScoreWithDescription']['value'],
+                    num_helpful=review['reviewInteractionSections'][0]['primaryDisplayString'],
+                    stay_duration=review['stayDuration'],
+                    superlative=review['superlative'],
+                    themes=review['themes'][0]['label'] if review.get('themes') is not None else None,
+                    locale=review['locale'],
+                    travelers=review['travelers'],
+                    hotel_id=hotel_id)
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            self.logger.warn(f'Malformed review in GraphQL response. Hotel_ID={hotel_id}, StartIndex={start_index}, '
+                             f'Size={page_size}. {repr(err)}')
+            self.planner.fail(hotel_key, start_index, page_size, latency)
+            yield from self.__next_review_pages()
+            return
+
+        # a page with fewer reviews than requested is truncated, the rest of it is fetched again
+        completed = self.planner.finish(hotel_key, start_index, page_size, num_reviews, latency)
+        if watermarks is not None:
+            if all_known and num_reviews > 0:
+                # reviews are sorted from newest to oldest, so pages after this one have only known reviews too
+                self.logger.info(f'Reached known reviews of hotel={hotel_name} at startIndex={start_index}')
+                completed = self.planner.stop(hotel_key, start_index + num_reviews) or completed
+            if completed:
+                watermarks.commit(hotel_key)
+        yield from self.__next_review_pages()
+
+    def stored_newest_review(self, session, entity: str):
+        return session.query(ExpediaReview.publish_datetime, ExpediaReview.review_id) \
+                      .filter(ExpediaReview.hotel_id == int(entity)) \
+                      .order_by(ExpediaReview.publish_datetime.desc()) \
+                      .first()
+
+    def graphql_failed(self, failure):
+        meta = failure.request.meta
+        self.logger.warn(f'GraphQL request failed. Hotel_ID={meta["hotel_id"]}, StartIndex={meta["start_index"]}, '
+                         f'Size={meta["page_size"]}. {repr(failure.value)}')
+        self.planner.fail(meta['hotel_key'], meta['start_index'], meta['page_size'], meta.get('download_latency'))
+        yield from self.__next_review_pages()
+
+    def __next_review_pages(self):
+        for hotel_key, start_index, page_size in self.planner.next_pages():
+            hotel_id, hotel_name, review_count, referer = self.hotel_pages[hotel_key]
+            req = Request(url=self.GRAPHQL_URL, callback=self.parse_graphql, errback=self.graphql_failed,
+                          method='POST', dont_filter=True,
+                          body=self.review_query.render(property_id=hotel_key, start_index=start_index,
+                                                        size=page_size),
+                          headers={
+                              'Content-Type': 'application/json',
+                              'Origin': 'https://www.expedia.com',
+                              'Referer': referer,
+                              'client-info': 'blossom-flex-ui,24a01b4ad7639c53cf36cd06f88ce31f153e81c8,us-east-1',
+                          },
+                          meta={
+                              'hotel_name': hotel_name,
+                              'hotel_id': hotel_id,
+                              'hotel_key': hotel_key,
+                              'review_count': review_count,
+                              'start_index': start_index,
+                              'page_size': page_size,
+                              'local': True  # callback needs planner of this process
+                          })
+            req.meta['fp'] = request_fingerprint(req)
+            yield req
+
+    @classmethod
+    def __review_payload(cls) -> dict:
+        # propertyId, startIndex and size are slots of query template
+        return {
             'operationName': 'PropertyFilteredReviewsQuery',
-            'query': self.REVIEW_QUERY_STRING,
+            'query': cls.REVIEW_QUERY_STRING,
             'variables': {
                 'context': {
                     'siteId': 1,
@@ -510,7 +684,7 @@ class ExpediaReviewSpider(Spider):
                         'alterMode': 'RELEASED'
                     }
                 },
-                'propertyId': str(hotel_id),
+                'propertyId': None,
                 'searchCriteria': {
                     "primary": {
                         "dateRange": None,
@@ -539,7 +713,7 @@ class ExpediaReviewSpider(Spider):
                             },
                             {
                                 "id": "size",
-                                "value": self.NUM_REVIEWS_PER_REQUEST
+                                "value": None
                             }
                         ],
                         "selections": [
@@ -552,58 +726,3 @@ class ExpediaReviewSpider(Spider):
                 }
             }
         }
-
-        # get default category
-        for start_index in range(0, review_count, self.NUM_REVIEWS_PER_REQUEST):
-            self.__set_start_index_in_payload(graphql_payload, start_index)
-            req = Request(url='https://www.expedia.com/graphql', callback=self.parse_graphql, method='POST',
-                          body=simplejson.dumps(graphql_payload),
-                          headers={
-                              'Content-Type': 'application/json',
-                              'Origin': 'https://www.expedia.com',
-                              'Referer': response.url,
-                              'client-info': 'blossom-flex-ui,24a01b4ad7639c53cf36cd06f88ce31f153e81c8,us-east-1',
-                          },
-                          meta={
-                              'hotel_name': hotel_name,
-                              'hotel_id': hotel_id,
-                              'review_count': review_count,
-                              'start_index': start_index
-                          })
-            req.meta['fp'] = request_fingerprint(req)
-            # self.logger.info(f'===debug===\n{simplejson.dumps(graphql_payload)}')
-            yield req
-
-    def parse_graphql(self, response):
-        hotel_name = response.meta['hotel_name']
-        hotel_id = response.meta['hotel_id']
-        review_count = response.meta['review_count']
-        start_index = response.meta['start_index']
-        json = simplejson.loads(response.text)
-        self.logger.info(f'''Parsing GraphQL response. Hotel={hotel_name}, Hotel_ID={hotel_id}, 
-                         ReviewCount={review_count}, StartIndex={start_index}''')
-
-        if json.get('data', None) is None:
-            self.logger.warn('Cannot get review data from GraphQL response. Response is %s' % json)
-            return
-
-        for review in json['data']['propertyInfo']['reviewInfo']['reviews']:
-            yield ExpediaReviewItem(
-                review_id=review['id'],
-                author=review['reviewAuthorAttribution']['text'],
-                publish_datetime=datetime.strptime(
-                    review['submissionTime']['longDateFormat'].strip(),
-                    '%b %d, %Y'),
-                content=review['text'],
-                created_datetime=datetime.utcnow(),
-                overall_rating=review['reviewScoreWithDescription']['value'],
-                num_helpful=review['reviewInteractionSections'][0]['primaryDisplayString'],
-                stay_duration=review['stayDuration'],
-                superlative=review['superlative'],
-                themes=review['themes'][0]['label'] if review.get('themes') is not None else None,
-                locale=review['locale'],
-                travelers=review['travelers'],
-                hotel_id=hotel_id)
-
-    def __set_start_index_in_payload(self, payload: dict, start_index: int) -> None:
-        payload['variables']['searchCriteria']['secondary']['counts'][0]['value'] = start_index
@@ -6,6 +6,7 @@ from fake_useragent import UserAgent
 from scrapy.http import Request
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
+from ..extractors import hyouban
 from ..items.hyouban import HyoubanReview
 
 
@@ -112,6 +113,13 @@ class HyoubanReviewSpider(CrawlSpider):
             # 'rotating_proxies.middlewares.RotatingProxyMiddleware': 610,
             # 'rotating_proxies.middlewares.BanDetectionMiddleware': 620,
         },
+
+        # pending requests are kept on disk, so an interrupted crawl resumes where it stopped
+        'SCHEDULER': 'consumerReviewsScraper.frontier.FrontierScheduler',
+        'SPIDER_MIDDLEWARES': {
+            'consumerReviewsScraper.frontier.FrontierMiddleware': 10,
+        },
+        'FRONTIER_DIR': 'frontier',
     }
 
     start_urls = [
@@ -186,30 +194,17 @@ class HyoubanReviewSpider(CrawlSpider):
     def parse_reviews(self, response):
         self.logger.info('解析评论页 ' + response.url)
 
-        for div in response.xpath("//div[contains(@class, 'kuchikomi--')]"):
-            div = div.xpath("div[@class='box']")
-            subject_div = div.xpath("div[@class='subject']")
-            comment_div = div.xpath("div[@class='comment']")
-            
+        for fields in hyouban.REVIEW.extract_all(response):
             review = HyoubanReview()
-            review['attitude'] = subject_div.xpath("div[@class='label']/text()").get()
+            review['attitude'] = fields['attitude']
             review['company_id'] = response.meta['company_id']
             review['company'] = response.meta['company_name']
-            review['review_id'] = int(re.findall(r'/company/\d+/kuchikomi/(\d+).*', 
-                                      comment_div.xpath("div[1]/a[1]/@href").get())[0])
-            category_id = int(re.findall(r'title title--(\d+).*', comment_div.xpath("div[1]/@class").get())[0])
-            review['category'] = response.meta['categories'][category_id]
-            review['content'] = ''.join(comment_div.xpath("text()").getall()).strip()
-            review['status'] = comment_div.xpath("div[@class='status']/a/text()").get()
-            publish_date_str_match = re.findall(r'口コミ投稿日：(.*).*', 
-                                                ''.join(comment_div.xpath("div[@class='status']/text()").getall()).strip())
-            publish_date_str = publish_date_str_match[0] if len(publish_date_str_match) > 0 else 'n/a'
-            if publish_date_str != 'n/a':
-                publish_date = datetime.strptime(publish_date_str.strip(), '%Y年%m月%d日')
-            else:
-                publish_date = ''
+            review['review_id'] = fields['review_id']
+            review['category'] = response.meta['categories'][fields['category_id']]
+            review['content'] = fields['content']
+            review['status'] = fields['status']
             # review['publish_date'] = pytz.timezone('Asia/Shanghai').localize(publish_date).astimezone(pytz.utc)
-            review['publish_date'] = publish_date
-            review['num_helpful'] = int(comment_div.xpath("span/span/span/text()").get())
+            review['publish_date'] = fields['publish_date']
+            review['num_helpful'] = fields['num_helpful']
             review['created_datetime'] = datetime.utcnow()
             yield review
@@ -2,10 +2,13 @@ import re
 from datetime import datetime
 import uuid
 import scrapy
+from ..extractors import kbb
+from ..extractors.base import first
+from ..incremental import IncrementalCrawlMixin
 from ..items.kbb import KBBReviewItem
 
 
-class KBBReviewSpider(scrapy.Spider):
+class KBBReviewSpider(IncrementalCrawlMixin, scrapy.Spider):
     """
     Spider to scrape reviews from kbb.com.
     """
@@ -55,73 +58,54 @@ class KBBReviewSpider(scrapy.Spider):
     def parse(self, response):
         self.logger.info('Parsing page ' + response.url)
 
-        ymm = response.xpath("//h1/span[@class='vehicle-ymm']/text()").extract_first().split()
+        page = kbb.PAGE.extract(response)
+        ymm = page['ymm'].split()
         year = ymm[0]
         make = ymm[1]
         model = ' '.join(ymm[2:])
+        vehicleId = re.search(r'vehicleid=(\d+)', response.url).group(1)
+        watermarks = self.watermarks
+        allKnown = watermarks is not None
 
-        reviewSelectors = response.xpath("//div[@class='review-section']")
+        # fields of every review section are evaluated by XPaths compiled once
+        reviewSelectors = kbb.REVIEW.blocks(response)
         for selector in reviewSelectors:
-            nDivs = len(selector.xpath('div'))
-            if nDivs == 4:
-                headerDiv = selector.xpath('div[1]')
-                recommendDiv = selector.xpath('div[2]')
-                contentDiv = selector.xpath('div[3]')
-            elif nDivs == 3:
-                headerDiv = selector.xpath('div[1]')
-                recommendDiv = None
-                contentDiv = selector.xpath('div[2]')
-            else:
-                headerDiv, recommendDiv, contentDiv = None, None, None
-
-            title = headerDiv.xpath('h2/text()').extract_first()
-            author = headerDiv.xpath("p[@class='with-sub']/span/text()").extract_first()
-            date = headerDiv.xpath("meta/@content").extract_first()
+            fields = kbb.REVIEW.extract(selector)
+            title = fields['title']
+            author = fields['author']
+            date = fields['date']
 
             self.logger.info('Processing title={}, author={}, date={}'.format(title, author, date))
 
-            mileage = -1
-            mileageStr = headerDiv.xpath("p[@class='duration']/strong/text()").extract_first().strip()
-            mileageMatch = re.match('.*approximate mileage is ([\d,]+)', mileageStr)
-            if mileageMatch:
-                mileage = int(mileageMatch.groups()[0].replace(',', ''))
-
-            scoreCard = headerDiv.xpath("div[@class='score-card']/dl")
-            NA = 'Not Rated'
-            ratingList = scoreCard.xpath("dd/span/text()").extract()
-            overall = 0 if ratingList[0].strip() == NA else int(ratingList[0].strip().split('/')[0])
-            value = 0 if ratingList[1].strip() == NA else int(ratingList[1].strip().split('/')[0])
-            reliability = 0 if ratingList[2].strip() == NA else int(ratingList[2].strip().split('/')[0])
-            quality = 0 if ratingList[3].strip() == NA else int(ratingList[3].strip().split('/')[0])
-            performance = 0 if ratingList[4].strip() == NA else int(ratingList[4].strip().split('/')[0])
-            styling = 0 if ratingList[5].strip() == NA else int(ratingList[5].strip().split('/')[0])
-            comfort = 0 if ratingList[6].strip() == NA else int(ratingList[6].strip().split('/')[0])
+            mileage = fields['mileage']
+            overall, value, reliability, quality, performance, styling, comfort = fields['ratings'][:7]
 
             pros, cons = '', ''
             nRecommend = -1
             nRecommendOutOf = -1
-            if recommendDiv:
-                pTags = recommendDiv.xpath('p')
+            if fields['num_divs'] == 4:
+                pTags = fields['recommend_paragraphs']
 
                 if len(pTags) == 3:
-                    proStr = ' '.join([x.strip() for x in pTags[0].xpath('text()').extract() if len(x.strip()) > 0])
+                    proStr = ' '.join([x.strip() for x in kbb.TEXT(pTags[0]) if len(x.strip()) > 0])
                     pros = proStr[1:-1]
 
-                    conStr = ' '.join([x.strip() for x in pTags[1].xpath('text()').extract() if len(x.strip()) > 0])
+                    conStr = ' '.join([x.strip() for x in kbb.TEXT(pTags[1]) if len(x.strip()) > 0])
                     cons = conStr[1:-1]
 
-                    recommendStr = pTags[-1].xpath('text()').extract_first()
+                    recommendStr = first(kbb.TEXT, pTags[-1])
                 elif len(pTags) == 2:
                     proConTag = pTags[0]
-                    proConStr = ' '.join([x.strip() for x in proConTag.xpath('text()').extract() if len(x.strip()) > 0])
-                    if 'Pros' in proConTag.xpath('span/strong/text()').extract_first():
+                    proConStr = ' '.join([x.strip() for x in kbb.TEXT(proConTag) if len(x.strip()) > 0])
+                    label = first(kbb.LABEL, proConTag)
+                    if 'Pros' in label:
                         pros = proConStr[1:-1]
-                    elif 'Cons' in proConTag.xpath('span/strong/text()').extract_first():
+                    elif 'Cons' in label:
                         cons = proConStr[1:-1]
 
-                    recommendStr = pTags[-1].xpath('text()').extract_first()
+                    recommendStr = first(kbb.TEXT, pTags[-1])
                 elif len(pTags) == 1:
-                    recommendStr = recommendDiv.xpath("p/text()").extract_first()
+                    recommendStr = first(kbb.TEXT, pTags[0])
                 else:
                     recommendStr = None
 
@@ -132,15 +116,15 @@ class KBBReviewSpider(scrapy.Spider):
 
             content = ''
             nHelpful, nHelpfulOutOf = -1, -1
-            if contentDiv:
-                content = contentDiv.xpath("p[@class='review-text']/text()").extract_first().strip()[1:-1]
+            if fields['num_divs'] in (3, 4):
+                content = fields['content'][1:-1]
                 if content == 'This customer did not provide a text review.'[1:-1]:
                     content = ''
 
-                helpful = contentDiv.xpath("p[@class='helpful-count']/strong/text()").extract()
+                helpful = fields['helpful']
                 if helpful:
-                    nHelpful = int(helpful[0])
-                    nHelpfulOutOf = int(helpful[1])
+                    nHelpful = helpful[0]
+                    nHelpfulOutOf = helpful[1]
 
             review = KBBReviewItem()
             review['author'] = author
@@ -171,9 +155,21 @@ class KBBReviewSpider(scrapy.Spider):
             review['tags'].append(year)
             review['tags'].append(make)
             review['tags'].append(model)
+
+            # reviews have no ID, fingerprint identifies the newest review of watermark
+            if watermarks is not None:
+                if watermarks.is_known(vehicleId, review['fingerprint'], date):
+                    continue
+                allKnown = False
+                watermarks.observe(vehicleId, review['fingerprint'], date)
             yield review
 
-        nextPage = response.xpath("//div[@class='pages']/a[@class='pagerLink pager-next']/@href").extract_first()
-        if nextPage:
+        allKnown = allKnown and len(reviewSelectors) > 0
+        if allKnown:
+            self.logger.info('Reached known reviews of vehicle {}'.format(vehicleId))
+        nextPage = page['next_page']
+        if nextPage and not allKnown:
             nextPage = response.urljoin(nextPage).strip()
             yield scrapy.Request(url=nextPage, callback=self.parse)
+        elif watermarks is not None:
+            watermarks.commit(vehicleId)  # pagination of vehicle stopped
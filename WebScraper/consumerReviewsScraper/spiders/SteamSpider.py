@@ -5,10 +5,11 @@ from scrapy.selector import SelectorList
 from scrapy.http import Request
 from scrapy.spiders import Spider
 from scrapy.utils.request import request_fingerprint
+from WebScraper.consumerReviewsScraper.entity_cache import EntityCacheMixin
 from WebScraper.consumerReviewsScraper.items.steam import SteamUserProfileItem
 
 
-class SteamSpider(Spider):
+class SteamSpider(EntityCacheMixin, Spider):
     name = 'steam_spider'
 
     custom_settings = {
@@ -34,6 +35,10 @@ class SteamSpider(Spider):
         'SPIDER_MIDDLEWARES': {
             'consumerReviewsScraper.middlewares.UpdateURLStatusMiddleware': 10,
         },
+
+        # a profile is requested again only if it was fetched more than a week ago
+        'ENTITY_CACHE_DIR': 'entity_cache',
+        'ENTITY_CACHE_TTL': 3600 * 24 * 7,
     }
 
     start_urls = ['https://steamcommunity.com/id/rushingtotheend',
@@ -195,12 +200,29 @@ class SteamSpider(Spider):
             num_comments_by_others=num_comments_by_others,
             created_datetime=datetime.utcnow(),
         )
+        self.entity_cache.fetched('profile', self._profile_key(response.url))
         yield profile
 
     def parse_friends(self, response):
         self.logger.info('解析朋友页 ' + response.url)
-        
+        for url in response.xpath("//div[contains(@class, 'friend_block_v2')]/a[@class='selectable_overlay']/@href")\
+                           .getall():
+            key = self._profile_key(url)
+            # friends shared by many users are requested once, and again only when their profile is stale
+            if key is None or not self.should_fetch('profile', key):
+                continue
+            req = Request(url=url, callback=self.parse)
+            req.meta['fp'] = request_fingerprint(req)
+            yield req
+
+    @staticmethod
+    def _profile_key(url: str) -> Optional[str]:
+        """
+        Key of a profile from its URL, e.g. "id/DashWithIt" or "profiles/76561197969749884".
+        """
 
+        match = re.search(r'steamcommunity\.com/((?:id|profiles)/[^/?#]+)', url)
+        return match[1] if match is not None else None
 
     def _extract_int(self, selector) -> Optional[int]:
         if selector is None:
@@ -1,10 +1,10 @@
-import json
 from datetime import datetime
 from typing import Optional, Union
 from scrapy.http import Request
 from scrapy.spiders import Spider
 from scrapy.utils.request import request_fingerprint
 from WebScraper.consumerReviewsScraper.items.university import UniversityRankingItem
+from WebScraper.consumerReviewsScraper.json_stream import iter_array
 
 
 class TopUniversitiesSpider(Spider):
@@ -85,8 +85,7 @@ class TopUniversitiesSpider(Spider):
     def parse(self, response):
         self.logger.info('Parsing ranking page={}, year={}'.format(response.url, response.meta['year']))
         text = response.body.decode(self.default_charset)
-        data = json.loads(text)
-        for uni in data['data']:
+        for uni in iter_array(text, ('data',)):
             yield UniversityRankingItem(
                 year=response.meta['year'],
                 subject=response.meta['subject'],
@@ -1,8 +1,11 @@
+import re
 import scrapy
+from datetime import datetime
+from ..incremental import IncrementalCrawlMixin
 from ..items.tripadvisor import TripAdvisorReviewItem
 
 
-class TripAdvisorReviewSpider(scrapy.Spider):
+class TripAdvisorReviewSpider(IncrementalCrawlMixin, scrapy.Spider):
     name = "tripadvisor_portillos"
 
     def start_requests(self):
@@ -15,6 +18,9 @@ class TripAdvisorReviewSpider(scrapy.Spider):
 
     def parse(self, response):
         selectors = response.xpath("//div[starts-with(@id, 'review_')]")
+        restaurant_id = re.search(r'-d(\d+)-', response.url).group(1)
+        watermarks = self.watermarks
+        all_known = watermarks is not None and len(selectors) > 0
 
         for selector in selectors:
             review = TripAdvisorReviewItem()
@@ -49,8 +55,39 @@ class TripAdvisorReviewSpider(scrapy.Spider):
             val = member_badging.xpath("div/span[@class='badgeText']")
             if len(val) > 0:
                 review["helpful_votes"] = int(val.xpath("text()").re(r"(\d+)\s*helpful")[0])
+
+            if watermarks is not None:
+                review_id = selector.xpath("@id").re_first(r"review_(\d+)")
+                publish_datetime = self._parse_date(review["date"])
+                if watermarks.is_known(restaurant_id, review_id, publish_datetime):
+                    continue
+                all_known = False
+                watermarks.observe(restaurant_id, review_id, publish_datetime)
             yield review
 
         next_urls = response.xpath("//div[@class='unified pagination ']/descendant::a/@href").extract()
-        for url in next_urls:
-            yield scrapy.Request(url="https://www.tripadvisor.com" + url.strip(), callback=self.parse)
+        if watermarks is None:
+            for url in next_urls:
+                yield scrapy.Request(url="https://www.tripadvisor.com" + url.strip(), callback=self.parse)
+            return
+
+        # incremental crawl follows pages one by one from the newest, until a page has only known reviews
+        offset = self._page_offset(response.url)
+        later_urls = sorted((self._page_offset(url), url.strip()) for url in next_urls
+                            if self._page_offset(url) > offset)
+        if not all_known and len(later_urls) > 0:
+            yield scrapy.Request(url="https://www.tripadvisor.com" + later_urls[0][1], callback=self.parse)
+        else:
+            watermarks.commit(restaurant_id)  # pagination of restaurant stopped
+
+    @staticmethod
+    def _page_offset(url: str) -> int:
+        match = re.search(r"-or(\d+)-", url)
+        return int(match.group(1)) if match is not None else 0
+
+    @staticmethod
+    def _parse_date(value: str):
+        try:
+            return datetime.strptime(value.strip(), "%B %d, %Y")
+        except (AttributeError, ValueError):
+            return None
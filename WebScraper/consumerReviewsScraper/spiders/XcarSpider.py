@@ -5,10 +5,12 @@ from fake_useragent import UserAgent
 from scrapy.http import Request
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
+from ..entity_cache import EntityCacheMixin
+from ..extractors import xcar
 from ..items.xcar import *
 
 
-class XcarForumSpider(CrawlSpider):
+class XcarForumSpider(EntityCacheMixin, CrawlSpider):
     """ Spider to scrape forums at xcar.com.cn """
 
     name = 'xcar_forum_spider'
@@ -109,6 +111,26 @@ class XcarForumSpider(CrawlSpider):
             # 'rotating_proxies.middlewares.RotatingProxyMiddleware': 610,
             # 'rotating_proxies.middlewares.BanDetectionMiddleware': 620,
         },
+
+        # pending requests are kept on disk, so an interrupted crawl resumes where it stopped
+        'SCHEDULER': 'consumerReviewsScraper.frontier.FrontierScheduler',
+        'SPIDER_MIDDLEWARES': {
+            'consumerReviewsScraper.frontier.FrontierMiddleware': 10,
+            'consumerReviewsScraper.yield_priority.YieldPriorityMiddleware': 50,
+        },
+        'FRONTIER_DIR': 'frontier',
+
+        # requests of callbacks yielding more posts per second go first, user profiles last
+        'YIELD_ITEM_WEIGHTS': {
+            'XcarPost': 1.0,
+            'XcarThread': 0.5,
+            'XcarForum': 0.1,
+            'XcarUser': 0.1,
+        },
+
+        # a user profile is requested again only if it was fetched more than a week ago
+        'ENTITY_CACHE_DIR': 'entity_cache',
+        'ENTITY_CACHE_TTL': 3600 * 24 * 7,
     }
 
     start_urls = [
@@ -149,6 +171,8 @@ class XcarForumSpider(CrawlSpider):
         yield forum
 
         for url in manager_urls:
+            if not self.should_fetch('user', re.findall(r'.*uid=(\d+).*', url)[0]):
+                continue
             yield Request(url=url, callback=self.parse_user,
                           meta={
                               'manage': forum['fid']},
@@ -167,13 +191,11 @@ class XcarForumSpider(CrawlSpider):
                               '_fwck_my': '5ccd62d46ca3cf8378abc412a985f3b5',
                               '_appuv_my': '610527e88f1d625fe42138e789c893b9'})
 
-        for thread in response.xpath("//dl[@class='list_dl']"):
-            url = thread.xpath("dt/p[@class='thenomal']/a[@class='titlink']/@href").get()
-            num_replies, num_views = tuple(thread.xpath("dd[@class='cli_dd']/span/text()").getall())
-            yield Request(url='http://www.xcar.com.cn' + url, callback=self.parse_thread,
+        for thread in xcar.THREAD.extract_all(response):
+            yield Request(url='http://www.xcar.com.cn' + thread['url'], callback=self.parse_thread,
                           meta={
-                              'num_replies': int(num_replies),
-                              'num_views': int(num_views)},
+                              'num_replies': thread['num_replies'],
+                              'num_views': thread['num_views']},
                           headers={
                               'User-Agent': self.user_agent.random,
                               'Host': 'www.xcar.com.cn',
@@ -222,6 +244,7 @@ class XcarForumSpider(CrawlSpider):
         user['num_fans'] = int(numbers[1].strip())
         user['num_posts'] = int(numbers[2].strip())
         user['created_datetime'] = datetime.utcnow()
+        self.entity_cache.fetched('user', user['uid'])
         yield user
 
     def parse_thread(self, response):
@@ -238,45 +261,40 @@ class XcarForumSpider(CrawlSpider):
         thread['created_datetime'] = datetime.utcnow()
         yield thread
 
-        for _post in response.xpath("//div[@class='main item']"):
+        for fields in xcar.POST.extract_all(response):
             # process user
-            user_info = _post.xpath("descendant::div[@class='userside']")
-            user_url = user_info.xpath("div[@class='user_info']/p[@class='name']/a/@href").get()
-            user_coin = self._translate_coin(user_info.xpath("descendant::li[@class='akb']/em/text()").get().strip())
-            register_dt_str = user_info.xpath("descendant::p[@class='ursr_info']/span/text()").get()
-            register_dt = datetime.strptime(register_dt_str.strip(), '%Y-%m-%d').date()
-            yield Request(url=user_url, callback=self.parse_user,
-                          meta={
-                              'coin': user_coin,
-                              'register_date': register_dt},
-                          headers={
-                              'User-Agent': self.user_agent.random,
-                              'Host': 'my.xcar.com.cn',
-                              'Referer': response.url},
-                          cookies={
-                              '_discuz_uid': 17502059,
-                              'bbs_auth': 'VxvjtVV4%2BEBYZi9w75NEsF45437ZvB%2FrPnXfu5bfVSsNizKksOtXpobRKkWjalhECjU',
-                              'bbs_cookietime': 31536000,
-                              'bbs_visitedfid': '741D738D39',
-                              '_fuv': 5603160404768,
-                              '_fwck_www': '7b015af75e43be59766bb70bb0b9f7fe',
-                              '_appuv_www': 'a9a3380ae18b10bfc7685cd81f612bf6',
-                              '_fwck_my': '5ccd62d46ca3cf8378abc412a985f3b5',
-                              '_appuv_my': '610527e88f1d625fe42138e789c893b9'})
+            user_url = fields['user_url']
+            author = int(re.findall(r'.*uid=(\d+)', user_url)[0])
+            # profile of an author of many posts is requested once, and again only when it is stale
+            if self.should_fetch('user', author):
+                yield Request(url=user_url, callback=self.parse_user,
+                              meta={
+                                  'coin': self._translate_coin(fields['coin']),
+                                  'register_date': fields['register_date']},
+                              headers={
+                                  'User-Agent': self.user_agent.random,
+                                  'Host': 'my.xcar.com.cn',
+                                  'Referer': response.url},
+                              cookies={
+                                  '_discuz_uid': 17502059,
+                                  'bbs_auth': 'VxvjtVV4%2BEBYZi9w75NEsF45437ZvB%2FrPnXfu5bfVSsNizKksOtXpobRKkWjalhECjU',
+                                  'bbs_cookietime': 31536000,
+                                  'bbs_visitedfid': '741D738D39',
+                                  '_fuv': 5603160404768,
+                                  '_fwck_www': '7b015af75e43be59766bb70bb0b9f7fe',
+                                  '_appuv_www': 'a9a3380ae18b10bfc7685cd81f612bf6',
+                                  '_fwck_my': '5ccd62d46ca3cf8378abc412a985f3b5',
+                                  '_appuv_my': '610527e88f1d625fe42138e789c893b9'})
 
             # process post
             post = XcarPost()
-            post['pid'] = int(_post.xpath("a/@name").re_first(r'pid(\d+)'))
+            post['pid'] = fields['pid']
             self.logger.info('解析评论 pid={}, tid={}'.format(post['pid'], thread['tid']))
-            publish_dt_str = _post.xpath("descendant::div[@class='mainboxTop']/p/text()")\
-                .re_first(r'.*发表于\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\s*')
-            publish_dt = datetime.strptime(publish_dt_str.strip(), '%Y-%m-%d %H:%M')
-            post['publish_datetime'] = pytz.timezone('Asia/Shanghai').localize(publish_dt).astimezone(pytz.utc)
-            post['content'] = ' '.join(_post.xpath("descendant::div[@class='t_msgfont1']/descendant::*/text()")
-                                       .getall()).strip()
+            post['publish_datetime'] = pytz.timezone('Asia/Shanghai').localize(fields['publish']).astimezone(pytz.utc)
+            post['content'] = fields['content']
             post['created_datetime'] = datetime.utcnow()
-            post['is_flag'] = True if _post.xpath("descendant::span[@class='t_title1']") is not None else False
-            post['author'] = int(re.findall(r'.*uid=(\d+)', user_url)[0])
+            post['is_flag'] = fields['is_flag']
+            post['author'] = author
             post['thread'] = thread['tid']
             yield post
 
@@ -0,0 +1,177 @@
+import logging
+from scrapy import signals
+from scrapy.http import Request
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def _callback_name(request) -> str:
+    callback = request.callback
+    if callback is None:
+        return 'parse'
+    if isinstance(callback, str):
+        return callback
+    return getattr(callback, '__name__', str(callback))
+
+
+class CallbackYield(object):
+    """
+    Smoothed yield of requests of one callback: weighted # of items and # of follow-up requests per callback
+    per response, and download latency.
+    """
+
+    def __init__(self):
+        self.responses = 0
+        self.items = 0
+        self.requests = 0
+        self.item_rate = 0.0  # weighted items per response
+        self.children = {}  # {callback name: follow-up requests per response}
+        self.latency = None  # seconds per response
+        self.value = 0.0  # expected weighted items per response, including those of follow-up requests
+        self.priority = 0
+
+
+class YieldStats(object):
+    """
+    Yield of requests per callback, learned from responses, and the priority it earns to requests of a callback.
+
+    Value of a callback is its weighted items per response plus the discounted value of its follow-up requests,
+    looked ahead `horizon` levels, so listing pages are worth the reviews they lead to. Callbacks are ranked by value
+    per second of download latency and given priorities from 0 to `priority_range`. Callbacks never seen get the
+    top priority, so their yield is learned early.
+    """
+
+    def __init__(self, item_weights: Dict[str, float] = None, priority_range=100, discount=0.02, horizon=2,
+                 smoothing=0.1):
+        """
+        :param item_weights: {item class name: weight}. Weight of items of other classes is 1.
+        :param priority_range: priority of callbacks of the best yield per second.
+        :param discount: weight of items of follow-up requests relative to items of the request itself.
+        :param horizon: # of levels of follow-up requests counted in value of a callback.
+        :param smoothing: weight of the latest response in exponential moving averages.
+        """
+
+        self.item_weights = item_weights if item_weights is not None else {}
+        self.priority_range = priority_range
+        self.discount = discount
+        self.horizon = horizon
+        self.smoothing = smoothing
+        self.callbacks = {}  # {callback name: CallbackYield}
+
+    def observe(self, callback: str, items: Dict[str, int], children: Dict[str, int], latency: float = None):
+        """
+        Record the output of a response.
+        :param callback: callback name of response.
+        :param items: {item class name: # of items returned}.
+        :param children: {callback name: # of requests returned}.
+        :param latency: download latency of response in seconds. None if unknown.
+        """
+
+        stats = self.callbacks.setdefault(callback, CallbackYield())
+        for name in children:
+            self.callbacks.setdefault(name, CallbackYield())
+        s = self.smoothing if stats.responses > 0 else 1.0
+        stats.responses += 1
+        stats.items += sum(items.values())
+        stats.requests += sum(children.values())
+
+        weighted = sum(self.item_weights.get(name, 1.0) * n for name, n in items.items())
+        stats.item_rate = (1 - s) * stats.item_rate + s * weighted
+        for name in set(stats.children) | set(children):
+            stats.children[name] = (1 - s) * stats.children.get(name, 0.0) + s * children.get(name, 0)
+        if latency is not None:
+            stats.latency = latency if stats.latency is None else (1 - s) * stats.latency + s * latency
+        self._update_priorities()
+
+    def priority(self, callback: str) -> int:
+        stats = self.callbacks.get(callback, None)
+        if stats is None or stats.responses == 0:
+            return self.priority_range
+        return stats.priority
+
+    def _update_priorities(self):
+        values = {name: stats.item_rate for name, stats in self.callbacks.items()}
+        for _ in range(self.horizon):
+            values = {
+                name: stats.item_rate + self.discount * sum(n * values[child] for child, n in stats.children.items())
+                for name, stats in self.callbacks.items()
+            }
+
+        latencies = [stats.latency for stats in self.callbacks.values() if stats.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if len(latencies) > 0 else 1.0
+        rates = {}
+        for name, stats in self.callbacks.items():
+            stats.value = values[name]
+            if stats.responses > 0:
+                latency = stats.latency if stats.latency is not None else default_latency
+                rates[name] = stats.value / max(latency, 1e-3)
+
+        best = max(rates.values()) if len(rates) > 0 else 0.0
+        for name, rate in rates.items():
+            self.callbacks[name].priority = int(round(self.priority_range * rate / best)) if best > 0 else 0
+
+
+class YieldPriorityMiddleware(object):
+    """
+    Spider middleware raising priority of requests by the expected item yield per second of their callback, e.g.
+    thread pages before user profiles, and exposing yield of every callback in crawl stats as
+    "yield/<callback>/...". The learned priority is added to the priority a request is created with.
+
+    Enable it in spider settings:
+        'SPIDER_MIDDLEWARES': {'consumerReviewsScraper.yield_priority.YieldPriorityMiddleware': 50},
+        'YIELD_ITEM_WEIGHTS': {'XcarPost': 1.0, 'XcarUser': 0.1},
+    Optional settings are YIELD_PRIORITY_RANGE, YIELD_DISCOUNT, YIELD_HORIZON and YIELD_SMOOTHING.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.yields = YieldStats(item_weights=settings.getdict('YIELD_ITEM_WEIGHTS'),
+                                 priority_range=settings.getint('YIELD_PRIORITY_RANGE', 100),
+                                 discount=settings.getfloat('YIELD_DISCOUNT', 0.02),
+                                 horizon=settings.getint('YIELD_HORIZON', 2),
+                                 smoothing=settings.getfloat('YIELD_SMOOTHING', 0.1))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = cls(crawler)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def process_spider_output(self, response, result, spider):
+        items, children = {}, {}
+        for r in result:
+            if isinstance(r, Request):
+                name = _callback_name(r)
+                children[name] = children.get(name, 0) + 1
+                r.priority += self.yields.priority(name)
+            else:
+                name = r.__class__.__name__
+                items[name] = items.get(name, 0) + 1
+            yield r
+
+        callback = _callback_name(response.request)
+        self.yields.observe(callback, items, children, latency=response.meta.get('download_latency', None))
+        self._update_stats(callback, spider)
+
+    def spider_closed(self, spider):
+        for name in sorted(self.yields.callbacks, key=lambda n: -self.yields.callbacks[n].priority):
+            stats = self.yields.callbacks[name]
+            logger.info('Yield of {}: {} responses, {} items, {} requests, value {:.3f}, priority {}'
+                        .format(name, stats.responses, stats.items, stats.requests, stats.value, stats.priority))
+
+    def _update_stats(self, callback: str, spider):
+        stats = self.yields.callbacks[callback]
+        prefix = 'yield/{}/'.format(callback)
+        self.stats.set_value(prefix + 'responses', stats.responses, spider=spider)
+        self.stats.set_value(prefix + 'items', stats.items, spider=spider)
+        self.stats.set_value(prefix + 'requests', stats.requests, spider=spider)
+        self.stats.set_value(prefix + 'items_per_response', round(stats.item_rate, 3), spider=spider)
+        if stats.latency is not None:
+            self.stats.set_value(prefix + 'latency', round(stats.latency, 3), spider=spider)
+        # values and priorities of all callbacks move together
+        for name, s in self.yields.callbacks.items():
+            if s.responses > 0:
+                self.stats.set_value('yield/{}/value'.format(name), round(s.value, 3), spider=spider)
+                self.stats.set_value('yield/{}/priority'.format(name), s.priority, spider=spider)
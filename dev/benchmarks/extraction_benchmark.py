@@ -0,0 +1,161 @@
+"""
+Benchmark of parsing review pages: per-block XPath queries of Scrapy selectors, as spiders did before, against the
+compiled extractors of consumerReviewsScraper.extractors. Both are run on the pages in fixtures/, which mirror the
+markup the spiders expect, and must extract the same fields. Pages are parsed once, so only extraction is timed.
+
+Usage: python dev/benchmarks/extraction_benchmark.py [# of rounds]
+"""
+
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+from parsel import Selector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'WebScraper'))
+
+from consumerReviewsScraper.extractors import dianping, hyouban, kbb, xcar
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_kbb(page: Selector):
+    yield {
+        'ymm': page.xpath("//h1/span[@class='vehicle-ymm']/text()").extract_first(),
+        'next_page': page.xpath("//div[@class='pages']/a[@class='pagerLink pager-next']/@href").extract_first(),
+    }
+    for selector in page.xpath("//div[@class='review-section']"):
+        n_divs = len(selector.xpath('div'))
+        header_div = selector.xpath('div[1]')
+        recommend_div = selector.xpath('div[2]') if n_divs == 4 else None
+        content_div = selector.xpath('div[{}]'.format(n_divs - 1))
+        mileage = re.search(r'.*approximate mileage is ([\d,]+)',
+                            header_div.xpath("p[@class='duration']/strong/text()").extract_first())
+        ratings = header_div.xpath("div[@class='score-card']/dl").xpath('dd/span/text()').extract()
+        yield {
+            'num_divs': n_divs,
+            'title': header_div.xpath('h2/text()').extract_first(),
+            'author': header_div.xpath("p[@class='with-sub']/span/text()").extract_first(),
+            'date': header_div.xpath('meta/@content').extract_first(),
+            'mileage': int(mileage.group(1).replace(',', '')) if mileage else -1,
+            'ratings': [0 if r.strip() == kbb.NOT_RATED else int(r.strip().split('/')[0]) for r in ratings],
+            'recommend_paragraphs': [p.root for p in recommend_div.xpath('p')] if recommend_div else [],
+            'content': content_div.xpath("p[@class='review-text']/text()").extract_first().strip(),
+            'helpful': [int(h) for h in content_div.xpath("p[@class='helpful-count']/strong/text()").extract()],
+        }
+
+
+def compiled_kbb(page: Selector):
+    yield kbb.PAGE.extract(page)
+    yield from kbb.REVIEW.extract_all(page)
+
+
+def legacy_xcar_forum(page: Selector):
+    for thread in page.xpath("//dl[@class='list_dl']"):
+        num_replies, num_views = tuple(thread.xpath("dd[@class='cli_dd']/span/text()").getall())
+        yield {
+            'url': thread.xpath("dt/p[@class='thenomal']/a[@class='titlink']/@href").get(),
+            'num_replies': int(num_replies),
+            'num_views': int(num_views),
+        }
+
+
+def compiled_xcar_forum(page: Selector):
+    return xcar.THREAD.extract_all(page)
+
+
+def legacy_xcar_thread(page: Selector):
+    for post in page.xpath("//div[@class='main item']"):
+        user_info = post.xpath("descendant::div[@class='userside']")
+        register_date = user_info.xpath("descendant::p[@class='ursr_info']/span/text()").get()
+        publish = post.xpath("descendant::div[@class='mainboxTop']/p/text()") \
+            .re_first(r'.*发表于\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\s*')
+        yield {
+            'user_url': user_info.xpath("div[@class='user_info']/p[@class='name']/a/@href").get(),
+            'coin': user_info.xpath("descendant::li[@class='akb']/em/text()").get().strip(),
+            'register_date': datetime.strptime(register_date.strip(), '%Y-%m-%d').date(),
+            'pid': int(post.xpath('a/@name').re_first(r'pid(\d+)')),
+            'publish': datetime.strptime(publish.strip(), '%Y-%m-%d %H:%M'),
+            'content': ' '.join(post.xpath("descendant::div[@class='t_msgfont1']/descendant::*/text()")
+                                .getall()).strip(),
+            # the spider used to test the selector list against None, so posts were always flagged
+            'is_flag': len(post.xpath("descendant::span[@class='t_title1']")) > 0,
+        }
+
+
+def compiled_xcar_thread(page: Selector):
+    return xcar.POST.extract_all(page)
+
+
+def legacy_hyouban(page: Selector):
+    for div in page.xpath("//div[contains(@class, 'kuchikomi--')]"):
+        div = div.xpath("div[@class='box']")
+        subject_div = div.xpath("div[@class='subject']")
+        comment_div = div.xpath("div[@class='comment']")
+        publish_date = re.findall(r'口コミ投稿日：(.*).*',
+                                  ''.join(comment_div.xpath("div[@class='status']/text()").getall()).strip())
+        yield {
+            'attitude': subject_div.xpath("div[@class='label']/text()").get(),
+            'review_id': int(re.findall(r'/company/\d+/kuchikomi/(\d+).*',
+                                        comment_div.xpath('div[1]/a[1]/@href').get())[0]),
+            'category_id': int(re.findall(r'title title--(\d+).*', comment_div.xpath('div[1]/@class').get())[0]),
+            'content': ''.join(comment_div.xpath('text()').getall()).strip(),
+            'status': comment_div.xpath("div[@class='status']/a/text()").get(),
+            'publish_date': datetime.strptime(publish_date[0].strip(), '%Y年%m月%d日') if publish_date else '',
+            'num_helpful': int(comment_div.xpath('span/span/span/text()').get()),
+        }
+
+
+def compiled_hyouban(page: Selector):
+    return hyouban.REVIEW.extract_all(page)
+
+
+def legacy_dianping(page: Selector):
+    for reply in page.xpath("//ul[@class='reply-list']/li"):
+        review_id = reply.xpath('@data-replyid').extract_first()
+        author_id = reply.xpath("div[@class='item-r']/div[@class='l1 user-info']/a/@data-uid").extract_first()
+        content = reply.xpath("div[@class='item-r']/div[@class='l2']/div/text()").extract_first()
+        num_likes = reply.xpath("div[@class='item-r']/div[@class='l3']/a[2]/text()").extract_first()
+        yield {
+            'id': int(review_id.strip()) if review_id is not None else None,
+            'author_id': int(author_id.strip()) if author_id is not None else None,
+            'reply_time': reply
+                .xpath("div[@class='item-r']/div[@class='l1 user-info']/span[@class='reply-time']/text()")
+                .extract_first(),
+            'content': content.strip() if content is not None else None,
+            'num_likes': int(num_likes) if num_likes is not None else None,
+        }
+
+
+def compiled_dianping(page: Selector):
+    return dianping.REPLY.extract_all(page)
+
+
+CASES = [
+    ('kbb.html', legacy_kbb, compiled_kbb),
+    ('xcar_forum.html', legacy_xcar_forum, compiled_xcar_forum),
+    ('xcar_thread.html', legacy_xcar_thread, compiled_xcar_thread),
+    ('hyouban.html', legacy_hyouban, compiled_hyouban),
+    ('dianping.html', legacy_dianping, compiled_dianping),
+]
+
+
+def main(rounds: int):
+    print('{:<18}{:>8}{:>14}{:>14}{:>10}'.format('page', 'blocks', 'legacy ms', 'compiled ms', 'speedup'))
+    for file_name, legacy, compiled in CASES:
+        with open(os.path.join(FIXTURES_DIR, file_name), encoding='utf-8') as f:
+            page = Selector(text=f.read())
+        expected = list(legacy(page))
+        actual = list(compiled(page))
+        if expected != actual:
+            raise AssertionError('Fields of {} differ:\n{}\n{}'.format(file_name, expected, actual))
+
+        legacy_ms = min(timeit.repeat(lambda: list(legacy(page)), number=rounds, repeat=3)) / rounds * 1000
+        compiled_ms = min(timeit.repeat(lambda: list(compiled(page)), number=rounds, repeat=3)) / rounds * 1000
+        print('{:<18}{:>8}{:>14.3f}{:>14.3f}{:>9.1f}x'.format(file_name, len(actual), legacy_ms, compiled_ms,
+                                                              legacy_ms / compiled_ms))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
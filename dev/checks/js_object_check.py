@@ -0,0 +1,53 @@
+"""
+Check that parse_js_object() decodes escaped strings the same way as json.loads, including characters beyond BMP
+escaped as surrogate pairs and lone surrogates.
+
+Usage: python dev/checks/js_object_check.py [# of random strings]
+"""
+
+import os
+import sys
+import json
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'WebScraper'))
+
+from consumerReviewsScraper.js_object import parse_js_object
+
+CASES = [
+    'plain',
+    'line\nbreak\t"quoted" back\\slash /',
+    'café 中文',
+    '\U0001f600',
+    'smile \U0001f600 and \U0001f44d\U0001f3fd!',
+    '\ud83d',  # lone high surrogate
+    '\ude00 tail',  # lone low surrogate
+    '\ude00\ud83d',  # low before high is no pair
+    '\ud83d😀',
+]
+
+ALPHABET = ['a', ' ', '"', '\\', '\n', 'é', '中', '\U0001f600', '\U00010348', '\ud800', '\udfff']
+
+
+def check(value: str):
+    literal = '{"v": ' + json.dumps(value, ensure_ascii=True) + '}'
+    expected = json.loads(literal)
+    actual = parse_js_object(literal)
+    if actual != expected:
+        raise AssertionError('{!r} is decoded to {!r}, json.loads decodes it to {!r}'.format(
+            literal, actual, expected))
+
+
+def main(num_random: int):
+    for value in CASES:
+        check(value)
+    rng = random.Random(0)
+    for _ in range(num_random):
+        check(''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12))))
+    # a decoded pair is valid UTF-8
+    parse_js_object('{"v": "\\ud83d\\ude00"}')['v'].encode('utf-8')
+    print('{} strings are decoded the same as json.loads'.format(len(CASES) + num_random))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,90 @@
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.svm import SVC, LinearSVC
+from sklearn.utils import check_random_state
+
+
+class BatchSGDClassifier(BaseEstimator, ClassifierMixin):
+    """
+    Linear classifier trained by SGD with partial_fit over row batches, so only one batch of a (possibly
+    memory-mapped) feature matrix is materialized at a time.
+    """
+
+    def __init__(self, loss='hinge', penalty='l2', alpha=0.0001, batch_size=10000, n_epochs=5, shuffle=True,
+                 random_state=None):
+        self.loss = loss
+        self.penalty = penalty
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.n_epochs = n_epochs
+        self.shuffle = shuffle
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        rng = check_random_state(self.random_state)
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        self.estimator_ = SGDClassifier(loss=self.loss, penalty=self.penalty, alpha=self.alpha,
+                                        random_state=self.random_state)
+        n_rows = X.shape[0]
+        for _ in range(self.n_epochs):
+            order = rng.permutation(n_rows) if self.shuffle else np.arange(n_rows)
+            for start in range(0, n_rows, self.batch_size):
+                batch = np.sort(order[start:start + self.batch_size])  # sorted rows are cheaper to gather
+                self.estimator_.partial_fit(X[batch], y[batch], classes=self.classes_)
+        self.coef_ = self.estimator_.coef_
+        self.intercept_ = self.estimator_.intercept_
+        return self
+
+    def decision_function(self, X):
+        return self.estimator_.decision_function(X)
+
+    def predict(self, X):
+        return self.estimator_.predict(X)
+
+
+def _svc(C=1.0, random_state=None):
+    return SVC(kernel='linear', C=C)
+
+
+def _linear_svc(C=1.0, random_state=None):
+    return LinearSVC(C=C, random_state=random_state)
+
+
+def _logreg(C=1.0, random_state=None):
+    return LogisticRegression(C=C, solver='liblinear', random_state=random_state)
+
+
+def _sgd(C=1.0, random_state=None):
+    # alpha of SGD is the regularization strength, so it is scaled inversely with C from the SGDClassifier default
+    # 0.0001 at C=1. It is not 1 / (C * n) as in SVC, because number of samples is unknown before fitting
+    return SGDClassifier(loss='hinge', alpha=0.0001 / C, random_state=random_state)
+
+
+def _sgd_batch(C=1.0, random_state=None):
+    return BatchSGDClassifier(loss='hinge', alpha=0.0001 / C, random_state=random_state)
+
+
+# classifier backends by name. svc uses libsvm and scales super-linearly with # of reviews, the others are linear
+# solvers suited to large sparse TFIDF matrices.
+CLASSIFIERS = {
+    'svc': _svc,
+    'linear_svc': _linear_svc,
+    'logreg': _logreg,
+    'sgd': _sgd,
+    'sgd_batch': _sgd_batch
+}
+
+
+def make_classifier(name: str, C=1.0, random_state=None):
+    """
+    Create a classifier backend.
+    :param name: backend name, one of CLASSIFIERS.
+    :param C: inverse of regularization strength.
+    :param random_state: seed of backends using randomness.
+    """
+
+    if name not in CLASSIFIERS:
+        raise ValueError('Unknown classifier: {}. Supported are {}.'.format(name, list(CLASSIFIERS)))
+    return CLASSIFIERS[name](C=C, random_state=random_state)
@@ -0,0 +1,201 @@
+import os
+import argparse
+import json
+import numpy as np
+from multiprocessing import cpu_count, get_context
+from typing import List
+from sklearn.model_selection import check_cv
+from sklearn.preprocessing import LabelEncoder
+from modeling.classifiers import CLASSIFIERS, make_classifier
+from modeling.modeling import _fit_and_score
+from preprocessing.ranking import shared_tfidf
+from utils.shared_matrix import SharedMatrix
+
+# matrices of stores opened by worker processes, as {matrix path: (X, y, {column: index})}. Arrays of X are
+# memory-mapped read-only, so all workers share one copy in page cache.
+_matrices = {}
+
+
+def parse_cli():
+    parser = argparse.ArgumentParser(description='Run grid of modeling experiments in parallel with checkpoints.')
+    parser.add_argument('working_dir', help='Working directory')
+    parser.add_argument('data_files', help='Comma-separated TFIDF data files, one per store. Ranking of a store is '
+                                           'read from "<data file>__ranking-<ranking>.txt".')
+    parser.add_argument('label', help='Label field name.')
+    parser.add_argument('-r', '--rankings', default='freq,chi2',
+                        help='Comma-separated rankings. Default "freq,chi2" will be used if not provided.')
+    parser.add_argument('-n', '--num_features',
+                        default='10,25,50,75,100,125,150,175,200,225,250,275,300,350,400,450,500,550,600,650,700,750,'
+                                '800,850,900,950,1000,1100,1200,1300,1400,1500,1600,1700,1800,1900,2000,2095',
+                        help='# of features as a comma-separated list. Default list is the same as modeling.py.')
+    parser.add_argument('-s', '--scorers', default='accuracy,balanced_accuracy,roc_auc',
+                        help='Comma-separated scorers. Default scores "accuracy,balanced_accuracy,roc_auc" will be '
+                             'used if not provided.')
+    parser.add_argument('-c', '--classifiers', default='svc',
+                        help='Comma-separated classifier backends among {}. Default "svc" will be used if not '
+                             'provided.'.format(','.join(sorted(CLASSIFIERS))))
+    parser.add_argument('-C', type=float, default=1.0,
+                        help='Inverse of regularization strength. Default value 1.0 will be used if not provided.')
+    parser.add_argument('--random_state', type=int, default=None, help='Seed of randomized classifiers.')
+    parser.add_argument('-p', '--processes', type=int, default=cpu_count(),
+                        help='Number of worker processes. Number of CPUs will be used if not provided.')
+    parser.add_argument('--checkpoint', default='experiments__checkpoint.jsonl',
+                        help='File in working directory that finished cells are appended to. Cells found in it are '
+                             'skipped. Default "experiments__checkpoint.jsonl" will be used if not provided.')
+    parser.add_argument('--output', default='experiments__results.json',
+                        help='Output file of all results. Default "experiments__results.json" will be used if not '
+                             'provided.')
+    return parser.parse_args()
+
+
+def read_ranking(path: str) -> List[str]:
+    """
+    Read features of a ranking file in rank order. Lines are either "feature: score" or "feature".
+    """
+
+    features = []
+    with open(path) as fp:
+        for line in fp:
+            line = line.rstrip('\n')
+            if line:
+                features.append(line.rsplit(': ', 1)[0])
+    return features
+
+
+def _load_matrix(shared: SharedMatrix):
+    if shared.path not in _matrices:
+        y = LabelEncoder().fit_transform(shared.labels)
+        _matrices[shared.path] = (shared.matrix, y, {column: i for i, column in enumerate(shared.columns)})
+    return _matrices[shared.path]
+
+
+def _cell_key(cell: dict) -> str:
+    return json.dumps([cell['store'], cell['ranking'], cell['classifier'], cell['C'], cell['num_features']])
+
+
+def _run_cell(task: tuple) -> dict:
+    """
+    10-fold CV of one cell of the grid. All scorers of the cell are computed from the same fitted folds.
+    """
+
+    cell, shared, features, scorers, random_state = task
+    X, y, col_idx = _load_matrix(shared)
+    X_num = X[:, [col_idx[feature] for feature in features[:cell['num_features']]]]
+    classifier = make_classifier(cell['classifier'], C=cell['C'], random_state=random_state)
+
+    raw = {scorer: [] for scorer in scorers}
+    for train, test in check_cv(10, y, classifier=True).split(X_num, y):
+        fold_scores, _ = _fit_and_score(classifier, X_num, y, train, test, scorers)
+        for scorer in scorers:
+            raw[scorer].append(float(fold_scores[scorer]))
+    return dict(cell, scores=raw)
+
+
+def read_checkpoint(path: str) -> dict:
+    """
+    Read finished cells of checkpoint file as {cell key: record}. A partially written last line is ignored.
+    """
+
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            key = _cell_key(record)
+            if key in done:
+                done[key]['scores'].update(record['scores'])
+            else:
+                done[key] = record
+    return done
+
+
+def run_grid(working_dir: str, data_files: List[str], label: str, rankings: List[str], num_features: List[int],
+             scorers: List[str], classifiers: List[str], C=1.0, random_state=None, processes=cpu_count(),
+             checkpoint='experiments__checkpoint.jsonl') -> dict:
+    """
+    Expand grid of store x ranking x classifier x # of features into cells and run cells not in checkpoint on a
+    process pool. Every finished cell is appended to checkpoint right away, so an interrupted run resumes from
+    where it stopped.
+    :return: results as {store: {classifier: {ranking: {scorer: {num: {'raw': scores, 'mean': mean}}}}}}.
+    """
+
+    checkpoint_path = os.sep.join([working_dir, checkpoint])
+    done = read_checkpoint(checkpoint_path)
+
+    tasks = []
+    for data_file in data_files:
+        data_path = os.sep.join([working_dir, data_file])
+        shared = shared_tfidf(data_path, label)
+        for ranking in rankings:
+            features = read_ranking(os.path.splitext(data_path)[0] + '__ranking-{}.txt'.format(ranking))
+            for classifier in classifiers:
+                for num in num_features:
+                    cell = {'store': data_file, 'ranking': ranking, 'classifier': classifier, 'C': C,
+                            'num_features': num}
+                    finished = done.get(_cell_key(cell), {}).get('scores', {})
+                    missing = [scorer for scorer in scorers if scorer not in finished]
+                    if missing:
+                        tasks.append((cell, shared, features, missing, random_state))
+    print('{} cells to run, {} cells found in checkpoint {}'.format(len(tasks), len(done), checkpoint))
+
+    # run biggest cells first so that they do not become stragglers at the end
+    tasks.sort(key=lambda x: x[0]['num_features'], reverse=True)
+
+    with open(checkpoint_path, 'a') as fp, get_context('fork').Pool(processes=processes) as pool:
+        for i, record in enumerate(pool.imap_unordered(_run_cell, tasks, chunksize=1)):
+            fp.write(json.dumps(record) + '\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+            key = _cell_key(record)
+            if key in done:
+                done[key]['scores'].update(record['scores'])
+            else:
+                done[key] = record
+            print('[{}/{}] Finished {} {} {} num_features={}'.format(i + 1, len(tasks), record['store'],
+                                                                     record['ranking'], record['classifier'],
+                                                                     record['num_features']))
+
+    results = {}
+    for record in done.values():
+        if record['store'] not in data_files or record['ranking'] not in rankings \
+                or record['classifier'] not in classifiers or record['C'] != C \
+                or record['num_features'] not in num_features:
+            continue
+        by_ranking = results.setdefault(record['store'], {}).setdefault(record['classifier'], {}) \
+            .setdefault(record['ranking'], {})
+        for scorer in scorers:
+            raw = record['scores'][scorer]
+            by_ranking.setdefault(scorer, {})[str(record['num_features'])] = {'raw': raw, 'mean': float(np.mean(raw))}
+    return results
+
+
+if __name__ == '__main__':
+    args = parse_cli()
+
+    data_files = args.data_files.split(',')
+    rankings = args.rankings.split(',')
+    num_features = [int(x) for x in args.num_features.split(',')]
+    scorers = args.scorers.split(',')
+    classifiers = args.classifiers.split(',')
+
+    print('Working directory: {}'.format(args.working_dir))
+    print('Data files: {}'.format(data_files))
+    print('Label field: {}'.format(args.label))
+    print('Rankings: {}'.format(rankings))
+    print('# of features: {}'.format(num_features))
+    print('Scorers: {}'.format(scorers))
+    print('Classifiers: {} (C={})'.format(classifiers, args.C))
+    print('Processes: {}'.format(args.processes))
+
+    results = run_grid(args.working_dir, data_files, args.label, rankings, num_features, scorers, classifiers,
+                       C=args.C, random_state=args.random_state, processes=args.processes,
+                       checkpoint=args.checkpoint)
+
+    with open(os.sep.join([args.working_dir, args.output]), 'w') as fp:
+        json.dump(results, fp)
+    print('Save score results to file {}'.format(args.output))
+    print('Done!')
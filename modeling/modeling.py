@@ -1,14 +1,32 @@
 import os
 import argparse
 import json
-import pandas as pd
+import numpy as np
+import scipy.sparse as sp
 import matplotlib.pylab as plt
+from joblib import Parallel, delayed
 from multiprocessing import cpu_count
 from uuid import uuid4
-from typing import List
+from typing import List, Union
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, balanced_accuracy_score, f1_score, get_scorer, precision_score, \
+    recall_score, roc_auc_score
 from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import cross_val_score
-from sklearn.svm import SVC
+from sklearn.model_selection import check_cv
+from modeling.classifiers import CLASSIFIERS, make_classifier
+from preprocessing.balance_samples import read_balanced_index
+from preprocessing.ranking import shared_tfidf
+from utils.shared_matrix import SharedMatrix
+
+# scorers computed from predictions shared by all scorers, as (metric, uses decision values instead of labels)
+SCORE_FUNCS = {
+    'accuracy': (accuracy_score, False),
+    'balanced_accuracy': (balanced_accuracy_score, False),
+    'f1': (f1_score, False),
+    'precision': (precision_score, False),
+    'recall': (recall_score, False),
+    'roc_auc': (roc_auc_score, True)
+}
 
 
 def parse_cli():
@@ -34,17 +52,100 @@ def parse_cli():
     parser.add_argument('-y', '--y_lim', default='0,1',
                         help='Comma-separated range of Y axis in plot. Default [0.0, 1.0] will be used '
                              'if not provided.')
+    parser.add_argument('-j', '--n_jobs', type=int, default=cpu_count(),
+                        help='# of folds fitted in parallel. Number of CPUs will be used if not provided.')
+    parser.add_argument('-c', '--classifier', default='svc', choices=sorted(CLASSIFIERS),
+                        help='Classifier backend. "svc" is kernel SVM with linear kernel, "linear_svc" and "logreg" '
+                             'use liblinear, "sgd" fits in memory and "sgd_batch" fits batch by batch with '
+                             'partial_fit. Default "svc" will be used if not provided.')
+    parser.add_argument('-C', type=float, default=1.0,
+                        help='Inverse of regularization strength. Default value 1.0 will be used if not provided.')
+    parser.add_argument('--random_state', type=int, default=None, help='Seed of randomized classifiers.')
+    parser.add_argument('-i', '--index_file',
+                        help='Optional row index file written by balance_samples.py. Its positions are rows of the '
+                             'data file the TFIDF file was computed from, so the TFIDF file must have one row per row '
+                             'of data file, e.g. as tfidf_generation.py writes it, and not be a rebalanced copy. Rows '
+                             'of TFIDF file are gathered by it lazily.')
     return parser.parse_args()
 
 
+def _decision_values(estimator, X):
+    if hasattr(estimator, 'decision_function'):
+        return estimator.decision_function(X)
+    return estimator.predict_proba(X)[:, 1]
+
+
+def _warm_start(estimator, previous, num_features: int):
+    """
+    Initialize a linear estimator supporting warm start with coefficients fitted on a smaller feature set.
+    Coefficients of newly added features start from zero.
+    """
+
+    coef = np.zeros((previous.coef_.shape[0], num_features))
+    coef[:, :previous.coef_.shape[1]] = previous.coef_
+    estimator.set_params(warm_start=True)
+    estimator.coef_ = coef
+    estimator.intercept_ = np.array(previous.intercept_, copy=True)
+
+
+def _fit_and_score(classifier, X: Union[sp.csr_matrix, SharedMatrix], y: np.ndarray, train: np.ndarray,
+                   test: np.ndarray, scorers: List[str], previous=None, col_idx: List[int] = None):
+    """
+    Fit one fold and compute all scorers from the same predictions.
+    If X is a shared matrix, columns col_idx are taken from it in the worker.
+    :return: tuple of ({scorer: score}, fitted estimator if it can warm-start the next feature set else None).
+    """
+
+    if isinstance(X, SharedMatrix):
+        X = X.take_columns(col_idx)
+    estimator = clone(classifier)
+    can_warm_start = 'warm_start' in estimator.get_params()
+    if can_warm_start and previous is not None:
+        _warm_start(estimator, previous, X.shape[1])
+    estimator.fit(X[train], y[train])
+
+    X_test, y_test = X[test], y[test]
+    y_pred, y_decision = None, None
+    scores = {}
+    for scorer in scorers:
+        if scorer not in SCORE_FUNCS:
+            scores[scorer] = get_scorer(scorer)(estimator, X_test, y_test)
+            continue
+        metric, uses_decision = SCORE_FUNCS[scorer]
+        if uses_decision:
+            if y_decision is None:
+                y_decision = _decision_values(estimator, X_test)
+            scores[scorer] = metric(y_test, y_decision)
+        else:
+            if y_pred is None:
+                y_pred = estimator.predict(X_test)
+            scores[scorer] = metric(y_test, y_pred)
+    return scores, estimator if can_warm_start else None
+
+
 def kfold_cv(classifier,
-             tfidf: pd.DataFrame,
+             X: Union[sp.csr_matrix, SharedMatrix],
+             y: np.ndarray,
+             columns: List[str],
              all_features: List[str],
              num_features: List[int],
-             scorers: List[str]):
-    le = LabelEncoder()
-    y = le.fit_transform(tfidf[args.label])
-    X = tfidf.drop(columns=[args.label])
+             scorers: List[str],
+             n_jobs: int = cpu_count()):
+    """
+    K-fold CV of classifier on increasing # of top ranked features. Every fold is fitted once per # of features
+    and all scorers are computed from its predictions. Fold splits are the same as cross_val_score(cv=10).
+    :param classifier: classifier to evaluate.
+    :param X: sparse feature matrix, or shared matrix that workers memory-map instead of receiving a copy.
+    :param y: encoded labels.
+    :param columns: feature names of matrix columns.
+    :param all_features: features in descending order of rank.
+    :param num_features: list of # of top features to evaluate.
+    :param scorers: list of scorer names.
+    :param n_jobs: # of folds fitted in parallel.
+    """
+
+    col_idx = {column: i for i, column in enumerate(columns)}
+    folds = list(check_cv(10, y, classifier=True).split(np.zeros((len(y), 1)), y))
 
     results = {
         scorer: {
@@ -55,13 +156,24 @@ def kfold_cv(classifier,
         } for scorer in scorers
     }
 
-    for num in num_features:
-        features = all_features[:num]
-        for scorer in scorers:
-            print('Running k-fold CV: num_features={}, scorer={}'.format(num, scorer))
-            scores = cross_val_score(classifier, X[features], y, cv=10, scoring=scorer, n_jobs=cpu_count())
-            results[scorer][str(num)]['raw'] = scores.tolist()
-            results[scorer][str(num)]['mean'] = scores.mean()
+    # feature sets are nested, so models fitted on a smaller set can warm-start the next one
+    previous = [None] * len(folds)
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for num in sorted(num_features):
+            print('Running k-fold CV: num_features={}, scorers={}'.format(num, scorers))
+            num_cols = [col_idx[feature] for feature in all_features[:num]]
+            if isinstance(X, SharedMatrix):
+                X_num = X  # only the handle is sent to workers
+            else:
+                X_num, num_cols = X[:, num_cols], None
+            fold_results = parallel(delayed(_fit_and_score)(classifier, X_num, y, train, test, scorers, prev,
+                                                            num_cols)
+                                    for (train, test), prev in zip(folds, previous))
+            previous = [estimator for _, estimator in fold_results]
+            for scorer in scorers:
+                scores = np.array([fold_scores[scorer] for fold_scores, _ in fold_results])
+                results[scorer][str(num)]['raw'] = scores.tolist()
+                results[scorer][str(num)]['mean'] = scores.mean()
 
     return results
 
@@ -95,26 +207,48 @@ if __name__ == '__main__':
     y_lim = tuple(float(y) for y in args.y_lim.split(','))
     print('X axis range: {}'.format(x_lim))
     print('Y axis range: {}'.format(y_lim))
+    print('Classifier: {} (C={})'.format(args.classifier, args.C))
 
-    df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
-    print('Dataframe shape={}'.format(df.shape))
+    # matrix is saved once and memory-mapped by workers of both rankings
+    X = shared_tfidf(os.sep.join([args.working_dir, args.data_file]), args.label)
+    if args.index_file is not None:
+        index = read_balanced_index(os.sep.join([args.working_dir, args.index_file]))
+        if index.shape[0] == 0 or index.min() < 0 or index.max() >= X.shape[0]:
+            raise ValueError('Index file {} has positions out of range of {} rows of TFIDF file'
+                             .format(args.index_file, X.shape[0]))
+        if index.shape[0] == X.shape[0]:
+            # a rebalanced copy has one row per position of its index, while rebalancing changes the row count
+            raise ValueError('TFIDF file has as many rows as index file {}, it seems to be gathered by it already'
+                             .format(args.index_file))
+        X = X.select_rows(index)
+        print('Rows are gathered by index file: {}'.format(args.index_file))
+    print('Matrix shape={}'.format(X.shape))
+    y = LabelEncoder().fit_transform(X.labels)
+    columns = X.columns
 
+    classifier = make_classifier(args.classifier, C=args.C, random_state=args.random_state)
     results = {}
 
     print('Running K-fold CV for frequency ranking ...')
-    freq_results = kfold_cv(SVC(kernel='linear', C=1),
-                            tfidf=df,
+    freq_results = kfold_cv(classifier,
+                            X=X,
+                            y=y,
+                            columns=columns,
                             all_features=freq_features,
                             num_features=num_features,
-                            scorers=scorers)
+                            scorers=scorers,
+                            n_jobs=args.n_jobs)
     results['freq'] = freq_results
 
     print('Running K-fold CV for chi2 ranking ...')
-    chi2_results = kfold_cv(SVC(kernel='linear', C=1),
-                            tfidf=df,
+    chi2_results = kfold_cv(classifier,
+                            X=X,
+                            y=y,
+                            columns=columns,
                             all_features=chi2_features,
                             num_features=num_features,
-                            scorers=scorers)
+                            scorers=scorers,
+                            n_jobs=args.n_jobs)
     results['chi2'] = chi2_results
     score_filename = '{}.json'.format(uuid4())
     with open(os.sep.join([args.working_dir, score_filename]), 'w') as fp:
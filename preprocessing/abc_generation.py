@@ -1,6 +1,10 @@
 import argparse
 import os
+import numpy as np
 import pandas as pd
+from typing import Dict, List
+from preprocessing.ranking import shared_tfidf
+from utils.shared_matrix import SharedMatrix
 
 
 def parse_cli():
@@ -12,9 +16,61 @@ def parse_cli():
     parser.add_argument('tfidf', help='TFIDF file. Only CSV format is supported.')
     parser.add_argument('--label', default='posneg', 
                         help='Optional label field in dataframe. Default value "posneg" will be used if not provided.')
+    parser.add_argument('--csv', action='store_true',
+                        help='Also write sets as CSV files. Only sparse shards are written if omitted.')
     return parser.parse_args()
 
 
+def read_words(path: str, k: int) -> List[str]:
+    words = []
+    with open(path) as fp:
+        for line in fp:
+            if len(words) < k:
+                arr = line.split(':')
+                words.append(arr[0].strip())
+    return words
+
+
+def word_ids(words: List[str], vocabulary: Dict[str, int]) -> np.ndarray:
+    """
+    Vocabulary IDs of words. Words not in vocabulary get new IDs after the last one, so that set operations still
+    tell them apart.
+    """
+
+    ids = np.empty(len(words), dtype=np.int64)
+    for i, word in enumerate(words):
+        ids[i] = vocabulary.setdefault(word, len(vocabulary))
+    return ids
+
+
+def partition_ids(ids_a: np.ndarray, ids_b: np.ndarray) -> tuple:
+    """
+    Partition two ID arrays into A - C, B - C and C = A & B. A - C and B - C keep their order, C is sorted.
+    """
+
+    ids_c = np.intersect1d(ids_a, ids_b)
+    return ids_a[~np.isin(ids_a, ids_c)], ids_b[~np.isin(ids_b, ids_c)], ids_c
+
+
+def write_shard(shared: SharedMatrix, ids: np.ndarray, vocabulary: Dict[str, int], path: str) -> SharedMatrix:
+    """
+    Save columns ids of shared TFIDF matrix, with its labels, as a sparse shard.
+    """
+
+    unknown = ids[ids >= shared.shape[1]]
+    if unknown.shape[0] > 0:
+        words = {i: word for word, i in vocabulary.items()}
+        raise KeyError('Words not in TFIDF file: {}'.format([words[i] for i in unknown.tolist()]))
+    columns = [shared.columns[i] for i in ids]
+    return SharedMatrix.create(path, shared.take_columns(ids), columns, shared.labels)
+
+
+def write_csv(shard: SharedMatrix, label: str, path: str):
+    df = pd.DataFrame(shard.matrix.toarray(), columns=shard.columns)
+    df[label] = shard.labels
+    df.to_csv(path, index=False)
+
+
 if __name__ == '__main__':
     args = parse_cli()
     
@@ -25,67 +81,36 @@ if __name__ == '__main__':
     print('TFIDF file: {}'.format(args.tfidf))
     print('Label field: {}'.format(args.label))
 
-    df = pd.read_csv(os.sep.join([args.working_dir, args.tfidf]))
-    print('Dataframe shape: {}'.format(df.shape))
-    
-    data_a = []  # A
-    count = 0
-    with open(os.sep.join([args.working_dir, args.a_file])) as fp:
-        for line in fp:
-            if count < args.k:
-                arr = line.split(':')
-                data_a.append(arr[0].strip())
-                count += 1
-    print('{} word-value pairs are read from set A file.'.format(len(data_a)))
+    # TFIDF file is converted to a sparse matrix once and reused by every combination of word lists
+    shared = shared_tfidf(os.sep.join([args.working_dir, args.tfidf]), args.label)
+    print('Matrix shape: {}'.format(shared.shape))
+    vocabulary = {word: i for i, word in enumerate(shared.columns)}
 
-    data_b = []  # B
-    count = 0
-    with open(os.sep.join([args.working_dir, args.b_file])) as fp:
-        for line in fp:
-            if count < args.k:
-                arr = line.split(':')
-                data_b.append(arr[0].strip())
-                count += 1
+    data_a = read_words(os.sep.join([args.working_dir, args.a_file]), args.k)  # A
+    print('{} word-value pairs are read from set A file.'.format(len(data_a)))
+    data_b = read_words(os.sep.join([args.working_dir, args.b_file]), args.k)  # B
     print('{} word-value pairs are read from set B file.'.format(len(data_b)))
-    
-    set_common = set(data_a) & set(data_b)
-    len_common = len(set_common)
+
+    ids_a, ids_b, ids_c = partition_ids(word_ids(data_a, vocabulary), word_ids(data_b, vocabulary))
+    len_common = ids_c.shape[0]
     print('Size of C: {}'.format(len_common))
+    words = {i: word for word, i in vocabulary.items()}
     filename = os.sep.join([args.working_dir, 'C.txt'])
     with open(filename, 'w') as fp:
-        for word in set_common:
-            fp.write(word)
+        for i in ids_c.tolist():
+            fp.write(words[i])
             fp.write('\n')
     print('Write common words to {}'.format(filename))
+    print('Size of A - C: {}'.format(ids_a.shape[0]))
+    print('Size of B - C: {}'.format(ids_b.shape[0]))
 
-    data_a = [x for x in data_a if x not in set_common]  # A = A - C
-    print('Size of A - C: {}'.format(len(data_a)))
-
-    data_b = [x for x in data_b if x not in set_common]  # B = B - C
-    print('Size of B - C: {}'.format(len(data_b)))
-    
-    filename = os.path.splitext(args.tfidf)[0] + '__filtered_A.csv'
-    print('Output file: {}'.format(filename))
-    cols = data_a[:len_common]
-    cols.append(args.label)
-    df_a = df[cols]
-    print('filtered_A shape: {}'.format(df_a.shape))
-    df_a.to_csv(os.sep.join([args.working_dir, filename]), index=False)
-    
-    filename = os.path.splitext(args.tfidf)[0] + '__filtered_B.csv'
-    print('Output file: {}'.format(filename))
-    cols = data_b[:len_common]
-    cols.append(args.label)
-    df_b = df[cols]
-    print('filtered_B shape: {}'.format(df_b.shape))
-    df_b.to_csv(os.sep.join([args.working_dir, filename]), index=False)
-    
-    filename = os.path.splitext(args.tfidf)[0] + '__filtered_C.csv'
-    print('Output file: {}'.format(filename))
-    cols = list(set_common)
-    cols.append(args.label)
-    df_c = df[cols]
-    print('filtered_C shape: {}'.format(df_c.shape))
-    df_c.to_csv(os.sep.join([args.working_dir, filename]), index=False)
+    for name, ids in (('A', ids_a[:len_common]), ('B', ids_b[:len_common]), ('C', ids_c)):
+        filename = os.path.splitext(args.tfidf)[0] + '__filtered_{}'.format(name)
+        print('Output shard: {}'.format(filename))
+        shard = write_shard(shared, ids, vocabulary, os.sep.join([args.working_dir, filename]))
+        print('filtered_{} shape: {}'.format(name, (shard.shape[0], shard.shape[1] + 1)))
+        if args.csv:
+            print('Output file: {}'.format(filename + '.csv'))
+            write_csv(shard, args.label, os.sep.join([args.working_dir, filename + '.csv']))
 
     print('Done!')
@@ -1,6 +1,7 @@
 import os
 import argparse
 import enum
+import numpy as np
 import pandas as pd
 from sklearn.utils import resample
 
@@ -26,9 +27,47 @@ def parse_cli():
     parser.add_argument('-n', '--neg_label', default='neg', help='Value of negative label.')
     parser.add_argument('-r', '--random_state', type=int, default=41,
                         help='Seed of random number. A prime number is preferred. Default is 41.')
+    parser.add_argument('--csv', action='store_true',
+                        help='Also write rebalanced rows as CSV file. Only the row index file is written if omitted.')
     return parser.parse_args()
 
 
+def balance_indices(labels: pd.Series, mode: RebalanceMode, pos_label, neg_label, random_state) -> np.ndarray:
+    """
+    Rebalance samples by row positions instead of copies of rows. Rows are drawn exactly as resample() draws them
+    from the class dataframes.
+    :param labels: label of every row.
+    :return: positions of rebalanced rows in original data, resampled class first.
+    """
+
+    labels = np.asarray(labels)
+    pos_idx = np.flatnonzero(labels == pos_label)
+    neg_idx = np.flatnonzero(labels == neg_label)
+    major_idx, minor_idx = (pos_idx, neg_idx) if pos_idx.shape[0] >= neg_idx.shape[0] else (neg_idx, pos_idx)
+
+    if mode is RebalanceMode.DOWN_SAMPLING:
+        resampled = resample(major_idx, replace=True, n_samples=minor_idx.shape[0], random_state=random_state)
+        return np.concatenate([resampled, minor_idx])
+    elif mode is RebalanceMode.OVER_SAMPLING:
+        resampled = resample(minor_idx, replace=True, n_samples=major_idx.shape[0], random_state=random_state)
+        return np.concatenate([resampled, major_idx])
+    else:
+        raise ValueError('Unknown rebalance mode: {}'.format(mode))
+
+
+def balanced_index_path(data_path: str, mode: RebalanceMode) -> str:
+    return os.path.splitext(data_path)[0] + '__balanced-{}.npy'.format(mode.name)
+
+
+def read_balanced_index(path: str) -> np.ndarray:
+    """
+    Read row positions written by balance_samples.py. Rows of original data are gathered by these positions
+    lazily, by stages that take an index file.
+    """
+
+    return np.load(path)
+
+
 if __name__ == '__main__':
     args = parse_cli()
     if args.mode == 1:
@@ -46,30 +85,19 @@ if __name__ == '__main__':
     print('Negative label: {}'.format(args.neg_label))
     print('Random seed: {}\n'.format(args.random_state))
 
-    df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
+    data_path = os.sep.join([args.working_dir, args.data_file])
+    labels = pd.read_csv(data_path, usecols=[args.label])[args.label]
 
-    value_counts = df[args.label].value_counts(sort=True, ascending=False)
-    print('Counts before re-sampling: \n{}\n'.format(value_counts))
-    if value_counts[args.pos_label] >= value_counts[args.neg_label]:
-        major_label = args.pos_label
-        minor_label = args.neg_label
-    else:
-        major_label = args.neg_label
-        minor_label = args.pos_label
-    df_major = df[df[args.label] == major_label]
-    df_minor = df[df[args.label] == minor_label]
+    print('Counts before re-sampling: \n{}\n'.format(labels.value_counts(sort=True, ascending=False)))
+    index = balance_indices(labels, mode, args.pos_label, args.neg_label, args.random_state)
+    print('Counts after re-sampling: \n{}\n'.format(labels.take(index).value_counts()))
 
-    if mode is RebalanceMode.DOWN_SAMPLING:
-        df_resampled = resample(df_major, replace=True, n_samples=df_minor.shape[0], random_state=args.random_state)
-        df_result = pd.concat([df_resampled, df_minor])
-    elif mode is RebalanceMode.OVER_SAMPLING:
-        df_resampled = resample(df_minor, replace=True, n_samples=df_major.shape[0], random_state=args.random_state)
-        df_result = pd.concat([df_resampled, df_major])
-    else:
-        raise ValueError('Unknown rebalance mode: {}'.format(mode))
-    value_counts = df_result[args.label].value_counts()
-    print('Counts after re-sampling: \n{}\n'.format(value_counts))
-    filename = os.path.splitext(args.data_file)[0] + '__balanced-{}.csv'.format(mode.name)
-    print('Output file: {}'.format(filename))
-    df_result.to_csv(os.sep.join([args.working_dir, filename]), index=False)
+    index_path = balanced_index_path(data_path, mode)
+    print('Output index file: {}'.format(os.path.basename(index_path)))
+    np.save(index_path, index)
+
+    if args.csv:
+        filename = os.path.splitext(args.data_file)[0] + '__balanced-{}.csv'.format(mode.name)
+        print('Output file: {}'.format(filename))
+        pd.read_csv(data_path).take(index).to_csv(os.sep.join([args.working_dir, filename]), index=False)
     print('Done!')
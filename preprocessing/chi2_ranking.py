@@ -1,8 +1,6 @@
 import argparse
 import os
-import numpy as np
-import pandas as pd
-from sklearn.feature_selection import chi2, SelectKBest
+from preprocessing.ranking import rank_features, tfidf_stats
 
 
 def parse_cli():
@@ -10,6 +8,7 @@ def parse_cli():
     parser.add_argument('working_dir', help='Working directory')
     parser.add_argument('data_file', help='Name of TFIDF data file. Supports CSV file only.')
     parser.add_argument('label_field', help='Label field name to.')
+    parser.add_argument('--no_cache', action='store_true', help='Recompute statistics even if cache file exists.')
     return parser.parse_args()
 
 
@@ -20,20 +19,10 @@ if __name__ == '__main__':
     print('Data file: {}'.format(args.data_file))
     print('Label field: {}'.format(args.label_field))
     
-    df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
-    print('Dataframe shape={}'.format(df.shape))
-
-    y = df[args.label_field]
-    x = df.drop(columns=[args.label_field])
-    selector = SelectKBest(score_func=chi2, k='all')  # select all features
-    selector.fit(x, y)
-    features = x.columns.values[selector.get_support()]
-    scores = selector.scores_[selector.get_support()]
-    assert len(features) == len(scores), \
-           'Length of features ({}) does not equal to length of scores ({}).'.format(len(features), len(scores))
-    scores = {features[i]: scores[i] for i in range(len(features))}
-    scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    result = [(x[0], x[1]) for x in scores]
+    stats = tfidf_stats(os.sep.join([args.working_dir, args.data_file]), args.label_field,
+                        use_cache=not args.no_cache)
+    print('Dataframe shape={}'.format((stats.n_docs, len(stats.features) + 1)))
+    result = rank_features(stats, 'chi2')
 
     filename = os.path.splitext(args.data_file)[0] + '__ranking-chi2.txt'
     print('Output file: {}'.format(filename))
@@ -1,4 +1,4 @@
-from preprocessing.ngrams import ReviewSents, Unigramer, Bigramer, Trigramer
+from preprocessing.ngrams import ReviewSents, StreamingReviewSents, Unigramer, Bigramer, Trigramer
 import argparse
 import os
 import pandas as pd
@@ -30,6 +30,8 @@ def parse_cli():
                         help='Minimum percent of average frequency.')
     parser.add_argument('--tri_review_pct', type=float, default=0.09,
                         help='Percentage of reviews two bigrams linked in a trigram must appear together in.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Keep compact token features instead of spacy documents to reduce memory usage.')
     return parser.parse_args()
 
 
@@ -46,11 +48,13 @@ if __name__ == '__main__':
     print('Minimum percent: {}'.format(args.min_pct))
     print('A percent: {}'.format(args.a_pct))
     print('PMI percent: {}'.format(args.pmi_pct))
+    print('Streaming: {}'.format(args.streaming))
 
     df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
     print('Dataframe shape={}'.format(df.shape))
     nlp = spacy.load(args.model)
-    rs = ReviewSents(data=df, id_field=args.id_field, text_field=args.text_field, rating_field=args.rating_field)
+    corpus_cls = StreamingReviewSents if args.streaming else ReviewSents
+    rs = corpus_cls(data=df, id_field=args.id_field, text_field=args.text_field, rating_field=args.rating_field)
 
     uni, bi, tri = Unigramer(), None, None
     uni.candidate_unigrams(rs, min_pct=args.min_pct, a_pct=args.a_pct)
@@ -26,52 +26,63 @@ def _ensure_type(fields, expected_type: type):
         raise TypeError('{} should be type {}, but got {}.'.format(str(fields), expected_type, type(fields)))
 
 
-def _calculate_variance(dataframe: pd.DataFrame, fields_to_calculate: list, output_field: str):
+def masked_ratings(dataframe: pd.DataFrame, fields: list, missing=None) -> np.ma.MaskedArray:
+    """
+    Rating fields of every row as a 2-D masked array. Ratings that are None, or equal to missing if given, are
+    masked.
+    """
+
+    raw = dataframe[fields].to_numpy(dtype=object)
+    mask = np.equal(raw, None).astype(bool)
+    if missing is not None:
+        mask |= np.equal(raw, missing).astype(bool)
+    return np.ma.masked_array(np.where(mask, np.nan, raw).astype(np.float64), mask=mask)
+
+
+def row_statistic(values: np.ma.MaskedArray, func) -> np.ndarray:
+    """
+    Compute func(array, axis=1) over unmasked values of every row. Rows with the same # of unmasked values are
+    stacked into one dense array, so func is called once per distinct count and every row is computed from exactly
+    the values, in the same order, that a call on that row alone would see.
+    """
+
+    mask = np.ma.getmaskarray(values)
+    data = np.ma.getdata(values)
+    counts = (~mask).sum(axis=1)
+    result = np.empty(values.shape[0], dtype=np.float64)
+    for count in np.unique(counts):
+        rows = np.flatnonzero(counts == count)
+        result[rows] = func(data[rows][~mask[rows]].reshape(rows.shape[0], count), axis=1)
+    return result
+
+
+def value_range(values: np.ndarray, axis: int):
+    return values.max(axis=axis) - values.min(axis=axis)
+
+
+def _calculate_statistic(dataframe: pd.DataFrame, fields_to_calculate: list, output_field: str, func,
+                         statistic: str):
     _ensure_type(fields_to_calculate, list)
     fields = fields_to_calculate if fields_to_calculate is not None else []
-    variance = []
-    for _, row in dataframe.iterrows():
-        values = list(filter(lambda x: x is not None, [row[field] for field in fields]))
-        variance.append(np.var(values))
-    dataframe[output_field] = variance
-    logging.info('Calculating variance finished.')
+    dataframe[output_field] = row_statistic(masked_ratings(dataframe, fields), func)
+    logging.info('Calculating {} finished.'.format(statistic))
     return dataframe
 
 
+def _calculate_variance(dataframe: pd.DataFrame, fields_to_calculate: list, output_field: str):
+    return _calculate_statistic(dataframe, fields_to_calculate, output_field, np.var, 'variance')
+
+
 def _calculate_kurtosis(dataframe: pd.DataFrame, fields_to_calculate: list, output_field: str):
-    _ensure_type(fields_to_calculate, list)
-    fields = fields_to_calculate if fields_to_calculate is not None else []
-    kurtosis = []
-    for _, row in dataframe.iterrows():
-        values = list(filter(lambda x: x is not None, [row[field] for field in fields]))
-        kurtosis.append(stats.kurtosis(np.array(values)))
-    dataframe[output_field] = kurtosis
-    logging.info('Calculating kurtosis finished.')
-    return dataframe
+    return _calculate_statistic(dataframe, fields_to_calculate, output_field, stats.kurtosis, 'kurtosis')
 
 
 def _calculate_skewness(dataframe: pd.DataFrame, fields_to_calculate: list, output_field: str):
-    _ensure_type(fields_to_calculate, list)
-    fields = fields_to_calculate if fields_to_calculate is not None else []
-    skewness = []
-    for _, row in dataframe.iterrows():
-        values = list(filter(lambda x: x is not None, [row[field] for field in fields]))
-        skewness.append(stats.skew(np.array(values)))
-    dataframe[output_field] = skewness
-    logging.info('Calculating skewness finished.')
-    return dataframe
+    return _calculate_statistic(dataframe, fields_to_calculate, output_field, stats.skew, 'skewness')
 
 
 def _calculate_range(dataframe: pd.DataFrame, fields_to_calculate: list, output_field: str):
-    _ensure_type(fields_to_calculate, list)
-    fields = fields_to_calculate if fields_to_calculate is not None else []
-    _range = []
-    for _, row in dataframe.iterrows():
-        values = list(filter(lambda x: x is not None, [row[field] for field in fields]))
-        _range.append(max(values) - min(values))
-    dataframe[output_field] = _range
-    logging.info('Calculating range finished.')
-    return dataframe
+    return _calculate_statistic(dataframe, fields_to_calculate, output_field, value_range, 'range')
 
 
 def _calculate_label(dataframe: pd.DataFrame, fields_to_calculate: str,
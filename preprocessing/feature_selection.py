@@ -1,14 +1,12 @@
 import os
 import re
 import argparse
-import itertools
 import enum
-import operator
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Set, Union
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.feature_selection import chi2, SelectKBest
+from preprocessing.ranking import FeatureStats, chi2_scores, rank_features, shared_tfidf, text_stats, tfidf_stats
+from utils.shared_matrix import SharedMatrix
 
 
 @enum.unique
@@ -31,31 +29,40 @@ def parse_cli():
     parser.add_argument('-f', '--tagged_file', help='Path of tagged file for Frequency mode.')
     parser.add_argument('-t', '--tagged_field', help='Tagged text field name for Frequency mode.')
     parser.add_argument('-c', '--chi2_label', help='Label used to compute score function for Chi-square mode.')
+    parser.add_argument('--no_cache', action='store_true', help='Recompute statistics even if cache file exists.')
     return parser.parse_args()
 
 
-def _sort_features_by_freq(corpus: pd.Series) -> List[str]:
-    vectorizer = CountVectorizer()
-    X = vectorizer.fit_transform(corpus.values)
-    features = vectorizer.get_feature_names()
-    counts = np.sum(X.toarray(), axis=0, dtype=np.int32)  # sum feature counts by column
-    if len(features) != len(counts):
-        raise AssertionError('Length of features does not equal to length of counts.')
-    frequency = {features[i]: counts[i] for i in range(len(features))}
-    return [x[0] for x in sorted(frequency.items(), key=operator.itemgetter(1), reverse=True)]
+def _sort_features_by_freq(tagged_path: str, tagged_field: str, use_cache: bool) -> List[str]:
+    stats = text_stats(tagged_path, tagged_field, use_cache=use_cache)
+    return [x[0] for x in rank_features(stats, 'freq')]
 
 
-def _chi2_feature_selection(df: pd.DataFrame, chi2_label: str, labels: List[str],
-                            num_features: Union[List[int], str]):
-    y = df[chi2_label]
-    columns_to_drop = [chi2_label] + labels
-    X = df.drop(columns=columns_to_drop)
-    if num_features == 'all' or num_features > X.shape[1]:
+def _chi2_feature_selection(stats: FeatureStats, scores: np.ndarray, num_features: Union[int, str]) -> List[str]:
+    """
+    Select top features by chi-square scores the same way as SelectKBest. Features keep their order in dataframe.
+    """
+
+    if num_features == 'all' or num_features > len(stats.features):
         num_features = 'all'
     print('# of features in data frame: {}'.format(num_features))
-    chi2_selector = SelectKBest(chi2, k=num_features)
-    chi2_selector.fit(X, y)
-    return chi2_selector
+    if num_features == 'all':
+        return stats.features.tolist()
+    # NaN scores, e.g. of features that appear in no document, are lowest like in SelectKBest
+    scores = np.where(np.isnan(scores), np.finfo(np.float64).min, scores)
+    mask = np.zeros(len(stats.features), dtype=bool)
+    mask[np.argsort(scores, kind='mergesort')[len(scores) - num_features:]] = True
+    return stats.features[mask].tolist()
+
+
+def _select_frame(shared: SharedMatrix, features: List[str], label_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Dataframe of given features taken from shared TFIDF matrix, followed by label fields.
+    """
+
+    col_idx = {column: i for i, column in enumerate(shared.columns)}
+    result = pd.DataFrame(shared.take_columns([col_idx[x] for x in features]).toarray(), columns=features)
+    return pd.concat([result, label_df], axis=1)
 
 
 if __name__ == '__main__':
@@ -94,44 +101,47 @@ if __name__ == '__main__':
     if mode is FeatureMode.CHI2:
         print('Chi2 label: {}'.format(args.chi2_label))
 
-    df = pd.read_csv(os.sep.join([args.working_dir, args.tfidf_file]))
-    print('TFIDF dataframe shape={}'.format(df.shape))
+    # only label fields are read as dataframe, features are taken from the sparse matrix
+    tfidf_path = os.sep.join([args.working_dir, args.tfidf_file])
+    if mode is FeatureMode.CHI2:
+        shared = shared_tfidf(tfidf_path, args.chi2_label, exclude=labels, use_cache=not args.no_cache)
+    else:
+        # label fields and non-numeric fields such as texts and IDs are not features
+        shared = shared_tfidf(tfidf_path, None, exclude=labels + ([args.chi2_label] if args.chi2_label else []),
+                              use_cache=not args.no_cache)
+    label_df = pd.read_csv(tfidf_path, usecols=labels)[labels]
+    print('TFIDF matrix shape={}'.format(shared.shape))
     if mode is FeatureMode.FREQ:
-        df_tag = pd.read_csv(os.sep.join([args.working_dir, args.tagged_file]))
-        print('Tagged dataframe shape={}'.format(df_tag.shape))
-        selected_features = _sort_features_by_freq(df_tag[args.tagged_field])
+        selected_features = _sort_features_by_freq(os.sep.join([args.working_dir, args.tagged_file]),
+                                                   args.tagged_field, not args.no_cache)
         if num_features == 'all':
-            selected_features.extend(labels)
-            result = df[selected_features]
+            result = _select_frame(shared, selected_features, label_df)
             print('Output shape: {}'.format(result.shape))
             filename = os.path.splitext(args.tfidf_file)[0] + '__{}_all.csv'.format(mode.name)
             print('Output file: {}'.format(filename))
             result.to_csv(os.sep.join([args.working_dir, filename]), index=False)
         else:
             for num in num_features:
-                features = selected_features[:num]
-                features.extend(labels)
-                result = df[features]
+                result = _select_frame(shared, selected_features[:num], label_df)
                 print('Output shape: {}'.format(result.shape))
                 filename = os.path.splitext(args.tfidf_file)[0] + '__{}_{}.csv'.format(mode.name, num)
                 print('Output file: {}'.format(filename))
                 result.to_csv(os.sep.join([args.working_dir, filename]), index=False)
     elif mode is FeatureMode.CHI2:
+        # statistics are computed once and shared by all # of features
+        stats = tfidf_stats(tfidf_path, args.chi2_label, exclude=labels, use_cache=not args.no_cache)
+        scores = chi2_scores(stats)
         if num_features == 'all':
-            chi2_selector = _chi2_feature_selection(df, args.chi2_label, labels, num_features)
-            result = df.iloc[:, chi2_selector.get_support(indices=True)]
-            for label in labels:
-                result.loc[:, label] = df[label]
+            features = _chi2_feature_selection(stats, scores, num_features)
+            result = _select_frame(shared, features, label_df)
             print('Output shape: {}'.format(result.shape))
             filename = os.path.splitext(args.tfidf_file)[0] + '__{}_all.csv'.format(mode.name)
             print('Output file: {}'.format(filename))
             result.to_csv(os.sep.join([args.working_dir, filename]), index=False)
         else:
             for num in num_features:
-                chi2_selector = _chi2_feature_selection(df, args.chi2_label, labels, num)
-                result = df.iloc[:, chi2_selector.get_support(indices=True)]
-                for label in labels:
-                    result.loc[:, label] = df[label]
+                features = _chi2_feature_selection(stats, scores, num)
+                result = _select_frame(shared, features, label_df)
                 print('Output shape: {}'.format(result.shape))
                 filename = os.path.splitext(args.tfidf_file)[0] + '__{}_{}.csv'.format(mode.name, num)
                 print('Output file: {}'.format(filename))
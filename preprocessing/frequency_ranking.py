@@ -1,8 +1,6 @@
 import argparse
 import os
-import numpy as np
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
+from preprocessing.ranking import rank_features, text_stats
 
 
 def parse_cli():
@@ -11,6 +9,7 @@ def parse_cli():
     parser.add_argument('data_file', help='Path of lemmatized text. Supports CSV file only.')
     parser.add_argument('--text_field', default='lemmatized', 
                         help='Lemmatized text field name. Default value "lemmatized" will be used if not provided.')
+    parser.add_argument('--no_cache', action='store_true', help='Recompute statistics even if cache file exists.')
     return parser.parse_args()
 
 
@@ -21,20 +20,10 @@ if __name__ == '__main__':
     print('Data file: {}'.format(args.data_file))
     print('Text field: {}'.format(args.text_field))
     
-    df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
-    print('Dataframe shape={}'.format(df.shape))
-
-    corpus = df[args.text_field]
-    vec = CountVectorizer()
-    x = vec.fit_transform(corpus.to_list())
-    features = vec.get_feature_names()
-    counts = np.sum(x.toarray(), axis=0, dtype=np.int32)  # sum features counts by column
-    assert len(features) == len(counts), \
-           'Length of features ({}) does not equal to length of counts ({}).'.format(len(features), len(counts))
-
-    frequency = {features[i]: counts[i] for i in range(len(features))}
-    frequency = sorted(frequency.items(), key=lambda x: x[1], reverse=True)
-    result = [(x[0], x[1]) for x in frequency]
+    stats = text_stats(os.sep.join([args.working_dir, args.data_file]), args.text_field,
+                       use_cache=not args.no_cache)
+    print('Dataframe shape={}'.format((stats.n_docs, len(stats.features))))
+    result = rank_features(stats, 'freq')
 
     filename = os.path.splitext(args.data_file)[0] + '__ranking-freq.txt'
     print('Output file: {}'.format(filename))
@@ -0,0 +1,187 @@
+from preprocessing.ngrams import ReviewSents, StreamingReviewSents, Unigramer, Bigramer, Trigramer, load_non_aspects, rare_lemma_table
+from preprocessing.polarizer import Polarizer
+from preprocessing.polarity_report import HtmlReportWriter, JsonReportWriter, TextReportWriter, export_reports
+from multiprocessing import cpu_count, get_context
+import argparse
+import hashlib
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Reviews of all products. Set by mine_products() before the worker pool is forked so that workers inherit the
+# dataframe, as well as the spacy model loaded by preprocessing.ngrams, through copy-on-write memory.
+_reviews = None
+
+
+def parse_cli():
+    parser = argparse.ArgumentParser(description='Mine aspects and their polarity for every product in parallel.')
+    parser.add_argument('working_dir', help='Working directory')
+    parser.add_argument('data_file', help='Path of original text data file. Supports CSV file only.')
+    parser.add_argument('product_field', help='Product key field name, e.g. hotel ID, store name or car model.')
+    parser.add_argument('--id_field', type=str, default='review_id',
+                        help='ID field name. Default "review_id" will be used if not provided.')
+    parser.add_argument('--text_field', type=str, default='standardized',
+                        help='Text field name. Default field name "standardized" will be used if not provided.')
+    parser.add_argument('--rating_field', type=str, default='overall_rating',
+                        help='Rating field name. Default field name "overall_rating" will be used if not provided.')
+    parser.add_argument('--min_reviews', type=int, default=50,
+                        help='Products having fewer reviews are skipped. Default value 50 will be used if not '
+                             'provided.')
+    parser.add_argument('--min_pct', type=float, default=0.001,
+                        help='Minimum percent of all sentences that contains wanted aspects. Default value 0.001 ' \
+                             'will be used if not provided.')
+    parser.add_argument('--a_pct', type=float, default=0.09,
+                        help='Minimum percent of average frequency of amod or acomp tokens that serve as noun modifier.')
+    parser.add_argument('--pmi_pct', type=float, default=0.09,
+                        help='Minimum percent of average frequency.')
+    parser.add_argument('--tri_review_pct', type=float, default=0.09,
+                        help='Percentage of reviews two bigrams linked in a trigram must appear together in.')
+    parser.add_argument('-p', '--processes', type=int, default=cpu_count(),
+                        help='Number of worker processes. Number of CPUs will be used if not provided.')
+    parser.add_argument('--tasks_per_child', type=int, default=1,
+                        help='Number of products a worker mines before it is replaced by a fresh process, which '
+                             'bounds the memory held by spacy documents. Default value 1 will be used if not '
+                             'provided.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Keep compact token features instead of spacy documents to reduce memory usage.')
+    parser.add_argument('--reports', type=str, default='',
+                        help='Comma-separated formats of polarity reports to write for every product. Supports '
+                             '"txt", "json" and "html". No report will be written if not provided.')
+    return parser.parse_args()
+
+
+def _product_filename(product) -> str:
+    # products differing in punctuation only, e.g. "A/B" and "A B", have the same readable part, hash tells them apart
+    readable = re.sub(r'[^\w\-.]+', '_', str(product)).strip('_')
+    digest = hashlib.sha1(str(product).encode('utf-8')).hexdigest()[:8]
+    return '{}-{}'.format(readable, digest) if len(readable) > 0 else digest
+
+
+def _write_reports(polarizer: Polarizer, filename_prefix: str, formats: list):
+    writer_classes = {'txt': TextReportWriter, 'json': JsonReportWriter, 'html': HtmlReportWriter}
+    files = [open('{}__report.{}'.format(filename_prefix, fmt), 'w', encoding='utf-8') for fmt in formats]
+    try:
+        writers = [writer_classes[fmt](fp) for fmt, fp in zip(formats, files)]
+        export_reports(polarizer, polarizer.top_asps[0], writers)
+    finally:
+        for fp in files:
+            fp.close()
+
+
+def _mine_product(task: tuple) -> list:
+    """
+    Run the full aspect mining and polarity chain for reviews of one product and save the result as JSON.
+    Returns rows of the combined summary.
+    """
+
+    product, row_idx, settings = task
+    data = _reviews.iloc[row_idx]
+
+    corpus_cls = StreamingReviewSents if settings['streaming'] else ReviewSents
+    rs = corpus_cls(data=data, id_field=settings['id_field'], text_field=settings['text_field'],
+                     rating_field=settings['rating_field'])
+    uni = Unigramer()
+    uni.candidate_unigrams(rs, min_pct=settings['min_pct'], a_pct=settings['a_pct'])
+    bi = Bigramer(unigramer=uni)
+    bi.candidate_bigrams(corpus=rs, min_pct=settings['min_pct'], pmi_pct=settings['pmi_pct'])
+    tri = Trigramer(bi)
+    tri.candidate_trigrams(corpus=rs, review_pct=settings['tri_review_pct'])
+    polarizer = Polarizer(uni, bi, tri)
+    polarizer.polarize_aspects(rs)
+
+    aspects = []
+    for aspect, n_reviews in zip(*polarizer.top_asps):
+        pos, mixed, neg = polarizer.aspect_pct[aspect]
+        aspects.append({
+            'aspect': aspect,
+            'ngram': len(aspect.split(' ')),
+            'n_reviews': n_reviews,
+            'avg_rating': float(np.mean(polarizer.ratings[aspect])) if polarizer.ratings[aspect] else None,
+            'pos': pos,
+            'mixed': mixed,
+            'neg': neg
+        })
+
+    result = {
+        'product': str(product),
+        'n_reviews': rs.n_reviews,
+        'n_sentences': rs.n_sent,
+        'aspects': aspects
+    }
+    filename_prefix = os.sep.join([settings['output_dir'], _product_filename(product)])
+    filename = filename_prefix + '.json'
+    with open(filename, 'w') as fp:
+        json.dump(result, fp)
+    if settings['reports']:
+        _write_reports(polarizer, filename_prefix, settings['reports'])
+    print('Product {}: {} reviews, {} aspects. Output file: {}'.format(product, rs.n_reviews, len(aspects), filename))
+
+    return [dict(product=str(product), **aspect) for aspect in aspects]
+
+
+def mine_products(df: pd.DataFrame, product_field: str, output_dir: str, processes: int, tasks_per_child: int,
+                  min_reviews: int, **settings) -> pd.DataFrame:
+    """
+    Group reviews by product and mine aspects of every group in a pool of forked workers.
+    Returns the combined summary of all products, one row per (product, aspect).
+    """
+
+    global _reviews
+    _reviews = df.reset_index(drop=True)
+    os.makedirs(output_dir, exist_ok=True)
+    settings['output_dir'] = output_dir
+
+    # build the rare lemma table in parent process so that it is shared by all workers
+    rare_lemma_table(load_non_aspects())
+
+    groups = _reviews.groupby(product_field).indices
+    tasks = [(product, row_idx, settings) for product, row_idx in groups.items() if len(row_idx) >= min_reviews]
+    print('{} of {} products have at least {} reviews.'.format(len(tasks), len(groups), min_reviews))
+
+    # schedule largest products first so that they do not become stragglers at the end
+    tasks.sort(key=lambda x: len(x[1]), reverse=True)
+
+    rows = []
+    with get_context('fork').Pool(processes=processes, maxtasksperchild=tasks_per_child) as pool:
+        for product_rows in pool.imap_unordered(_mine_product, tasks, chunksize=1):
+            rows.extend(product_rows)
+    return pd.DataFrame(rows, columns=['product', 'aspect', 'ngram', 'n_reviews', 'avg_rating',
+                                       'pos', 'mixed', 'neg'])
+
+
+if __name__ == '__main__':
+    args = parse_cli()
+
+    print('Working directory: {}'.format(args.working_dir))
+    print('Data file: {}'.format(args.data_file))
+    print('Product field: {}'.format(args.product_field))
+    print('ID field: {}'.format(args.id_field))
+    print('Text field: {}'.format(args.text_field))
+    print('Rating field: {}'.format(args.rating_field))
+    print('Minimum reviews: {}'.format(args.min_reviews))
+    print('Minimum percent: {}'.format(args.min_pct))
+    print('A percent: {}'.format(args.a_pct))
+    print('PMI percent: {}'.format(args.pmi_pct))
+    print('Processes: {}'.format(args.processes))
+    print('Streaming: {}'.format(args.streaming))
+    reports = [x for x in args.reports.split(',') if x]
+    print('Reports: {}'.format(reports))
+
+    df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
+    print('Dataframe shape={}'.format(df.shape))
+
+    basename = os.path.splitext(args.data_file)[0]
+    output_dir = os.sep.join([args.working_dir, basename + '__aspects'])
+    summary = mine_products(df, args.product_field, output_dir, args.processes, args.tasks_per_child,
+                            args.min_reviews, id_field=args.id_field, text_field=args.text_field,
+                            rating_field=args.rating_field, min_pct=args.min_pct, a_pct=args.a_pct,
+                            pmi_pct=args.pmi_pct, tri_review_pct=args.tri_review_pct, streaming=args.streaming,
+                            reports=reports)
+    summary.sort_values(by=['product', 'n_reviews'], ascending=[True, False], inplace=True)
+
+    filename = basename + '__aspects_summary.csv'
+    print('Output file: {}'.format(filename))
+    summary.to_csv(os.sep.join([args.working_dir, filename]), index=False)
+    print('Done!')
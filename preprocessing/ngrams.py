@@ -1,5 +1,6 @@
+from array import array
 from collections import Counter, defaultdict
-from sklearn.feature_extraction.text import CountVectorizer
+from itertools import chain
 from spacy.tokens import Span
 from typing import List, Set, Tuple
 import numpy as np
@@ -25,6 +26,60 @@ com_tag = {'IN', 'PRP', 'PRP$', 'DT', 'HYPH', 'TO', ',', '.', 'CC',
            ':', 'WP', 'POS', '``', "''", 'SYM', 'EX', 'PDT', 'UH',
            'NFP', 'XX'}
 
+# list of dependencies that modify a noun with an adjective
+mod_dep = {'amod', 'acomp'}
+
+# rare lemma tables memoized by set of non-aspect words, see rare_lemma_table()
+_rare_lemma_tables = {}
+
+
+def load_non_aspects() -> Set[str]:
+    """
+    Loads the set of words considered as non-aspects.
+    """
+    with open(os.sep.join(['resources', 'nonaspects.txt'])) as fp:
+        return {line.strip() for line in fp}
+
+
+class RareLemmaTable(dict):
+    """
+    Maps lemma ID to whether the lemma is uncommon enough to be a feature
+    word (log probability below max_prob) and is not a non-aspect
+    """
+
+    def __init__(self, vocab, non_aspects: frozenset, max_prob=-7.5):
+        """
+        INPUT: spacy Vocab, frozenset(str), float
+        OUTPUT: None
+
+        Fills the table for every lexeme already in vocab. Lemmas added to
+        vocab later are looked up once on first access.
+        """
+        super().__init__((lex.orth, lex.prob < max_prob and lex.text not in non_aspects) for lex in vocab)
+        self.vocab = vocab
+        self.non_aspects = non_aspects
+        self.max_prob = max_prob
+
+    def __missing__(self, lemma: int) -> bool:
+        lex = self.vocab[lemma]
+        is_rare = lex.prob < self.max_prob and lex.text not in self.non_aspects
+        self[lemma] = is_rare
+        return is_rare
+
+
+def rare_lemma_table(non_aspects: Set[str]) -> RareLemmaTable:
+    """
+    INPUT: set(str)
+    OUTPUT: RareLemmaTable
+
+    Returns the rare lemma table of parser vocabulary for given non-aspects.
+    Tables are built once and shared by all n-gramers in the process.
+    """
+    key = frozenset(non_aspects)
+    if key not in _rare_lemma_tables:
+        _rare_lemma_tables[key] = RareLemmaTable(parser.vocab, key)
+    return _rare_lemma_tables[key]
+
 
 class SentCustomProperties(object):
     """
@@ -86,24 +141,249 @@ class ReviewSents(object):
         n_sent = 0
         sentences = []
 
-        for _, row in self.data.iterrows():
-            review_id = row[self.id_field]
-            text = row[self.text_field].lower()
-            rating = row[self.rating_field]
-            try:
-                review = parser(text)
-            except AssertionError:
-                print('parser for review #{} failed'.format(review_id))
-                continue
-
-            for sent in review.sents:
-                if sent.string:
-                    sentences.append(SentCustomProperties(review_id, rating, n_sent, sent))
-                    n_sent += 1
+        for review_id, rating, sent in _iter_review_sents(self.data, self.id_field, self.text_field,
+                                                          self.rating_field):
+            sentences.append(SentCustomProperties(review_id, rating, n_sent, sent))
+            n_sent += 1
 
         return n_sent, sentences
 
 
+def _iter_review_sents(data: pd.DataFrame, id_field: str, text_field: str, rating_field: str):
+    """
+    INPUT: pd.DataFrame, str, str, str
+    OUTPUT: generator(tuple(review ID, rating, spacy sentence))
+
+    Parses reviews one by one and yields their non-empty sentences.
+    """
+
+    for _, row in data.iterrows():
+        review_id = row[id_field]
+        text = row[text_field].lower()
+        rating = row[rating_field]
+        try:
+            review = parser(text)
+        except AssertionError:
+            print('parser for review #{} failed'.format(review_id))
+            continue
+
+        for sent in review.sents:
+            if sent.string:
+                yield review_id, rating, sent
+
+
+class CompactToken(object):
+    """
+    Token view over the token table of StreamingReviewSents. Exposes the
+    subset of spacy Token attributes used by n-gramers.
+    """
+
+    __slots__ = ('corpus', 'i')
+
+    def __init__(self, corpus, i: int):
+        """
+        INPUT: StreamingReviewSents, int
+        OUTPUT: None
+
+        Attributes:
+            corpus (StreamingReviewSents): corpus owning the token table
+            i (int): index of token within corpus
+        """
+        self.corpus = corpus
+        self.i = i
+
+    @property
+    def lemma(self) -> int:
+        return int(self.corpus.tok_lemma[self.i])
+
+    @property
+    def lemma_(self) -> str:
+        return parser.vocab.strings[self.lemma]
+
+    @property
+    def tag_(self) -> str:
+        return parser.vocab.strings[int(self.corpus.tok_tag[self.i])]
+
+    @property
+    def dep_(self) -> str:
+        return parser.vocab.strings[int(self.corpus.tok_dep[self.i])]
+
+    @property
+    def head(self):
+        return CompactToken(self.corpus, int(self.corpus.tok_head[self.i]))
+
+    @property
+    def children(self):
+        corpus = self.corpus
+        s = np.searchsorted(corpus.sent_token, self.i, side='right') - 1
+        start, end = corpus.sent_token[s], corpus.sent_token[s + 1]
+        for j in np.flatnonzero(corpus.tok_head[start:end] == self.i) + start:
+            if j != self.i:
+                yield CompactToken(corpus, int(j))
+
+    def __eq__(self, other):
+        return isinstance(other, CompactToken) and self.corpus is other.corpus and self.i == other.i
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.i)
+
+
+class CompactSpan(object):
+    """
+    Span view over the token table of StreamingReviewSents. Exposes the
+    subset of spacy Span attributes used by n-gramers and Polarizer.
+    """
+
+    __slots__ = ('corpus', 'sent_idx', 'start', 'end')
+
+    def __init__(self, corpus, sent_idx: int, start: int, end: int):
+        """
+        INPUT: StreamingReviewSents, int, int, int
+        OUTPUT: None
+
+        Attributes:
+            corpus (StreamingReviewSents): corpus owning the token table
+            sent_idx (int): index of sentence containing the span
+            start (int): index of first token of span within corpus
+            end (int): index after last token of span within corpus
+        """
+        self.corpus = corpus
+        self.sent_idx = sent_idx
+        self.start = start
+        self.end = end
+
+    def _char_offset(self, i: int) -> int:
+        if i < self.corpus.sent_token[self.sent_idx + 1]:
+            return int(self.corpus.tok_idx[i])
+        return int(self.corpus.sent_char[self.sent_idx + 1])
+
+    @property
+    def string(self) -> str:
+        return self.corpus.text[self._char_offset(self.start):self._char_offset(self.end)]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __iter__(self):
+        for i in range(self.start, self.end):
+            yield CompactToken(self.corpus, i)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, _ = key.indices(len(self))
+            return CompactSpan(self.corpus, self.sent_idx, self.start + start, self.start + max(start, end))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('Token index {} out of range.'.format(key))
+        return CompactToken(self.corpus, self.start + key)
+
+
+class CompactSentences(object):
+    """
+    Sequence of SentCustomProperties created on access from the sentence
+    table of StreamingReviewSents.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __len__(self):
+        return self.corpus.n_sent
+
+    def __getitem__(self, sent_idx: int) -> SentCustomProperties:
+        corpus = self.corpus
+        span = CompactSpan(corpus, sent_idx, int(corpus.sent_token[sent_idx]), int(corpus.sent_token[sent_idx + 1]))
+        return SentCustomProperties(corpus.sent_review_id[sent_idx], corpus.sent_rating[sent_idx], sent_idx, span)
+
+    def __iter__(self):
+        for sent_idx in range(len(self)):
+            yield self[sent_idx]
+
+
+class StreamingReviewSents(object):
+    """
+    Drop-in replacement of ReviewSents which does not retain spacy
+    documents. Token features needed by n-gramers and Polarizer are
+    extracted into compact tables while parsing, so memory is bounded by
+    the tables rather than by the parses.
+    """
+
+    def __init__(self, data: pd.DataFrame, id_field: str, text_field: str, rating_field: str):
+        """
+        INPUT: pd.DataFrame, str, str, str
+        OUTPUT: None
+
+        Attributes:
+            n_reviews (int): total number of reviews for product
+            n_sent (int): total number of sentences in all reviews for product
+            text (str): text of all sentences concatenated into one buffer
+            sent_char (np.array): {sentence index -> offset of sentence in text}, plus end of text
+            sent_token (np.array): {sentence index -> index of first token}, plus number of tokens
+            sent_review_id (np.array): {sentence index -> ID of review where sentence originated}
+            sent_rating (np.array): {sentence index -> customer review rating}
+            tok_lemma (np.array): {token index -> lemma ID}
+            tok_tag (np.array): {token index -> tag ID}
+            tok_dep (np.array): {token index -> dependency ID}
+            tok_head (np.array): {token index -> index of head token}
+            tok_idx (np.array): {token index -> offset of token in text}
+            sentences (CompactSentences): sequence of SentCustomProperties
+        """
+        self.id_field = id_field
+        self.text_field = text_field
+        self.rating_field = rating_field
+        self.n_reviews = data.shape[0]
+        self._parse_sentences(data)
+        self.n_sent = len(self.sent_rating)
+        self.sentences = CompactSentences(self)
+
+    def _parse_sentences(self, data: pd.DataFrame):
+        """
+        Uses spacy to parse and split the sentences, and keeps only the
+        token features of each sentence.
+        """
+
+        chunks = []
+        sent_char, sent_token = array('q', [0]), array('q', [0])
+        review_ids, ratings = [], array('d')
+        tok_lemma, tok_tag, tok_dep = array('Q'), array('Q'), array('Q')
+        tok_head, tok_idx = array('q'), array('q')
+        n_chars, n_tokens = 0, 0
+
+        for review_id, rating, sent in _iter_review_sents(data, self.id_field, self.text_field, self.rating_field):
+            # token indices and offsets are relative to the whole corpus
+            first_i, first_char = sent[0].i, sent.start_char
+            for token in sent:
+                tok_lemma.append(token.lemma)
+                tok_tag.append(token.tag)
+                tok_dep.append(token.dep)
+                tok_head.append(n_tokens + token.head.i - first_i)
+                tok_idx.append(n_chars + token.idx - first_char)
+
+            string = sent.string
+            chunks.append(string)
+            n_chars += len(string)
+            n_tokens += len(sent)
+            sent_char.append(n_chars)
+            sent_token.append(n_tokens)
+            review_ids.append(review_id)
+            ratings.append(rating)
+
+        self.text = ''.join(chunks)
+        self.sent_char = np.frombuffer(sent_char, dtype=np.int64)
+        self.sent_token = np.frombuffer(sent_token, dtype=np.int64)
+        self.sent_review_id = np.array(review_ids)
+        self.sent_rating = np.frombuffer(ratings, dtype=np.float64)
+        self.tok_lemma = np.frombuffer(tok_lemma, dtype=np.uint64)
+        self.tok_tag = np.frombuffer(tok_tag, dtype=np.uint64)
+        self.tok_dep = np.frombuffer(tok_dep, dtype=np.uint64)
+        self.tok_head = np.frombuffer(tok_head, dtype=np.int64)
+        self.tok_idx = np.frombuffer(tok_idx, dtype=np.int64)
+
+
 class Unigramer(object):
     """
     Class for extracting Unigrams.
@@ -111,38 +391,53 @@ class Unigramer(object):
 
     def __init__(self):
         """
-        Attribures:
+        Attributes:
             cnt_dict (dict): {word -> word_freq in all reviews}
             aspect_dict (dict): {aspect -> aspect_freq in all reviews}
             dep_dict (dict): {word -> list(dependency types that corresponds with the word token)}
+            dep_cnt (dict): {word -> number of dependencies in dep_dict}
+            mod_cnt (dict): {word -> number of 'amod' or 'acomp' dependencies in dep_dict}
             rev_dict (dict): {word -> set(review IDs containing this word)}
             sent_dict (dict): {word -> list(sentence indices containing this word)}
             word_pos_dict (dict): {word -> list(token index of word within spacy sentences)}
             unigrams (set): set of unigrams obtained with candidate_unigrams function
             n_reviews (int): total number of reviews
             non_aspects (set): a set of words considered as non-aspects
+            rare_lemmas (RareLemmaTable): {lemma ID -> uncommon and not a non-aspect}
         """
         self.cnt_dict = defaultdict(int)
         self.aspect_dict = defaultdict(int)
         self.dep_dict = defaultdict(list)
+        self.dep_cnt = defaultdict(int)
+        self.mod_cnt = defaultdict(int)
         self.rev_dict = defaultdict(set)
         self.sent_dict = defaultdict(list)
         self.word_pos_dict = defaultdict(list)
         self.unigrams = None
         self.n_reviews = None
-        self.non_aspects = set()
+        self.non_aspects = load_non_aspects()
+        self.rare_lemmas = rare_lemma_table(self.non_aspects)
 
-        with open(os.sep.join(['resources', 'nonaspects.txt'])) as fp:
-            for line in fp:
-                self.non_aspects.add(line.strip())
+    def _add_dep(self, word: str, dep: str):
+        """
+        INPUT: str, str
+        OUTPUT: None
 
-    def _iter_nouns(self, sent: SentCustomProperties):
+        Records a dependency of word, and counts it for the amod/acomp filter.
+        Tokens are not kept so that they do not pin spacy documents in memory.
+        """
+        self.dep_dict[word].append(dep)
+        self.dep_cnt[word] += 1
+        if dep in mod_dep:
+            self.mod_cnt[word] += 1
+
+    def _iter_nouns(self, sent: SentCustomProperties) -> Set[int]:
         """
         INPUT: SentCustomProperties
-        OUTPUT: str
+        OUTPUT: set(int)
 
         Iterates through each token of spacy sentence and collects
-        lemmas of all nouns into a set.
+        lemma IDs of all nouns into a set.
         """
 
         wordset = set()
@@ -150,14 +445,13 @@ class Unigramer(object):
 
         for token in sent.sent:
             self.cnt_dict[token.lemma_] += 1
-            self.dep_dict[token.head.lemma_].append((token, token.dep_))
+            self._add_dep(token.head.lemma_, token.dep_)
             if token.dep_ == 'acomp':
                 acomp_dict[token.head] = token
-            root = parser.vocab[token.lemma].prob
 
             # filter to only consider nouns, valid aspects, and uncommon words
-            if token.tag_ in noun_tag and (root < -7.5 and token.lemma_ not in self.non_aspects):
-                wordset.add(token.lemma_)
+            if token.tag_ in noun_tag and self.rare_lemmas[token.lemma]:
+                wordset.add(token.lemma)
                 self.aspect_dict[token.lemma_] += 1  # treat nouns as aspects
                 self.rev_dict[token.lemma_].add(sent.review_id)
 
@@ -168,9 +462,9 @@ class Unigramer(object):
 
         for head_word, token in acomp_dict.items():
             for child in filter(lambda x: x.tag_ in noun_tag, head_word.children):
-                self.dep_dict[child.lemma_].append((token, token.dep_))
+                self._add_dep(child.lemma_, token.dep_)
 
-        return ' '.join(wordset)
+        return wordset
 
     def candidate_unigrams(self, corpus: ReviewSents, min_pct=0.001, a_pct=0.09) -> Set[str]:
         """
@@ -186,28 +480,22 @@ class Unigramer(object):
         Each candidate unigram must be a noun.
         """
 
-        count_x = []
         self.n_reviews = corpus.n_reviews
 
-        for sent in corpus.sentences:
-            count_x.append(self._iter_nouns(sent))
-
-        cnt_vec = CountVectorizer()
-        freq = cnt_vec.fit_transform(count_x)
-
-        total_count = freq.toarray().sum(axis=0)
+        # noun lemma IDs are unique within a sentence, so counting them gives number of sentences per noun
+        lemma_ids = np.fromiter(chain.from_iterable(self._iter_nouns(sent) for sent in corpus.sentences),
+                                dtype=np.uint64)
+        lemma_ids, total_count = np.unique(lemma_ids, return_counts=True)
 
         # filter for aspect appearing in min_pct of sentences
-        features = np.array(cnt_vec.get_feature_names())
-        unigrams = set(features[total_count >= min_pct * corpus.n_sent])
+        lemma_ids = lemma_ids[total_count >= min_pct * corpus.n_sent]
+        features = [parser.vocab.strings[int(x)] for x in lemma_ids]
 
-        # filter for percentage of time aspect is modified by amod
-        for word in unigrams.copy():
-            arr = np.array([x[1] for x in self.dep_dict[word]])
-            arr = ((arr == 'amod') | (arr == 'acomp'))
-
-            if np.mean(arr) < a_pct:
-                unigrams.remove(word)
+        # filter for percentage of time aspect is modified by amod, aspects without dependencies are kept
+        n_dep = pd.Series(self.dep_cnt, dtype=np.int64).reindex(features, fill_value=0).values
+        n_mod = pd.Series(self.mod_cnt, dtype=np.int64).reindex(features, fill_value=0).values
+        keep = (n_dep == 0) | (n_mod >= a_pct * n_dep)
+        unigrams = set(np.array(features, dtype=object)[keep])
 
         self.unigrams = unigrams
 
@@ -257,6 +545,8 @@ class Bigramer(object):
             bigrams (set): set of bigrams obtained with candidate_bigrams function
             bigram_words (set): set of words used in bigrams
             unigramer (Unigramer): Unigramer object for product
+            non_aspects (set): a set of words considered as non-aspects
+            rare_lemmas (RareLemmaTable): {lemma ID -> uncommon and not a non-aspect}
         """
         self.avg_dist = defaultdict(float)
         self.distances = defaultdict(list)
@@ -268,11 +558,8 @@ class Bigramer(object):
         self.bigrams = set()
         self.bigram_words = set()
         self.unigramer = unigramer
-        self.non_aspects = set()
-
-        with open(os.sep.join(['resources', 'nonaspects.txt'])) as fp:
-            for line in fp:
-                self.non_aspects.add(line.strip())
+        self.non_aspects = load_non_aspects()
+        self.rare_lemmas = rare_lemma_table(self.non_aspects)
 
     def _reverse_key(self, key, new_key):
         """
@@ -315,11 +602,9 @@ class Bigramer(object):
                     arr = arr[arr != token]
 
                     for item in arr:
-                        root = parser.vocab[item.lemma].prob
                         # filter out unlikely features
-                        if root < -7.5 and (item.dep_ not in com_dep and
-                                            item.tag_ not in com_tag and
-                                            item.lemma_ not in self.non_aspects):
+                        if self.rare_lemmas[item.lemma] and (item.dep_ not in com_dep and
+                                                             item.tag_ not in com_tag):
                             bigrm = ' '.join(sorted([item.lemma_, token.lemma_]))
                             dist = item.i - token.i
                             word_sort = item.lemma_ < token.lemma_
@@ -408,7 +693,7 @@ class Trigramer(object):
         INPUT: Bigramer
         OUTPUT: None
 
-        Attribures:
+        Attributes:
             bigramer (Bigramer): Bigramer object for product
             rev_dict (dict): {word -> set(review IDs containing this word)}
             sent_dict (dict): {word -> list(sentence indices containing this word)}
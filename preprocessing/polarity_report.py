@@ -0,0 +1,265 @@
+'''
+This script renders polarity reports of aspects scored by the Polarizer
+class from polarizer.py, and exports them as text, JSON or HTML.
+'''
+
+from html import escape
+from typing import Dict, Iterable, List
+import json
+import numpy as np
+
+# polarity classes in report order, with their display labels
+categories = [('pos', 'Positive Sentiment'),
+              ('mixed', 'Mixed Sentiment'),
+              ('neg', 'Negative Sentiment')]
+
+
+class TextOffsets(object):
+    '''
+    Start offsets of the space separated words of a review text, computed
+    once so that excerpts around any character can be cut without
+    re-splitting the text
+    '''
+
+    __slots__ = ('text', 'starts')
+
+    def __init__(self, text: str):
+        '''
+        INPUT: str
+        OUTPUT: None
+
+        Attributes:
+            text (str):         review text
+            starts (np.array):  start offset of every word in text, plus
+                                end of text + 1
+        '''
+        lengths = np.fromiter(map(len, text.split(' ')), dtype=np.int64)
+        stacked = np.concatenate(([0], np.cumsum(lengths)))
+        self.text = text
+        self.starts = stacked + np.arange(stacked.shape[0])
+
+    def snippet(self, char_idx: int, max_txt_len: int, reach=10) -> str:
+        '''
+        INPUT: int, int, int
+        OUTPUT: str
+
+        Args:
+            char_idx: offset of aspect within text
+            max_txt_len: max length of excerpt
+            reach: max number of words to keep on each side of aspect
+
+        Returns the widest excerpt centred on aspect, of at most reach words
+        on each side, that fits in max_txt_len. Returns empty string if even
+        the aspect word does not fit.
+        '''
+        text = self.text
+        if len(text) <= max_txt_len:
+            return text
+
+        starts, last = self.starts, self.starts.shape[0] - 1
+        where = int(np.searchsorted(starts, char_idx or 0))
+
+        for r in range(reach, -1, -1):
+            start = int(starts[max(0, where - r)])
+            end = int(starts[min(where + r + 1, last)])
+            if min(end, len(text)) - start <= max_txt_len:
+                return text[start:end]
+        return ''
+
+
+def build_report(polarizer, aspect: str, max_txt_len=80, offsets: Dict[str, TextOffsets] = None) -> dict:
+    '''
+    INPUT: Polarizer, str, int, dict
+    OUTPUT: dict
+
+    Args:
+        polarizer: Polarizer whose polarize_aspects has scored aspect
+        aspect: aspect to build report for
+        max_txt_len: max length of each excerpt
+        offsets: cache of {review text -> TextOffsets}, shared across
+                 aspects so that every review text is split only once
+
+    Builds the polarity summary and the excerpts of every polarity class
+    of aspect.
+    '''
+    if offsets is None:
+        offsets = dict()
+
+    dic = polarizer.aspect_pol_list[aspect]
+    ratings = polarizer.ratings[aspect]
+    pos, mixed, neg = polarizer.aspect_pct[aspect]
+    excerpts = dict()
+
+    for category, _ in categories:
+        excerpts[category] = []
+
+        for txt, asp_idx, rating, review, pol_blob in dic[category]:
+            text_offsets = offsets.get(txt)
+            if text_offsets is None:
+                text_offsets = offsets[txt] = TextOffsets(txt)
+
+            frag = text_offsets.snippet(asp_idx, max_txt_len)
+            if frag:
+                excerpts[category].append({
+                    'review': review,
+                    'rating': rating,
+                    'polarity': pol_blob,
+                    'text': frag.strip()
+                })
+
+    return {
+        'aspect': aspect,
+        'avg_rating': float(np.mean(ratings)) if ratings else float('nan'),
+        'pos': pos,
+        'mixed': mixed,
+        'neg': neg,
+        'excerpts': excerpts
+    }
+
+
+def render_text(report: dict, max_txt_len=80, lines_pos=0, lines_mixed=0, lines_neg=0) -> str:
+    '''
+    INPUT: dict, int, int, int, int
+    OUTPUT: str
+
+    Args:
+        report: report built by build_report
+        max_txt_len: max length for each line
+        lines_pos: if > 0, number of lines to pad positive sentiment to
+        lines_mixed: if > 0, number of lines to pad mixed sentiment to
+        lines_neg: if > 0, number of lines to pad negative sentiment to
+
+    Renders report as fixed-width text.
+    '''
+    total_lines = {'pos': lines_pos, 'mixed': lines_mixed, 'neg': lines_neg}
+    rule = ('-' * (max_txt_len - 2)).ljust(max_txt_len)
+    blank = ' ' * max_txt_len
+
+    lines = [rule, rule, '',
+             ('-' * 39).ljust(max_txt_len),
+             report['aspect'].ljust(max_txt_len),
+             ('-' * 39).ljust(max_txt_len), '',
+             'average rating: {}'.format(report['avg_rating']).ljust(max_txt_len),
+             'positive: {}%'.format(report['pos']).ljust(max_txt_len),
+             'mixed: {}%'.format(report['mixed']).ljust(max_txt_len),
+             'negative: {}%'.format(report['neg']).ljust(max_txt_len), '']
+
+    for category, label in categories:
+        excerpts = report['excerpts'][category]
+        lines.append(label.ljust(max_txt_len))
+        lines.append(('-' * 28).ljust(max_txt_len))
+        lines.extend(excerpt['text'].ljust(max_txt_len) for excerpt in excerpts)
+        lines.extend([blank] * (max(total_lines[category] - len(excerpts), 0) + 1))
+
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _to_builtin(value):
+    # numpy scalars of review IDs and ratings
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def _nan_to_none(value):
+    # NaN, e.g. average rating of an aspect without ratings, is not valid JSON
+    if isinstance(value, dict):
+        return {k: _nan_to_none(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_nan_to_none(v) for v in value]
+    if isinstance(value, (float, np.floating)) and np.isnan(value):
+        return None
+    return value
+
+
+class TextReportWriter(object):
+    '''
+    Writes reports as fixed-width text, the format of
+    Polarizer.print_polarity
+    '''
+
+    def __init__(self, fp, max_txt_len=80):
+        self.fp = fp
+        self.max_txt_len = max_txt_len
+
+    def write(self, report: dict):
+        self.fp.write(render_text(report, self.max_txt_len))
+        self.fp.write('\n')
+
+    def close(self):
+        pass
+
+
+class JsonReportWriter(object):
+    '''
+    Writes reports as a JSON array, one element per aspect
+    '''
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.n_reports = 0
+        self.fp.write('[')
+
+    def write(self, report: dict):
+        if self.n_reports:
+            self.fp.write(',\n')
+        json.dump(_nan_to_none(report), self.fp, default=_to_builtin, allow_nan=False)
+        self.n_reports += 1
+
+    def close(self):
+        self.fp.write(']\n')
+
+
+class HtmlReportWriter(object):
+    '''
+    Writes reports as a HTML page, one section per aspect
+    '''
+
+    def __init__(self, fp, title='Aspect polarity'):
+        self.fp = fp
+        self.fp.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{0}</title></head>\n'
+                      '<body>\n<h1>{0}</h1>\n'.format(escape(title)))
+
+    def write(self, report: dict):
+        parts = ['<section>\n<h2>{}</h2>\n'.format(escape(report['aspect'])),
+                 '<p>average rating: {} | positive: {}% | mixed: {}% | negative: {}%</p>\n'.format(
+                     report['avg_rating'], report['pos'], report['mixed'], report['neg'])]
+
+        for category, label in categories:
+            parts.append('<h3>{}</h3>\n<ul>\n'.format(label))
+            for excerpt in report['excerpts'][category]:
+                parts.append('<li data-review="{}" data-polarity="{}">{}</li>\n'.format(
+                    escape(str(excerpt['review'])), excerpt['polarity'], escape(excerpt['text'])))
+            parts.append('</ul>\n')
+
+        parts.append('</section>\n')
+        self.fp.write(''.join(parts))
+
+    def close(self):
+        self.fp.write('</body>\n</html>\n')
+
+
+def export_reports(polarizer, aspects: Iterable[str], writers: List, max_txt_len=80):
+    '''
+    INPUT: Polarizer, list(str), list(writer), int
+    OUTPUT: None
+
+    Args:
+        polarizer: Polarizer whose polarize_aspects has scored aspects
+        aspects: aspects to export reports for
+        writers: report writers, each having write(report) and close()
+        max_txt_len: max length of each excerpt
+
+    Builds the report of every aspect once and streams it to all writers.
+    Writers are closed at the end.
+    '''
+    offsets = dict()
+
+    for aspect in aspects:
+        report = build_report(polarizer, aspect, max_txt_len, offsets)
+        for writer in writers:
+            writer.write(report)
+
+    for writer in writers:
+        writer.close()
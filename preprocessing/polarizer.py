@@ -7,9 +7,9 @@ classes from parsers.py
 from afinn import Afinn
 from collections import defaultdict
 from preprocessing.ngrams import ReviewSents, Unigramer, Bigramer, Trigramer
+from preprocessing.polarity_report import build_report, render_text
 from textblob import TextBlob
 from typing import List
-import numpy as np
 import unicodedata
 
 afinn = Afinn()
@@ -297,56 +297,10 @@ class Polarizer(object):
             printing: option to permit or supress printing
 
         Prints out the polarity and full text sentences for reviews containing
-        aspect
+        aspect. Use polarity_report.export_reports to render many aspects.
         '''
-        dic = self.aspect_pol_list[aspect]
-        categories = [('pos', 'Positive Sentiment', lines_pos),
-                      ('mixed', 'Mixed Sentiment', lines_mixed),
-                      ('neg', 'Negative Sentiment', lines_neg)]
-
-        big_str = ('-' * (max_txt_len - 2)).ljust(max_txt_len) + '\n'
-        big_str += ('-' * (max_txt_len - 2)).ljust(max_txt_len) + '\n\n'
-
-        big_str += ('-' * 39).ljust(max_txt_len) + '\n'
-        big_str += aspect.ljust(max_txt_len) + '\n'
-        big_str += ('-' * 39).ljust(max_txt_len) + '\n\n'
-
-        good, mixed, bad = self.aspect_pct[aspect]
-
-        big_str += 'average rating: {}'.format(np.mean(self.ratings[aspect])) \
-                   .ljust(max_txt_len) + '\n'
-        big_str += 'positive: {}%'.format(good).ljust(max_txt_len) + '\n'
-        big_str += 'mixed: {}%'.format(mixed).ljust(max_txt_len) + '\n'
-        big_str += 'negative: {}%'.format(bad).ljust(max_txt_len) + '\n\n'
-
-        for category, label, total_lines in categories:
-            big_str += label.ljust(max_txt_len) + '\n'
-            big_str += ('-' * 28).ljust(max_txt_len) + '\n'
-
-            for txt, asp_idx, _, _, _ in dic[category]:
-                reach = 10
-                frag = txt
-
-                while len(frag) > max_txt_len:
-                    chars = txt.split(" ")
-
-                    lst = map(len, chars)
-                    stacked = np.hstack([0, np.cumsum(lst)])
-                    lst = np.arange(stacked.shape[0]) + stacked
-
-                    where = np.searchsorted(lst, asp_idx)
-                    start = lst[max(0, where - reach)]
-                    end = lst[min(where + reach + 1, len(lst) - 1)]
-
-                    frag = txt[start:end]
-                    reach -= 1
-
-                if frag:
-                    big_str += frag.strip().ljust(max_txt_len) + '\n'
-                    if total_lines:
-                        total_lines -= 1
-
-            big_str += (' ' * max_txt_len + '\n') * (total_lines + 1)
+        report = build_report(self, aspect, max_txt_len)
+        big_str = render_text(report, max_txt_len, lines_pos, lines_mixed, lines_neg)
 
         if printing:
             print(big_str)
@@ -0,0 +1,334 @@
+import argparse
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import Iterable, List, Tuple
+from sklearn.feature_extraction.text import CountVectorizer
+from utils.shared_matrix import SharedMatrix
+
+
+def parse_cli():
+    parser = argparse.ArgumentParser(description='Rank features of TFIDF file by several rankers in one pass.')
+    parser.add_argument('working_dir', help='Working directory')
+    parser.add_argument('data_file', help='Name of TFIDF data file. Supports CSV file only.')
+    parser.add_argument('label', help='Label field name.')
+    parser.add_argument('-r', '--rankers', default='freq,df,chi2,gini',
+                        help='Comma-separated rankers among {}. Default "freq,df,chi2,gini" will be used if not '
+                             'provided.'.format(','.join(RANKERS)))
+    parser.add_argument('--pos_label', default='pos',
+                        help='Value of positive label for gini ranker. Default value "pos" will be used if not '
+                             'provided.')
+    parser.add_argument('--no_cache', action='store_true', help='Recompute statistics even if cache file exists.')
+    return parser.parse_args()
+
+
+def read_sparse_tfidf(path: str, label: str = None, exclude: Iterable[str] = (),
+                      chunksize=5000) -> Tuple[sp.csr_matrix, List[str], pd.Series]:
+    """
+    Read a dense TFIDF CSV file chunk by chunk into a sparse document-term matrix. Fields that are not numeric in the
+    first chunk, e.g. texts, are skipped as well.
+    :param path: path of TFIDF file.
+    :param label: label field name, which is excluded from the matrix. None if file has no label.
+    :param exclude: names of other non-feature fields to exclude from the matrix.
+    :param chunksize: # of rows to read at a time.
+    :return: tuple of (CSR matrix, feature names, labels). Labels is None if label is None.
+    """
+
+    blocks, labels, features = [], [], None
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if label is not None:
+            labels.append(chunk.pop(label))
+        chunk = chunk.drop(columns=[x for x in exclude if x != label])
+        if features is None:
+            features = chunk.select_dtypes(include='number').columns.tolist()
+            skipped = [x for x in chunk.columns if x not in set(features)]
+            if len(skipped) > 0:
+                print('Non-numeric fields are skipped: {}'.format(skipped))
+        try:
+            blocks.append(sp.csr_matrix(chunk[features].to_numpy(dtype=np.float64)))
+        except ValueError as err:
+            raise ValueError('Non-numeric value in a feature field of {} after row {}: {}'
+                             .format(path, len(blocks) * chunksize, err)) from None
+    labels = pd.concat(labels, ignore_index=True) if label is not None else None
+    return sp.vstack(blocks, format='csr'), features, labels
+
+
+class FeatureStats(object):
+    """
+    Sufficient statistics of a document-term matrix and its labels, from which all feature rankings are derived.
+    """
+
+    def __init__(self, features, classes, class_count, class_sum, class_df):
+        """
+        :param features: feature names, of length n_features.
+        :param classes: sorted distinct labels, of length n_classes.
+        :param class_count: # of documents of every class.
+        :param class_sum: n_classes x n_features sums of feature values in documents of every class.
+        :param class_df: n_classes x n_features # of documents of every class that a feature appears in.
+        """
+
+        self.features = np.asarray(features)
+        self.classes = np.asarray(classes)
+        self.class_count = np.asarray(class_count)
+        self.class_sum = np.asarray(class_sum)
+        self.class_df = np.asarray(class_df)
+
+    @classmethod
+    def from_matrix(cls, X: sp.spmatrix, features: List[str], labels: pd.Series = None):
+        """
+        Compute statistics in one pass over matrix.
+        :param X: document-term matrix.
+        :param features: feature names of matrix columns.
+        :param labels: label of every document. All documents are of one class if None.
+        """
+
+        X = sp.csr_matrix(X)
+        if labels is None:
+            labels = np.zeros(X.shape[0], dtype=np.int64).astype(str)
+        classes, class_idx = np.unique(np.asarray(labels).astype(str), return_inverse=True)
+        Y = sp.csr_matrix((np.ones(X.shape[0], dtype=np.int64), (np.arange(X.shape[0]), class_idx)),
+                          shape=(X.shape[0], len(classes)))
+
+        appear = X.copy()
+        appear.data = (appear.data > 0).astype(np.int64)  # NaN and non-positive values count as not appeared
+        appear.eliminate_zeros()
+
+        class_count = np.asarray(Y.sum(axis=0)).ravel()
+        class_sum = (Y.T @ X).toarray()
+        class_df = (Y.T @ appear).toarray()
+        return cls(features, classes, class_count, class_sum, class_df)
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.class_count.sum())
+
+    @property
+    def term_sum(self) -> np.ndarray:
+        return self.class_sum.sum(axis=0)
+
+    @property
+    def doc_freq(self) -> np.ndarray:
+        return self.class_df.sum(axis=0)
+
+    def save(self, path: str, **meta):
+        np.savez_compressed(path, features=self.features.astype(str), classes=self.classes,
+                            class_count=self.class_count, class_sum=self.class_sum, class_df=self.class_df,
+                            **{'meta_' + k: np.asarray(v) for k, v in meta.items()})
+
+    @classmethod
+    def load(cls, path: str, **meta):
+        """
+        Load statistics saved by save(). Returns None if file does not exist or was saved with different meta.
+        """
+
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            for k, v in meta.items():
+                key = 'meta_' + k
+                if key not in data or not np.array_equal(data[key], np.asarray(v)):
+                    return None
+            return cls(data['features'], data['classes'], data['class_count'], data['class_sum'], data['class_df'])
+
+
+def _columns_suffix(exclude: List[str]) -> str:
+    # files derived from one source file with different excluded fields must not overwrite each other
+    if len(exclude) == 0:
+        return ''
+    return '-' + hashlib.sha1('\0'.join(exclude).encode('utf-8')).hexdigest()[:8]
+
+
+def _cached_stats(path: str, cache_path: str, compute, use_cache: bool, **meta) -> FeatureStats:
+    # statistics are reused as long as source file and the way they are computed are unchanged
+    source = os.stat(path)
+    meta.update(source_size=source.st_size, source_mtime=source.st_mtime_ns)
+    stats = FeatureStats.load(cache_path, **meta) if use_cache else None
+    if stats is not None:
+        print('Statistics are loaded from cache file: {}'.format(cache_path))
+        return stats
+
+    stats = compute()
+    stats.save(cache_path, **meta)
+    print('Statistics are saved to cache file: {}'.format(cache_path))
+    return stats
+
+
+def tfidf_stats(path: str, label: str, exclude: Iterable[str] = (), chunksize=5000,
+                use_cache=True) -> FeatureStats:
+    """
+    Statistics of a TFIDF CSV file by label, cached on disk next to the file. Every set of excluded fields has its
+    own cache file.
+    :param path: path of TFIDF file.
+    :param label: label field name.
+    :param exclude: names of other non-feature fields.
+    :param chunksize: # of rows to read at a time.
+    :param use_cache: whether to use cache file if it is valid.
+    """
+
+    exclude = sorted(set(exclude) - {label})
+
+    def compute():
+        X, features, labels = read_sparse_tfidf(path, label, exclude, chunksize)
+        return FeatureStats.from_matrix(X, features, labels)
+
+    cache_path = os.path.splitext(path)[0] + '__stats-{}{}.npz'.format(label, _columns_suffix(exclude))
+    return _cached_stats(path, cache_path, compute, use_cache, label=label, exclude=np.asarray(exclude, dtype=str))
+
+
+def shared_tfidf(path: str, label: str = None, exclude: Iterable[str] = (), chunksize=5000,
+                 use_cache=True) -> SharedMatrix:
+    """
+    Sparse matrix of a TFIDF CSV file saved next to the file, which worker processes can memory-map.
+    The matrix is reused as long as source file is unchanged.
+    :param path: path of TFIDF file.
+    :param label: label field name, saved as labels of the matrix. None if file has no label.
+    :param exclude: names of other non-feature fields.
+    :param chunksize: # of rows to read at a time.
+    :param use_cache: whether to reuse saved matrix if it is valid.
+    """
+
+    exclude = sorted(set(exclude) - {label})
+    source = os.stat(path)
+    meta = dict(label=label, exclude=exclude, source_size=source.st_size, source_mtime=source.st_mtime_ns)
+    matrix_path = os.path.splitext(path)[0] + ('__matrix-{}'.format(label) if label is not None else '__matrix') + \
+        _columns_suffix(exclude)
+
+    shared = SharedMatrix.load(matrix_path, **meta) if use_cache else None
+    if shared is not None:
+        print('Matrix is loaded from: {}'.format(matrix_path))
+        return shared
+
+    X, features, labels = read_sparse_tfidf(path, label, exclude, chunksize)
+    shared = SharedMatrix.create(matrix_path, X, features, labels, **meta)
+    print('Matrix is saved to: {}'.format(matrix_path))
+    return shared
+
+
+def text_stats(path: str, text_field: str, label: str = None, use_cache=True) -> FeatureStats:
+    """
+    Statistics of word counts of a text field in CSV file, cached on disk next to the file.
+    :param path: path of CSV file.
+    :param text_field: text field name.
+    :param label: optional label field name.
+    :param use_cache: whether to use cache file if it is valid.
+    """
+
+    def compute():
+        df = pd.read_csv(path)
+        vectorizer = CountVectorizer()
+        X = vectorizer.fit_transform(df[text_field].to_list())
+        labels = df[label] if label is not None else None
+        return FeatureStats.from_matrix(X, vectorizer.get_feature_names_out(), labels)
+
+    cache_path = os.path.splitext(path)[0] + '__stats-{}.npz'.format(text_field)
+    return _cached_stats(path, cache_path, compute, use_cache, text_field=text_field, label=str(label))
+
+
+def freq_scores(stats: FeatureStats, **kwargs) -> np.ndarray:
+    """
+    Total value of every feature, which is term frequency for count matrix.
+    """
+
+    return stats.term_sum
+
+
+def df_scores(stats: FeatureStats, **kwargs) -> np.ndarray:
+    """
+    # of documents every feature appears in.
+    """
+
+    return stats.doc_freq
+
+
+def chi2_scores(stats: FeatureStats, **kwargs) -> np.ndarray:
+    """
+    Chi-square statistic of every feature, same as sklearn.feature_selection.chi2.
+    """
+
+    observed = stats.class_sum.astype(np.float64)
+    class_prob = stats.class_count / stats.n_docs
+    expected = np.outer(class_prob, stats.term_sum)
+    chisq = observed - expected
+    chisq **= 2
+    with np.errstate(invalid='ignore'):
+        chisq /= expected
+    return chisq.sum(axis=0)
+
+
+def gini_table(stats: FeatureStats, pos_label='pos') -> dict:
+    """
+    Gini index of every feature in the reviews it appears in.
+    :return: dict of arrays gini, posneg, num_pos, num_neg and total, one element per feature.
+    """
+
+    total = stats.doc_freq
+    num_pos = stats.class_df[stats.classes == str(pos_label)].sum(axis=0)  # positive reviews that a word appears
+    num_neg = total - num_pos
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gini = (num_pos / total) ** 2 + (num_neg / total) ** 2
+    posneg = np.where(num_pos > num_neg, 1, np.where(num_neg > num_pos, 0, 2))
+    return {
+        'gini': gini,
+        'posneg': posneg,
+        'num_pos': num_pos,
+        'num_neg': num_neg,
+        'total': total
+    }
+
+
+def gini_scores(stats: FeatureStats, pos_label='pos', **kwargs) -> np.ndarray:
+    return gini_table(stats, pos_label)['gini']
+
+
+RANKERS = {
+    'freq': freq_scores,
+    'df': df_scores,
+    'chi2': chi2_scores,
+    'gini': gini_scores
+}
+
+
+def rank_features(stats: FeatureStats, ranker: str, **kwargs) -> List[Tuple[str, float]]:
+    """
+    Rank features in descending order of score. Features of equal score keep their order in matrix. Features of NaN
+    score, e.g. ones that appear in no document, are ranked last.
+    :param stats: feature statistics.
+    :param ranker: ranker name, one of RANKERS.
+    :return: list of (feature, score).
+    """
+
+    if ranker not in RANKERS:
+        raise ValueError('Unknown ranker: {}'.format(ranker))
+    scores = np.asarray(RANKERS[ranker](stats, **kwargs))
+    keys = scores.astype(np.float64)
+    keys[np.isnan(keys)] = -np.inf
+    order = np.argsort(-keys, kind='mergesort')
+    return list(zip(stats.features[order].tolist(), scores[order].tolist()))
+
+
+def write_ranking(path: str, ranking: List[Tuple[str, float]]):
+    with open(path, 'w') as fp:
+        for feature, score in ranking:
+            fp.write('{}: {}\n'.format(feature, score))
+
+
+if __name__ == '__main__':
+    args = parse_cli()
+    rankers = args.rankers.split(',')
+
+    print('Working directory: {}'.format(args.working_dir))
+    print('Data file: {}'.format(args.data_file))
+    print('Label field: {}'.format(args.label))
+    print('Rankers: {}'.format(rankers))
+
+    stats = tfidf_stats(os.sep.join([args.working_dir, args.data_file]), args.label, use_cache=not args.no_cache)
+    print('{} documents, {} features, classes {}'.format(stats.n_docs, len(stats.features), stats.classes.tolist()))
+
+    for ranker in rankers:
+        filename = os.path.splitext(args.data_file)[0] + '__ranking-{}.txt'.format(ranker)
+        print('Output file: {}'.format(filename))
+        write_ranking(os.sep.join([args.working_dir, filename]),
+                      rank_features(stats, ranker, pos_label=args.pos_label))
+    print('Done!')
@@ -1,7 +1,8 @@
 import os
-import functools
 import enum
+import numpy as np
 import pandas as pd
+from typing import Dict, List
 from utils.logging import get_logger
 
 log = get_logger(__name__)
@@ -73,8 +74,10 @@ def split_dataset(range_definition, store, working_dir, include_index, **kwargs)
         return
     file_name = store + '__curated__.csv'
     df = pd.read_csv(working_dir + os.path.sep + file_name)
-    for range_name, range_values in range_definition.items():
-        _split_range_helper(df, range_name, range_values, store, working_dir, include_index)
+    if kwargs.get('output_format', 'csv') == 'parquet':
+        _split_ranges_parquet(df, range_definition, store, working_dir, include_index)
+    else:
+        _split_ranges(df, range_definition, store, working_dir, include_index)
 
 
 def _check_ranges(range_definition: dict):
@@ -98,41 +101,140 @@ def _check_ranges(range_definition: dict):
     return result
 
 
-def _split_range_helper(dataframe, range_name, range_values, store, working_dir, include_index):
-    results = {}
+def range_bounds(_range: Range) -> tuple:
+    """
+    Bounds of range as (lb, ub, lb is closed, ub is closed).
+    """
+
+    if _range.type is RangeType.CLOSE_CLOSE:
+        return float(_range.lb), float(_range.ub), True, True
+    elif _range.type is RangeType.OPEN_CLOSE:
+        return float(_range.lb), float(_range.ub), False, True
+    elif _range.type is RangeType.CLOSE_OPEN:
+        return float(_range.lb), float(_range.ub), True, False
+    elif _range.type is RangeType.OPEN_OPEN:
+        return float(_range.lb), float(_range.ub), False, False
+    else:
+        raise RangeValueError('Unknown range type: ' + str(_range.type))
+
+
+def assign_bins(values: np.ndarray, bounds: List[tuple]) -> np.ndarray:
+    """
+    Index of the range every value falls in, -1 if it falls in none of them.
+    All bounds are sorted into one array of edges, and every value is located among the edges by two binary
+    searches: value equal to edge i gets code 2i+1, value between edges i-1 and i gets code 2i. Every range covers a
+    contiguous run of codes, so a lookup table maps codes to ranges.
+    :param values: values to assign.
+    :param bounds: (lb, ub, lb is closed, ub is closed) of every range. Ranges must not overlap.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.unique([bound for lb, ub, _, _ in bounds for bound in (lb, ub)])
+    owner = np.full(2 * len(edges) + 1, -1, dtype=np.int64)
+    for i, (lb, ub, lb_closed, ub_closed) in enumerate(bounds):
+        lo = 2 * np.searchsorted(edges, lb) + (1 if lb_closed else 2)
+        hi = 2 * np.searchsorted(edges, ub) + (1 if ub_closed else 0)
+        if np.any(owner[lo:hi + 1] >= 0):
+            raise RangeValueError('Range {} overlaps other ranges.'.format(i))
+        owner[lo:hi + 1] = i
+
+    codes = np.searchsorted(edges, values, side='left') + np.searchsorted(edges, values, side='right')
+    bins = owner[codes]
+    bins[np.isnan(values)] = -1  # NaN falls in no range
+    return bins
+
+
+def write_partitions(dataframe: pd.DataFrame, bins: np.ndarray, outputs: Dict[tuple, List[tuple]],
+                     include_index, chunksize=10000):
+    """
+    Write rows of dataframe to CSV files of their bins in one streaming pass, chunk by chunk.
+    Every file is created with header first, so files of empty bins are written as well.
+    :param dataframe: data to split.
+    :param bins: n_rows x n_dimensions bin index of every row in every dimension.
+    :param outputs: {(dimension, bin): [(file path, columns to write)]}.
+    :param include_index: whether to write index of dataframe.
+    :param chunksize: # of rows written at a time.
+    """
+
+    files = {}
+    try:
+        for targets in outputs.values():
+            for path, columns in targets:
+                files[path] = open(path, 'w', newline='')
+                dataframe.iloc[:0][columns].to_csv(files[path], index=include_index)
+
+        for start in range(0, dataframe.shape[0], chunksize):
+            chunk = dataframe.iloc[start:start + chunksize]
+            for dim in range(bins.shape[1]):
+                chunk_bins = bins[start:start + chunksize, dim]
+                order = np.argsort(chunk_bins, kind='stable')  # rows keep their order within a bin
+                bounds = np.flatnonzero(np.diff(chunk_bins[order])) + 1
+                for rows in np.split(order, bounds):
+                    part = chunk.iloc[rows]
+                    for path, columns in outputs.get((dim, chunk_bins[rows[0]]), []):
+                        part[columns].to_csv(files[path], header=False, index=include_index)
+    finally:
+        for fp in files.values():
+            fp.close()
+
+
+def write_parquet_partitions(dataframe: pd.DataFrame, partitions: Dict[str, np.ndarray], path: str, include_index):
+    """
+    Write dataframe as one Parquet dataset partitioned by the given bin names of every row. Requires pyarrow.
+    :param partitions: {partition column: bin name of every row}, in order of partition directories.
+    """
+
+    dataframe.assign(**partitions).to_parquet(path, partition_cols=list(partitions), index=include_index)
+
+
+def _assign_range_bins(dataframe, range_definition) -> np.ndarray:
+    bins = np.empty((dataframe.shape[0], len(range_definition)), dtype=np.int64)
+    for dim, (range_name, range_values) in enumerate(range_definition.items()):
+        bins[:, dim] = assign_bins(dataframe[range_name].to_numpy(), [range_bounds(x) for x in range_values])
+        num_rows = int(np.count_nonzero(bins[:, dim] >= 0))
+        assert num_rows == dataframe.shape[0], \
+            'Number of rows (={}) in splits is inconsistent with number of rows (={}) ' \
+            'in dataframe.'.format(num_rows, dataframe.shape[0])
+    return bins
+
+
+def _split_ranges(dataframe, range_definition, store, working_dir, include_index):
+    """
+    Split dataframe by all ranges of range_definition in one pass. Every split is written once per score, without
+    the other two scores.
+    """
+
+    bins = _assign_range_bins(dataframe, range_definition)
+    score_names = ['SHOP_AGAIN', 'TO_RECOMMEND', 'SATISFACTION']
     data_name_format = '{lb}_{ub}'
-    values = dataframe[range_name]
-    for _range in range_values:
-        lb, ub = _range.lb, _range.ub
-        name = data_name_format.format(lb=lb, ub=ub)
-        if _range.type is RangeType.CLOSE_CLOSE:  # range is a number
-            data = dataframe[values == lb]
-            results[name] = data
-        elif _range.type is RangeType.OPEN_CLOSE:
-            data = dataframe[(float(lb) < values) & (values <= ub)]
-            results[name] = data
-        elif _range.type is RangeType.CLOSE_OPEN:
-            data = dataframe[(lb <= values) & (values < float(ub))]
-            results[name] = data
-        elif _range.type is RangeType.OPEN_OPEN:
-            data = dataframe[(float(lb) < values) & (values < float(ub))]
-            results[name] = data
-        else:
-            raise RangeValueError('Unknown range type: ' + str(_range.type))
-    num_rows = functools.reduce(lambda x, y: x + y, [v.shape[0] for (k, v) in results.items()])
-    assert num_rows == dataframe.shape[0], \
-        'Number of rows (={}) in splits is inconsistent with number of rows (={}) ' \
-        'in dataframe.'.format(num_rows, dataframe.shape[0])
-    for k, v in results.items():
-        fname = '{}_{}'.format(range_name, k)
-        score_names = ['SHOP_AGAIN', 'TO_RECOMMEND', 'SATISFACTION']
-        file_name = working_dir + os.path.sep + store + '__split__{}__' + fname + '.csv'
-        v1 = v.drop([score_names[1], score_names[2]], axis=1)
-        v1.to_csv(file_name.format(score_names[0]),
-                  index=include_index)
-        v2 = v.drop([score_names[0], score_names[2]], axis=1)
-        v2.to_csv(file_name.format(score_names[1]),
-                  index=include_index)
-        v2 = v.drop([score_names[0], score_names[1]], axis=1)
-        v2.to_csv(file_name.format(score_names[2]),
-                  index=include_index)
+    outputs = {}
+    for dim, (range_name, range_values) in enumerate(range_definition.items()):
+        for i, _range in enumerate(range_values):
+            fname = '{}_{}'.format(range_name, data_name_format.format(lb=_range.lb, ub=_range.ub))
+            file_name = working_dir + os.path.sep + store + '__split__{}__' + fname + '.csv'
+            outputs[(dim, i)] = [(file_name.format(score),
+                                  [x for x in dataframe.columns if x not in score_names or x == score])
+                                 for score in score_names]
+    write_partitions(dataframe, bins, outputs, include_index)
+
+
+def _split_ranges_parquet(dataframe, range_definition, store, working_dir, include_index):
+    """
+    Split dataframe by all ranges of range_definition into one Parquet dataset partitioned by range of every
+    dimension, e.g. VARIANCE__range=-inf_1.0/SKEWNESS__range=0.0_0.0/..., so every row is stored once.
+    Requires pyarrow.
+    """
+
+    bins = _assign_range_bins(dataframe, range_definition)
+    data_name_format = '{lb}_{ub}'
+    partitions = {}
+    for dim, (range_name, range_values) in enumerate(range_definition.items()):
+        names = np.array([data_name_format.format(lb=x.lb, ub=x.ub) for x in range_values], dtype=object)
+        partitions[range_name + '__range'] = names[bins[:, dim]]
+    path = working_dir + os.path.sep + store + '__split__.parquet'
+    write_parquet_partitions(dataframe, partitions, path, include_index)
+    log.info('Splits are written to {}'.format(path))
+
+
+def _split_range_helper(dataframe, range_name, range_values, store, working_dir, include_index):
+    _split_ranges(dataframe, {range_name: range_values}, store, working_dir, include_index)
@@ -1,8 +1,10 @@
 import os
 import argparse
 import csv
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from preprocessing.balance_samples import read_balanced_index
 
 
 def parse_cli():
@@ -12,9 +14,29 @@ def parse_cli():
     parser.add_argument('--token_field', type=str, default='lemmatized', 
                         help='Name of tokenized text column. Default name "lemmatized" will be used if not provided.')
     parser.add_argument('-l', '--label', help='Optional target variable name.')
+    parser.add_argument('-i', '--index_file',
+                        help='Optional row index file written by balance_samples.py. Vocabulary and IDF are fitted on '
+                             'rows of data file gathered by it, but one TFIDF row is still written per row of data '
+                             'file, so rebalanced rows are not copied. Pass the same index file to modeling.py -i.')
     return parser.parse_args()
 
 
+def gathered_tfidf(texts: list, index: np.ndarray):
+    """
+    TFIDF of texts, one row per text, with vocabulary and IDF fitted on texts[index] without copying texts. Gathering
+    the result by index gives the same matrix as TfidfVectorizer on the gathered texts.
+    :return: tuple of (TFIDF matrix, feature names).
+    """
+
+    index = np.asarray(index)
+    if index.shape[0] > 0 and (index.min() < 0 or index.max() >= len(texts)):
+        raise ValueError('Index file has positions out of range of {} rows of data file'.format(len(texts)))
+    vectorizer = CountVectorizer().fit([texts[i] for i in np.unique(index)])
+    counts = vectorizer.transform(texts)
+    tfidf = TfidfTransformer().fit(counts[index]).transform(counts)
+    return tfidf, vectorizer.get_feature_names_out()
+
+
 if __name__ == '__main__':
     args = parse_cli()
     
@@ -22,13 +44,19 @@ if __name__ == '__main__':
     print('Data file: {}'.format(args.data_file))
     print('Token field: {}'.format(args.token_field))
     print('Label: {}'.format(args.label))
+    print('Index file: {}'.format(args.index_file))
 
     df = pd.read_csv(os.sep.join([args.working_dir, args.data_file]))
     print('Dataframe shape={}'.format(df.shape))
-    vectorizer = TfidfVectorizer()
     texts = [''.join(text) for text in df[args.token_field]]
-    tfidf = vectorizer.fit_transform(texts)
-    df_result = pd.DataFrame(data=tfidf.toarray(), columns=vectorizer.get_feature_names())
+    if args.index_file is not None:
+        index = read_balanced_index(os.sep.join([args.working_dir, args.index_file]))
+        tfidf, features = gathered_tfidf(texts, index)
+    else:
+        vectorizer = TfidfVectorizer()
+        tfidf = vectorizer.fit_transform(texts)
+        features = vectorizer.get_feature_names_out()
+    df_result = pd.DataFrame(data=tfidf.toarray(), columns=features)
     if args.label is not None:
         df_result[args.label] = df[args.label]
     print('TFIDF shape={}'.format(df_result.shape))
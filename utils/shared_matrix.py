@@ -0,0 +1,133 @@
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+from typing import List
+
+
+class SharedMatrix(object):
+    """
+    Handle of a matrix saved once as .npy files in a directory, either as CSR components or as a dense array.
+    Pickling a handle pickles only its path, meta and optional row positions, and every process memory-maps the
+    files read-only on first access, so worker processes share one copy of the matrix in page cache instead of
+    receiving their own.
+    """
+
+    _arrays = {'csr': ('data', 'indices', 'indptr'), 'dense': ('array',)}
+
+    def __init__(self, path: str, meta: dict, rows: np.ndarray = None):
+        self.path = path
+        self.meta = meta
+        self.rows = rows
+        self._matrix = None
+        self._labels = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'meta': self.meta, 'rows': self.rows}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['meta'], state['rows'])
+
+    @classmethod
+    def create(cls, path: str, X, columns: List[str] = None, labels=None, **meta):
+        """
+        Save matrix to directory path, replacing any matrix saved there before.
+        :param path: directory of matrix files.
+        :param X: sparse or dense matrix.
+        :param columns: optional column names.
+        :param labels: optional label of every row.
+        :param meta: JSON serializable values that identify how the matrix was built, checked by load().
+        """
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)  # directory is invalid until all arrays are written
+
+        if sp.issparse(X):
+            X = sp.csr_matrix(X)
+            fmt, arrays = 'csr', (X.data, X.indices, X.indptr)
+        else:
+            X = np.asarray(X)
+            fmt, arrays = 'dense', (X,)
+        for name, array in zip(cls._arrays[fmt], arrays):
+            np.save(os.path.join(path, name + '.npy'), array)
+        if labels is not None:
+            labels = np.asarray(labels)
+            np.save(os.path.join(path, 'labels.npy'), labels.astype(str) if labels.dtype == object else labels)
+
+        info = {
+            'format': fmt,
+            'shape': list(X.shape),
+            'columns': list(columns) if columns is not None else None,
+            'has_labels': labels is not None,
+            'meta': meta
+        }
+        with open(meta_path, 'w') as fp:
+            json.dump(info, fp)
+        return cls(path, info)
+
+    @classmethod
+    def load(cls, path: str, **meta):
+        """
+        Open matrix saved by create(). Returns None if it does not exist or was saved with different meta.
+        """
+
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as fp:
+            info = json.load(fp)
+        if any(info['meta'].get(k) != json.loads(json.dumps(v)) for k, v in meta.items()):
+            return None
+        return cls(path, info)
+
+    def select_rows(self, rows: np.ndarray):
+        """
+        Handle of the given rows of this matrix, e.g. rebalanced rows. Rows may repeat. They are gathered only when
+        columns are taken, so a view costs memory of its row positions only.
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        return SharedMatrix(self.path, self.meta, rows if self.rows is None else self.rows[rows])
+
+    @property
+    def shape(self) -> tuple:
+        if self.rows is not None:
+            return self.rows.shape[0], self.meta['shape'][1]
+        return tuple(self.meta['shape'])
+
+    @property
+    def columns(self) -> List[str]:
+        return self.meta['columns']
+
+    @property
+    def matrix(self):
+        """
+        The memory-mapped matrix, a CSR matrix or a read-only NumPy memmap, of all saved rows.
+        """
+
+        if self._matrix is None:
+            fmt = self.meta['format']
+            arrays = [np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r') for name in self._arrays[fmt]]
+            if fmt == 'csr':
+                self._matrix = sp.csr_matrix(tuple(arrays), shape=tuple(self.meta['shape']), copy=False)
+            else:
+                self._matrix = arrays[0]
+        return self._matrix
+
+    @property
+    def labels(self) -> np.ndarray:
+        if self._labels is None and self.meta['has_labels']:
+            self._labels = np.load(os.path.join(self.path, 'labels.npy'), mmap_mode='r')
+        if self._labels is None or self.rows is None:
+            return self._labels
+        return self._labels[self.rows]
+
+    def take_columns(self, col_idx: List[int]):
+        """
+        Copy of the given columns, in the given order, of rows of this handle.
+        """
+
+        X = self.matrix[:, col_idx]
+        return X if self.rows is None else X[self.rows]